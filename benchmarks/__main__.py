@@ -0,0 +1,125 @@
+import argparse
+from datetime import datetime, timezone
+from importlib import metadata
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import subprocess
+from typing import Optional
+
+from benchmarks.suite import BenchmarkSuite
+from src.const.path import CONFIG_FOLDER, ROOT
+
+RESULTS_FOLDER = ROOT.joinpath("benchmarks", "results")
+PACKAGES = ["numpy", "pandas", "scikit-learn", "xgboost", "optuna", "flask"]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": versions,
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(baseline: dict, current: dict, logger: logging.Logger) -> None:
+    """
+    Log the relative change of every measure found in both results.
+    """
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    logger.info(f"Compared to {baseline['commit']}:")
+    for key in sorted(before.keys() & after.keys()):
+        if before[key]:
+            logger.info(f"{key}: {before[key]:.4g} -> {after[key]:.4g} ({after[key] / before[key] - 1:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark training, serving and storage.")
+    parser.add_argument(
+        "-c",
+        "--config_file",
+        type=Path,
+        default="xgb.json",
+        help="Path to the base configuration file. Default is 'xgb.json' in the 'config' folder.",
+    )
+    parser.add_argument(
+        "--scales", type=int, nargs="+", default=[1, 10, 100],
+        help="Sizes of the synthetic catalogues, as multiples of the dataset. Default is 1 10 100.",
+    )
+    parser.add_argument("--trials", type=int, default=10, help="Optuna trials per catalogue, 0 to skip tuning. Default is 10.")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests sent to each route. Default is 2000.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients of the load generator. Default is 8.")
+    parser.add_argument("--interactions", type=int, default=10000, help="Interactions inserted in the database. Default is 10000.")
+    parser.add_argument(
+        "-o", "--output", type=Path, default=None,
+        help="Path of the JSON results. Default is 'benchmarks/results/<commit>.json'.",
+    )
+    parser.add_argument("--baseline", type=Path, default=None, help="Results of an earlier run to compare with.")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler()],
+    )
+    logger = logging.getLogger(__name__)
+
+    suite = BenchmarkSuite(
+        config_file=CONFIG_FOLDER.joinpath(args.config_file),
+        scales=args.scales,
+        trials=args.trials,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        interactions=args.interactions,
+        logger=logger,
+    )
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "parameters": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "results": suite.run(),
+    }
+    output = args.output or RESULTS_FOLDER.joinpath(f"{commit or 'results'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as json_file:
+        json.dump(results, json_file, indent=4)
+    logger.info(f"Results saved to {output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as json_file:
+            compare(json.load(json_file), results, logger)
+
+
+if __name__ == "__main__":
+    main()
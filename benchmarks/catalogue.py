@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Decimals of each numeric column in the source catalogue
+DECIMALS = {"carat": 2, "depth": 1, "table": 1, "price": 0, "x": 2, "y": 2, "z": 2}
+
+
+class CatalogueUtils:
+    @staticmethod
+    def scale(source: Path, factor: int, destination: Path, noise: float = 0.01, random_state: int = 42) -> int:
+        """
+        Write a synthetic catalogue factor times the size of source. Copies past the first
+        have their numeric attributes jittered by noise, so that the cleaning does not drop
+        them as duplicates. Returns the number of rows written.
+        """
+        data = pd.read_csv(source)
+        rng = np.random.default_rng(random_state)
+        copies = [data]
+        for _ in range(factor - 1):
+            copy = data.copy()
+            for column, decimals in DECIMALS.items():
+                jitter = 1 + rng.normal(0, noise, len(copy))
+                copy[column] = (copy[column] * jitter).round(decimals).astype(data[column].dtype)
+            copies.append(copy)
+        catalogue = pd.concat(copies, ignore_index=True)
+        catalogue.to_csv(destination, index=False)
+        return len(catalogue)
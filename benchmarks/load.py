@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+from pathlib import Path
+import time
+from typing import List
+
+import numpy as np
+
+JITTERED_FIELDS = {"carat": 2, "depth": 1, "table": 1, "x": 2, "y": 2, "z": 2}
+
+
+class RequestFileUtils:
+    @staticmethod
+    def parse(path: Path) -> List[dict]:
+        """
+        Read the requests of a request.http file as dicts of method, path and JSON body.
+        """
+        requests = []
+        with open(path) as request_file:
+            blocks = request_file.read().split("###")
+        for block in blocks:
+            # Variable definitions and comments are not requests
+            lines = "\n".join(
+                line for line in block.splitlines() if not line.startswith(("@", "#"))
+            ).strip().splitlines()
+            if not lines:
+                continue
+            method, url = lines[0].split(maxsplit=1)
+            # The body follows the first blank line after the request line and its headers
+            body = None
+            if "" in lines:
+                text = "\n".join(lines[lines.index("") + 1:]).strip()
+                body = json.loads(text) if text else None
+            requests.append({
+                "method": method,
+                "path": url.replace("{{BASE_URL}}", ""),
+                "body": body,
+            })
+        return requests
+
+
+class LoadGenerator:
+    """
+    Closed-loop load on a running server: concurrency clients replay the template
+    requests back to back, each with its numeric fields jittered so that the responses
+    are computed rather than served from the cache.
+    """
+
+    def __init__(self, host: str, port: int, templates: List[dict], concurrency: int, random_state: int = 42) -> None:
+        self.host = host
+        self.port = port
+        self.templates = templates
+        self.concurrency = concurrency
+        self.rng = np.random.default_rng(random_state)
+
+    def _jitter(self, body: dict) -> dict:
+        body = dict(body)
+        for field, decimals in JITTERED_FIELDS.items():
+            if body.get(field) is not None:
+                body[field] = round(body[field] * (1 + self.rng.uniform(-0.1, 0.1)), decimals)
+        return body
+
+    def _client(self, requests: List[dict]) -> List[tuple]:
+        connection = http.client.HTTPConnection(self.host, self.port)
+        results = []
+        for request in requests:
+            body = json.dumps(request["body"])
+            start_time = time.perf_counter()
+            connection.request(
+                request["method"], request["path"], body=body,
+                headers={"Content-Type": "application/json"},
+            )
+            response = connection.getresponse()
+            response.read()
+            results.append((time.perf_counter() - start_time, response.status))
+        connection.close()
+        return results
+
+    def run(self, n_requests: int) -> dict:
+        requests = [
+            dict(template, body=self._jitter(template["body"]))
+            for template in (self.templates[i % len(self.templates)] for i in range(n_requests))
+        ]
+        shares = [requests[i::self.concurrency] for i in range(self.concurrency)]
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            results = [result for share in executor.map(self._client, shares) for result in share]
+        elapsed_time = time.perf_counter() - start_time
+        latencies = np.array([latency for latency, _ in results]) * 1000
+        return {
+            "requests": n_requests,
+            "concurrency": self.concurrency,
+            "errors": sum(status >= 400 for _, status in results),
+            "throughput_rps": n_requests / elapsed_time,
+            "mean_ms": float(latencies.mean()),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p90_ms": float(np.percentile(latencies, 90)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+        }
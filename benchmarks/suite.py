@@ -0,0 +1,241 @@
+import json
+from logging import Logger
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import time
+from typing import List
+
+from werkzeug.serving import make_server
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request, Response
+
+from benchmarks.catalogue import CatalogueUtils
+from benchmarks.load import LoadGenerator, RequestFileUtils
+from src.const.path import CONFIG_FOLDER, DATA_FOLDER, ROOT, TRAIN_FOLDER
+from src.deploy.database import InteractionDatabase
+from src.model.data_preparation import DataPreparation
+from src.model.model_trainer import ModelTrainer
+from src.utils.config import ConfigParser
+from src.utils.time import time_it
+
+BENCHMARK_NAME = "benchmark"
+REQUEST_FILE = ROOT.joinpath("request.http")
+SERVED_ROUTES = ["/predictprice", "/similardiamonds"]
+# Each model type is trained with the data preparation of its own configuration
+MODEL_CONFIGS = {"linear_regression": "default.json", "xgb_regression": "xgb.json"}
+
+
+class BenchmarkSuite:
+    """
+    Time the training, serving and storage paths on synthetic catalogues scaled from
+    the dataset of the base configuration, which is also the one tuned and served. Models are saved under train/benchmark,
+    which is emptied of what the suite created once it is over.
+    """
+
+    def __init__(
+        self,
+        config_file: Path,
+        scales: List[int],
+        trials: int,
+        requests: int,
+        concurrency: int,
+        interactions: int,
+        logger: Logger,
+    ) -> None:
+        self.base = ConfigParser.load(config_file).to_dict()
+        self.scales = scales
+        self.trials = trials
+        self.requests = requests
+        self.concurrency = concurrency
+        self.interactions = interactions
+        self.logger = logger
+        self.timings = {}
+
+    def _write_config(self, folder: Path, name: str, overrides: dict, base: dict = None) -> Path:
+        config = json.loads(json.dumps(self.base if base is None else base))
+        for keys, value in overrides.items():
+            section = config
+            for key in keys[:-1]:
+                section = section[key]
+            # Overrides only replace existing keys, a misspelt one would silently do nothing
+            if keys[-1] not in section:
+                raise KeyError(f"Key {list(keys)} not found in configuration")
+            section[keys[-1]] = value
+        path = folder.joinpath(f"{name}.json")
+        with open(path, "w") as json_file:
+            json.dump(config, json_file, indent=4)
+        return path
+
+    def _timed(self, func, *args, **kwargs) -> float:
+        time_it(self.logger, self.timings)(func)(*args, **kwargs)
+        return self.timings.pop(func.__qualname__)
+
+    def run(self) -> dict:
+        train_folder = TRAIN_FOLDER.joinpath(BENCHMARK_NAME)
+        existing = set(train_folder.iterdir()) if train_folder.exists() else set()
+        results = {}
+        try:
+            with tempfile.TemporaryDirectory() as folder:
+                folder = Path(folder)
+                for factor in self.scales:
+                    self.logger.info(f"Benchmarking the {factor}x catalogue...")
+                    results[f"{factor}x"] = self._run_scale(factor, folder)
+                results["interactions"] = self._run_interactions(folder)
+        finally:
+            if train_folder.exists():
+                # Epoch folders and the registry state saved by the deploy
+                for path in set(train_folder.iterdir()) - existing:
+                    shutil.rmtree(path) if path.is_dir() else path.unlink()
+                if not existing:
+                    train_folder.rmdir()
+        return results
+
+    def _run_scale(self, factor: int, folder: Path) -> dict:
+        source = DATA_FOLDER.joinpath(
+            ConfigParser.get_value(self.base, ["data", "source", "localPath"])
+        )
+        catalogue = folder.joinpath(f"catalogue_{factor}x.csv")
+        results = {"rows": CatalogueUtils.scale(source, factor, catalogue)}
+        # Every run reads and prepares the catalogue, no step is served from a cache
+        overrides = {
+            ("data", "name"): BENCHMARK_NAME,
+            ("data", "source", "getLocal"): True,
+            ("data", "source", "localPath"): str(catalogue),
+            ("data", "cache", "enabled"): False,
+            ("data", "exploration", "scatter_matrix", "enabled"): False,
+            ("data", "exploration", "hist", "enabled"): False,
+            ("data", "exploration", "categorical", "enabled"): False,
+            ("model", "exploration", "gof", "enabled"): False,
+            ("model", "optuna_tuning", "enabled"): False,
+        }
+
+        config_file = self._write_config(folder, f"prepare_{factor}x", overrides)
+        results["data_preparation_s"] = self._timed(
+            DataPreparation(config_file=config_file, logger=self.logger).run
+        )
+
+        results["training_s"] = {}
+        for model_type, model_config in MODEL_CONFIGS.items():
+            config_file = self._write_config(
+                folder, f"{model_type}_{factor}x", overrides,
+                base=ConfigParser.load(CONFIG_FOLDER.joinpath(model_config)).to_dict(),
+            )
+            trainer = ModelTrainer(config_file=config_file, logger=self.logger)
+            trainer.prepare_data()
+            trainer.y_train = trainer.transformation(trainer.y_train)
+            results["training_s"][model_type] = self._timed(trainer._train)
+
+        # The model deployed is the one of the base configuration
+        config_file = self._write_config(folder, f"train_{factor}x", overrides)
+        trainer = ModelTrainer(config_file=config_file, logger=self.logger)
+        trainer.prepare_data()
+        trainer.y_train = trainer.transformation(trainer.y_train)
+        trainer._train()
+        trainer.pred = trainer.inverse_transformation(trainer.pred)
+        trainer._metrics_generation()
+        trainer._save_model()
+        epoch = trainer.model_epoch_folder.name
+
+        if self.trials:
+            config_file = self._write_config(folder, f"tuning_{factor}x", {
+                **overrides,
+                ("model", "optuna_tuning", "enabled"): True,
+                ("model", "optuna_tuning", "nTrials"): self.trials,
+                ("model", "optuna_tuning", "nJobs"): 1,
+                ("model", "optuna_tuning", "timeout"): None,
+                ("model", "optuna_tuning", "storage", "enabled"): False,
+                ("model", "optuna_tuning", "warmStart", "enabled"): False,
+            })
+            trainer = ModelTrainer(config_file=config_file, logger=self.logger)
+            trainer.prepare_data()
+            trainer.y_train = trainer.transformation(trainer.y_train)
+            seconds = self._timed(
+                trainer._tuning,
+                ConfigParser.get_value(self.base, ["model", "type"]),
+                ConfigParser.get_value(self.base, ["model", "parameters"]),
+            )
+            results["optuna"] = {
+                "trials": self.trials,
+                "seconds": seconds,
+                "trials_per_s": self.trials / seconds,
+            }
+
+        config_file = self._write_config(folder, f"deploy_{factor}x", {
+            **overrides,
+            ("deploy", "model_name", "trainOnTheSpot"): False,
+            ("deploy", "model_name", "epoch"): epoch,
+        })
+        results["serving"] = self._run_serving(config_file, folder.joinpath(f"interactions_{factor}x.db"))
+        return results
+
+    def _run_serving(self, config_file: Path, db_path: Path) -> dict:
+        # Imported here, the application module registers its routes on import
+        from src.deploy.app import build_app
+        from src.deploy.model_deploy import ModelDeploy
+
+        results = {
+            "cold_start_s": self._timed(
+                ModelDeploy(config_file=config_file, logger=self.logger).run
+            )
+        }
+        app = build_app(config_file, logger=self.logger, db_path=db_path)
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            templates = RequestFileUtils.parse(REQUEST_FILE)
+            for route in SERVED_ROUTES:
+                generator = LoadGenerator(
+                    "127.0.0.1", server.server_port,
+                    [template for template in templates if template["path"] == route and template["method"] == "POST"],
+                    concurrency=self.concurrency,
+                )
+                results[route] = generator.run(self.requests)
+        finally:
+            server.shutdown()
+            thread.join()
+            app.config["interaction_db"].close()
+        return results
+
+    def _run_interactions(self, folder: Path) -> dict:
+        # Blocking when the queue is full, every interaction is written and timed
+        configuration = json.loads(json.dumps(self.base))
+        configuration["deploy"]["interactions"]["writer"]["policy"] = "block"
+        database = InteractionDatabase.from_configuration(
+            configuration, logger=self.logger, db_path=folder.joinpath("interactions.db")
+        )
+        payload = next(
+            template["body"] for template in RequestFileUtils.parse(REQUEST_FILE)
+            if template["path"] == "/predictprice"
+        )
+        request = Request(EnvironBuilder(method="POST", path="/predictprice", json=payload).get_environ())
+        response = Response(json.dumps({**payload, "prediction": [4737.26]}), mimetype="application/json")
+
+        # Inserts are timed up to the flush of the queue, not just up to the enqueue
+        start_time = time.perf_counter()
+        for _ in range(self.interactions):
+            database.log_interaction(request, response)
+        database.close()
+        insert_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        pages, after_id = 0, 0
+        while True:
+            page = database.get_interactions(after_id=after_id, limit=100, path="/predictprice")
+            pages += 1
+            if len(page) < 100:
+                break
+            after_id = page[-1]["id"]
+        page_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        exported = sum(1 for _ in database.iter_interactions())
+        export_seconds = time.perf_counter() - start_time
+        return {
+            "inserted": self.interactions,
+            "inserts_per_s": self.interactions / insert_seconds,
+            "pages_per_s": pages / page_seconds,
+            "exported_rows_per_s": exported / export_seconds,
+        }
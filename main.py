@@ -1,10 +1,28 @@
 import argparse
 import logging
+import time
 from pathlib import Path
-from src.deploy.app import create_app
-from src.model.model_trainer import ModelTrainer
 from src.const.path import CONFIG_FOLDER
 from src.utils.config import ConfigParser
+from src.utils.resources import ResourceUtils
+
+
+def train(config_file: Path, logger: logging.Logger) -> None:
+    from src.model.model_trainer import ModelTrainer
+
+    model_trainer = ModelTrainer(config_file=config_file, logger=logger)
+    model_trainer.run()
+
+
+def serve(config_file: Path, logger: logging.Logger) -> None:
+    start_time = time.perf_counter()
+    from src.deploy.app import create_app
+
+    logger.info(
+        f"Serving modules imported in {time.perf_counter() - start_time:.3f} seconds, "
+        f"peak RSS {ResourceUtils.peak_rss_mb():.1f} MB"
+    )
+    create_app(config_file=config_file, logger=logger)
 
 
 def main():
@@ -16,6 +34,12 @@ def main():
         default="default.json",
         help="Path to the configuration file. Default is 'default.json' in the 'config' folder.",
     )
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["train", "serve"],
+        help="Only train the model or only serve the API. By default the model is trained, unless it is trained on the spot, and then served.",
+    )
     args = parser.parse_args()
 
     logging.basicConfig(
@@ -26,17 +50,20 @@ def main():
     logger = logging.getLogger(__name__)
     logger.info(args.config_file)
     config_file = CONFIG_FOLDER.joinpath(args.config_file)
-    configuration = ConfigParser.retrieve_config(config_file)
-
-    if not (ConfigParser.get_value(
-        configuration, ["deploy", "enabled"]
-    ) and ConfigParser.get_value(
-        configuration, ["deploy", "model_name", "trainOnTheSpot"]
-    )):
-        model_trainer = ModelTrainer(config_file=config_file, logger=logger)
-        model_trainer.run()
+    configuration = ConfigParser.load(config_file)
 
-    create_app(config_file=config_file, logger=logger, debug=True)
+    if args.command == "train":
+        train(config_file=config_file, logger=logger)
+    elif args.command == "serve":
+        serve(config_file=config_file, logger=logger)
+    else:
+        if not (ConfigParser.get_value(
+            configuration, ["deploy", "enabled"]
+        ) and ConfigParser.get_value(
+            configuration, ["deploy", "model_name", "trainOnTheSpot"]
+        )):
+            train(config_file=config_file, logger=logger)
+        serve(config_file=config_file, logger=logger)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,15 @@
-from sklearn.linear_model import LinearRegression
-import xgboost
-
-
 class ModelFactory:
     @staticmethod
-    def create_model(model_type, **kwargs):
+    def create_model(model_type, native_api=False, **kwargs):
+        # Model libraries are imported only for the model type in use
         if model_type == "linear_regression":
+            from sklearn.linear_model import LinearRegression
             return LinearRegression(**kwargs)
         elif model_type == "xgb_regression":
+            if native_api:
+                from src.utils.xgboost_utils import BoosterRegressor
+                return BoosterRegressor(**kwargs)
+            import xgboost
             return xgboost.XGBRegressor(**kwargs, enable_categorical=True)
         else:
             raise ValueError(f"Unknown model type: {model_type}")
@@ -3,7 +3,9 @@ from pathlib import Path
 ROOT = Path(__file__).resolve().parents[2]
 CONFIG_FOLDER = ROOT.joinpath("config")
 DATA_FOLDER = ROOT.joinpath("data")
+CACHE_FOLDER = ROOT.joinpath("cache")
 SRC_FOLDER = ROOT.joinpath("src")
 TRAIN_FOLDER = ROOT.joinpath("train")
 MODEL_FOLDER = SRC_FOLDER.joinpath("model")
 DB_PATH = ROOT.joinpath("interactions.db")
+DB_ARCHIVE_FOLDER = ROOT.joinpath("interactions_archive")
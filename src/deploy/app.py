@@ -1,17 +1,34 @@
 # app.py
+import functools
+import hmac
+import json
 from logging import Logger
+import os
+import time
 from pathlib import Path
-from flask import Flask, g, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from pydantic import ValidationError
 
 from src.const.path import DB_PATH
 from src.deploy.database import InteractionDatabase
+from src.deploy.metrics import NULL_TIMER, RequestMetrics, StageTimer
 from src.deploy.model_deploy import ModelDeploy
-from src.utils.request_body import PredictPricePayload, SimilarDiamondsPayload
+from src.utils.config import ConfigParser
+from src.utils.resources import ResourceUtils
+from src.utils.request_body import (
+    ActivateModelPayload,
+    CandidateModelPayload,
+    InteractionsQuery,
+    PredictPriceBatchPayload,
+    PredictPricePayload,
+    SimilarDiamondsPayload,
+)
 
 
+INTERACTIONS_PAGE_SIZE = 100
+INTERACTIONS_MAX_PAGE_SIZE = 1000
+
 app = Flask(__name__)
-interaction_db = InteractionDatabase(db_path=DB_PATH)
 
 
 @app.route('/health', methods=['GET'])
@@ -23,45 +40,210 @@ def home():
 def predict_price():
     try:
         payload = request.get_json()
-        validated_payload = PredictPricePayload(**payload)
-        result = g.model_deployer.predict_price(validated_payload.dict())
+        with g.timer.stage("validation"):
+            validated_payload = PredictPricePayload(**payload)
+        result = g.model_deployer.predict_price(
+            validated_payload.dict(), timer=g.timer, deadline=g.deadline
+        )
     except ValidationError as e:
         return jsonify({"error": e.errors()}), 400
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    return jsonify(result)
+    with g.timer.stage("serialization"):
+        return jsonify(result)
+
+
+@app.route('/predictprice/batch', methods=['POST'])
+def predict_price_batch():
+    try:
+        payload = request.get_json()
+        with g.timer.stage("validation"):
+            validated_payload = PredictPriceBatchPayload.model_validate(
+                payload, context={"max_batch_size": app.config['max_batch_size']}
+            )
+        result = g.model_deployer.predict_price_batch(
+            [diamond.dict() for diamond in validated_payload.diamonds], timer=g.timer
+        )
+    except ValidationError as e:
+        # The input of an oversized batch is not echoed back
+        return jsonify({"error": e.errors(include_input=False)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    with g.timer.stage("serialization"):
+        return jsonify(result)
 
 
 @app.route('/similardiamonds', methods=['POST'])
 def similar_diamonds():
     try:
         payload = request.get_json()
-        validated_payload = SimilarDiamondsPayload(**payload)
-        result = g.model_deployer.similar_diamonds(validated_payload.dict())
+        with g.timer.stage("validation"):
+            validated_payload = SimilarDiamondsPayload(**payload)
+        result = g.model_deployer.similar_diamonds(validated_payload.dict(), timer=g.timer)
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    with g.timer.stage("serialization"):
+        return jsonify(result)
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    result = g.model_deployer.stats()
+    metrics = app.config['metrics']
+    result["slow_requests"] = None if metrics is None else metrics.slow_requests()
+    return jsonify(result)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    if app.config['metrics'] is None:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(app.config['metrics'].render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/models', methods=['GET'])
+def models():
+    return jsonify(g.model_deployer.models())
+
+
+def admin_required(route):
+    """
+    Restrict a route to the requests bearing the admin token, and disable it when no token is set.
+    """
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        token = app.config['admin_token']
+        if not token:
+            return jsonify({"error": "Model administration is disabled, no admin token is set"}), 403
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+            return jsonify({"error": "Invalid admin token"}), 401
+        return route(*args, **kwargs)
+    return wrapper
+
+
+@app.route('/models/active', methods=['POST'])
+@admin_required
+def activate_model():
+    try:
+        payload = request.get_json()
+        validated_payload = ActivateModelPayload(**payload)
+        result = g.model_deployer.activate_model(validated_payload.dict())
     except ValidationError as e:
         return jsonify({"error": e.errors()}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     return jsonify(result)
 
+
+@app.route('/models/candidate', methods=['POST'])
+@admin_required
+def route_candidate():
+    try:
+        payload = request.get_json()
+        validated_payload = CandidateModelPayload(**payload)
+        result = g.model_deployer.route_candidate(validated_payload.dict())
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(result)
+
+
 @app.route('/interactions', methods=['GET'])
 def get_interactions():
-    interactions = interaction_db.get_interactions()
-    return jsonify(interactions)
+    try:
+        query = InteractionsQuery(**request.args.to_dict()).dict()
+    except ValidationError as e:
+        return jsonify({"error": e.errors()}), 400
+    if query.pop("format") == "ndjson":
+        interactions = g.interaction_db.iter_interactions(**query)
+        return Response(
+            stream_with_context(json.dumps(interaction) + "\n" for interaction in interactions),
+            mimetype="application/x-ndjson",
+        )
+    query["limit"] = min(query["limit"] or INTERACTIONS_PAGE_SIZE, INTERACTIONS_MAX_PAGE_SIZE)
+    interactions = g.interaction_db.get_interactions(**query)
+    next_after_id = interactions[-1]["id"] if len(interactions) == query["limit"] else None
+    return jsonify({"interactions": interactions, "next_after_id": next_after_id})
+
+
+@app.before_request
+def before_request():
+    g.model_deployer = app.config['model_deployer']
+    g.interaction_db = app.config['interaction_db']
+    g.timer = NULL_TIMER if app.config['metrics'] is None else StageTimer()
+    g.start_time = time.perf_counter()
+    timeout = app.config['request_timeout']
+    g.deadline = None if timeout is None else time.monotonic() + timeout
+
+
+@app.after_request
+def log_request_response(response):
+    with g.timer.stage("log_interaction"):
+        g.interaction_db.log_interaction(request, response)
+    if app.config['metrics'] is not None:
+        # Unmatched paths share one label, so that scanners can't grow the metrics
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        app.config['metrics'].observe(
+            request.method, route, response.status_code,
+            time.perf_counter() - g.start_time, g.timer.stages,
+        )
+    return response
 
 
-def create_app(config_file: Path, logger: Logger, host='127.0.0.1', port=5000, debug=True):
+def build_app(config_file: Path, logger: Logger, db_path: Path = DB_PATH) -> Flask:
+    """
+    Deploy the model and attach it to the application, without serving it.
+    """
     model_deployer = ModelDeploy(config_file=config_file, logger=logger)
     model_deployer.run()
     app.config['model_deployer'] = model_deployer
+    app.config['interaction_db'] = InteractionDatabase.from_configuration(
+        model_deployer.configuration, logger=logger, db_path=db_path
+    )
+    # The token is a secret, the configuration only names the environment variable holding it
+    app.config['admin_token'] = os.environ.get(
+        ConfigParser.get_value(model_deployer.configuration, ["deploy", "registry", "adminTokenEnv"])
+    )
+    app.config['request_timeout'] = ConfigParser.get_value(
+        model_deployer.configuration, ["deploy", "server", "requestTimeout"]
+    )
+    app.config['max_batch_size'] = ConfigParser.get_value(
+        model_deployer.configuration, ["deploy", "batch", "maxSize"]
+    )
+    app.config['metrics'] = RequestMetrics.from_configuration(
+        model_deployer.configuration, logger=logger
+    )
+    if app.config['metrics'] is not None:
+        for name in ["cache", "coalescer"]:
+            component = getattr(model_deployer, name)
+            if component is not None:
+                app.config['metrics'].add_component(name, component.stats)
+    logger.info(f"Model deployed, peak RSS {ResourceUtils.peak_rss_mb():.1f} MB")
+    return app
 
-    @app.before_request
-    def before_request():
-        g.model_deployer = app.config['model_deployer']
 
-    @app.after_request
-    def log_request_response(response):
-        interaction_db.log_interaction(request, response)
-        return response
+def create_app(config_file: Path, logger: Logger):
+    build_app(config_file, logger)
+    configuration = app.config['model_deployer'].configuration
+    if ConfigParser.get_value(configuration, ["deploy", "server", "mode"]) == "production":
+        from src.deploy.server import ProductionServer
 
-    app.run(host=host, port=port, debug=debug, use_reloader=False)
+        ProductionServer(app, configuration=configuration).run()
+    else:
+        app.run(
+            host=ConfigParser.get_value(configuration, ["deploy", "server", "host"]),
+            port=ConfigParser.get_value(configuration, ["deploy", "server", "port"]),
+            debug=ConfigParser.get_value(configuration, ["deploy", "server", "debug"]),
+            use_reloader=False,
+        )
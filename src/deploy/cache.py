@@ -0,0 +1,68 @@
+from collections import OrderedDict
+import json
+import time
+from typing import Any, Callable, Hashable, Tuple
+
+from src.utils.fork import ForkSafeLock, ForkUtils
+
+
+class PredictionCache:
+    """
+    Bounded in-process cache of responses, evicting the least recently used entry when
+    full and dropping entries older than ttl seconds. Keys hold the route, the model
+    epoch and the canonical payload, so that a new model never serves stale results.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = ForkSafeLock()
+        self._reset()
+        # A forked worker starts from an empty cache with fresh counters
+        ForkUtils.after_fork_in_child(self._reset)
+
+    def _reset(self) -> None:
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(route: str, epoch: str, payload: dict) -> Tuple[str, str, str]:
+        return route, epoch, json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Computed outside of the lock, concurrent misses on the same key may both compute it
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
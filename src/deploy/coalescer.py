@@ -0,0 +1,129 @@
+from concurrent.futures import Future
+from logging import Logger
+import queue
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from src.utils.fork import ForkSafeLock, ForkUtils
+
+
+class PredictionCoalescer:
+    """
+    Gather concurrent single-diamond predictions into batches. The first request of a
+    batch waits at most max_wait seconds for others to join, up to max_batch_size of
+    them, then the requests of each model go through one vectorized predict call and
+    every caller gets back its own row.
+    """
+
+    def __init__(self, max_wait: float, max_batch_size: int, logger: Logger) -> None:
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.logger = logger
+        self._lock = ForkSafeLock()
+        self._reset()
+        # A forked worker inherits the batcher of its parent, but not its thread
+        ForkUtils.after_fork_in_child(self._reset)
+
+    def _reset(self) -> None:
+        self._queue: "queue.Queue[Tuple[dict, Any, Future, float]]" = queue.Queue()
+        self._batcher = None
+        self._batches = 0
+        self._requests = 0
+        self._largest_batch = 0
+        self._total_wait = 0.0
+        self._longest_wait = 0.0
+        self._timeouts = 0
+
+    def _ensure_batcher(self) -> None:
+        if self._batcher is not None:
+            return
+        with self._lock:
+            if self._batcher is None:
+                self._batcher = threading.Thread(
+                    target=self._run_batcher, name="prediction-coalescer", daemon=True
+                )
+                self._batcher.start()
+
+    def predict(self, payload: dict, model: Any, deadline: Optional[float] = None) -> np.ndarray:
+        """
+        Predict the price of a single diamond with model, returned as a one-row slice of the batch.
+        Raise TimeoutError when the prediction is not back by the time.monotonic() deadline,
+        the request is then dropped from its batch unless it is already being predicted.
+        """
+        self._ensure_batcher()
+        future = Future()
+        self._queue.put((payload, model, future, time.monotonic()))
+        try:
+            return future.result(
+                timeout=None if deadline is None else max(deadline - time.monotonic(), 0)
+            )
+        except TimeoutError:
+            future.cancel()
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError("Prediction deadline exceeded") from None
+
+    def _run_batcher(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][3] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # Requests already queued join the batch even once its wait is over
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout <= 0:
+                        batch.append(self._queue.get_nowait())
+                    else:
+                        batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            started = time.monotonic()
+            # Requests routed to different models, as during a rollout, are predicted apart
+            groups = {}
+            for request in batch:
+                groups.setdefault(id(request[1]), []).append(request)
+            for group in groups.values():
+                self._predict_group(group)
+            self._record(batch, started)
+
+    def _predict_group(self, group: list) -> None:
+        # Requests whose caller gave up are left out
+        group = [request for request in group if request[2].set_running_or_notify_cancel()]
+        if not group:
+            return
+        model = group[0][1]
+        payloads = [payload for payload, _, _, _ in group]
+        try:
+            predictions = model.predict(payloads)
+        except Exception as e:
+            for _, _, future, _ in group:
+                future.set_exception(e)
+        else:
+            for i, (_, _, future, _) in enumerate(group):
+                future.set_result(predictions[i:i + 1])
+
+    def _record(self, batch: list, started: float) -> None:
+        waits = [started - enqueued for _, _, _, enqueued in batch]
+        with self._lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._largest_batch = max(self._largest_batch, len(batch))
+            self._total_wait += sum(waits)
+            self._longest_wait = max(self._longest_wait, max(waits))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "requests": self._requests,
+                "mean_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "max_batch_size": self._largest_batch,
+                "mean_wait_ms": 1000 * self._total_wait / self._requests if self._requests else 0.0,
+                "total_wait_ms": 1000 * self._total_wait,
+                "max_wait_ms": 1000 * self._longest_wait,
+                "timeouts": self._timeouts,
+            }
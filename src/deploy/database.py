@@ -1,74 +1,413 @@
+import atexit
 import json
+import logging
+import math
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-from src.const.path import DB_PATH
+from src.const.path import DB_ARCHIVE_FOLDER, DB_PATH
+from src.utils.config import ConfigParser
+from src.utils.fork import ForkSafeLock, ForkUtils
+
+_STOP = object()
+
+# Columns of the interactions table, besides its id. The first ones are those of the
+# original table, the others are added to existing databases when missing
+COLUMNS = {
+    "timestamp": "TEXT NOT NULL",
+    "request_method": "TEXT NOT NULL",
+    "request_path": "TEXT NOT NULL",
+    "request_headers": "TEXT",
+    "request_body": "TEXT",
+    "response_status": "INTEGER",
+    "response_headers": "TEXT",
+    "response_body": "TEXT",
+}
+ADDED_COLUMNS = {"body_encoding": "TEXT"}
+
+# Payload fields copied to their own columns so that they can be queried
+EXTRACTED_COLUMNS = {
+    "carat": "REAL",
+    "cut": "TEXT",
+    "color": "TEXT",
+    "clarity": "TEXT",
+    "prediction": "REAL",
+}
 
 
 class InteractionDatabase:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(
+        self,
+        db_path=DB_PATH,
+        asynchronous: bool = False,
+        queue_size: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        policy: str = "drop",
+        compact: bool = False,
+        compression: Optional[str] = None,
+        header_allowlist: Optional[List[str]] = None,
+        retention: Optional[dict] = None,
+        archive_folder=DB_ARCHIVE_FOLDER,
+        logger: logging.Logger = logging.getLogger(__name__),
+    ):
+        if policy not in ("drop", "block"):
+            raise ValueError(f"Unknown interaction logging policy: {policy}")
+        if compression not in (None, "zlib", "zstd"):
+            raise ValueError(f"Unknown interaction body compression: {compression}")
         self.db_path = db_path
+        self.asynchronous = asynchronous
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.compression = compression
+        self.header_allowlist = (
+            None if header_allowlist is None else {header.lower() for header in header_allowlist}
+        )
+        self.retention = retention if retention and retention["enabled"] else None
+        self.archive_folder = archive_folder
+        self.logger = logger
+        self.dropped = 0
+        self._json_options = {"separators": (",", ":")} if compact else {"indent": 4}
+        self._compress, _ = self._codecs(compression)
+        self._last_retention = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._writer_lock = ForkSafeLock()
+        # A forked worker inherits the writer of its parent, but not its thread
+        ForkUtils.after_fork_in_child(self._reset_writer)
         self._create_table()
+        if self.asynchronous:
+            atexit.register(self.close)
+
+    @classmethod
+    def from_configuration(cls, configuration: dict, logger: logging.Logger, db_path=DB_PATH) -> "InteractionDatabase":
+        writer = ConfigParser.get_value(configuration, ["deploy", "interactions", "writer"])
+        storage = ConfigParser.get_value(configuration, ["deploy", "interactions", "storage"])
+        return cls(
+            db_path=db_path,
+            asynchronous=writer["asynchronous"],
+            queue_size=writer["queueSize"],
+            batch_size=writer["batchSize"],
+            flush_interval=writer["flushInterval"],
+            policy=writer["policy"],
+            compact=storage["compact"],
+            compression=storage["compression"],
+            header_allowlist=storage["headerAllowlist"],
+            retention=storage["retention"],
+            logger=logger,
+        )
+
+    @staticmethod
+    def _codecs(compression: Optional[str]) -> tuple:
+        if compression == "zlib":
+            return zlib.compress, zlib.decompress
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError("zstd compression requires the 'zstandard' package") from e
+            return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+        return None, None
 
     def _create_table(self):
         with sqlite3.connect(self.db_path) as conn:
+            if self.retention is not None and conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                # Switching an existing database to incremental vacuum requires a full VACUUM, once
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA journal_mode=WAL")
             cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS interactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    request_method TEXT NOT NULL,
-                    request_path TEXT NOT NULL,
-                    request_headers TEXT,
-                    request_body TEXT,
-                    response_status INTEGER,
-                    response_headers TEXT,
-                    response_body TEXT
-                )
-            """)
+            self._create_schema(cursor, "main")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_interactions_timestamp ON interactions (timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_interactions_path ON interactions (request_path, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_interactions_status ON interactions (response_status, id)")
             conn.commit()
 
+    @staticmethod
+    def _create_schema(cursor: sqlite3.Cursor, schema: str):
+        """
+        Create the interactions table of the given database, or add the columns it lacks.
+        """
+        columns = ", ".join(f"{column} {column_type}" for column, column_type in COLUMNS.items())
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {schema}.interactions (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns})"
+        )
+        existing = {row[1] for row in cursor.execute(f"PRAGMA {schema}.table_info(interactions)")}
+        for column, column_type in {**ADDED_COLUMNS, **EXTRACTED_COLUMNS}.items():
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {schema}.interactions ADD COLUMN {column} {column_type}")
+
     def log_interaction(self, request, response):
-        timestamp = datetime.utcnow().isoformat()
-        request_method = request.method
-        request_path = request.path
-        request_headers = json.dumps(dict(request.headers), indent=4)
+        # Only cheap attribute reads happen here, serialization is left to _serialize
+        record = (
+            datetime.utcnow().isoformat(),
+            request.method,
+            request.path,
+            dict(request.headers),
+            request.is_json,
+            request.get_data(as_text=True),
+            response.status_code,
+            dict(response.headers),
+            response.is_json,
+            # Streamed responses are not buffered just to be logged
+            None if response.is_streamed else response.get_data(as_text=True),
+        )
+        if not self.asynchronous:
+            with sqlite3.connect(self.db_path) as conn:
+                self._write(conn, [record])
+                self._maybe_apply_retention(conn)
+            return
+        self._ensure_writer()
+        if self.policy == "block":
+            self._queue.put(record)
+            return
         try:
-            request_body = json.dumps(request.get_json(), indent=4)
-        except Exception:
-            request_body = request.get_data(as_text=True)
-        response_status = response.status_code
-        response_headers = json.dumps(dict(response.headers), indent=4)
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                self.logger.warning(f"Interaction queue full, {self.dropped} interactions dropped so far")
+
+    @staticmethod
+    def _parse_body(is_json: bool, body: Optional[str]) -> tuple:
+        if is_json and body is not None:
+            try:
+                return json.loads(body), True
+            except ValueError:
+                pass
+        return body, False
+
+    def _encode_body(self, body, parsed: bool):
+        if parsed:
+            body = json.dumps(body, **self._json_options)
+        if self._compress is not None and body is not None:
+            return self._compress(body.encode())
+        return body
+
+    def _encode_headers(self, headers: dict) -> str:
+        if self.header_allowlist is not None:
+            headers = {name: value for name, value in headers.items() if name.lower() in self.header_allowlist}
+        return json.dumps(headers, **self._json_options)
+
+    @staticmethod
+    def _extract(request_body, response_body) -> list:
+        values = dict.fromkeys(EXTRACTED_COLUMNS)
+        if isinstance(request_body, dict):
+            for column in ("carat", "cut", "color", "clarity"):
+                values[column] = request_body.get(column)
+        if isinstance(response_body, dict):
+            prediction = response_body.get("prediction")
+            while isinstance(prediction, list) and len(prediction) == 1:
+                prediction = prediction[0]
+            if isinstance(prediction, (int, float)):
+                values["prediction"] = prediction
+        return list(values.values())
+
+    def _serialize(self, record: tuple) -> tuple:
+        (timestamp, request_method, request_path, request_headers, request_is_json, request_body,
+         response_status, response_headers, response_is_json, response_body) = record
+        request_body, request_parsed = self._parse_body(request_is_json, request_body)
+        response_body, response_parsed = self._parse_body(response_is_json, response_body)
+        return (
+            timestamp,
+            request_method,
+            request_path,
+            self._encode_headers(request_headers),
+            self._encode_body(request_body, request_parsed),
+            response_status,
+            self._encode_headers(response_headers),
+            self._encode_body(response_body, response_parsed),
+            self.compression,
+            *self._extract(request_body, response_body),
+        )
+
+    def _write(self, conn: sqlite3.Connection, records: list):
+        conn.executemany(f"""
+            INSERT INTO interactions (
+                timestamp, request_method, request_path, request_headers,
+                request_body, response_status, response_headers, response_body,
+                body_encoding, {', '.join(EXTRACTED_COLUMNS)}
+            ) VALUES ({', '.join('?' * (9 + len(EXTRACTED_COLUMNS)))})
+        """, [self._serialize(record) for record in records])
+        conn.commit()
+
+    def _maybe_apply_retention(self, conn: sqlite3.Connection):
+        if self.retention is None:
+            return
+        now = time.monotonic()
+        if self._last_retention is not None and now - self._last_retention < self.retention["checkInterval"]:
+            return
+        self._last_retention = now
         try:
-            response_body = json.dumps(response.get_json(), indent=4)
-        except Exception:
-            response_body = response.get_data(as_text=True)
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO interactions (
-                    timestamp, request_method, request_path, request_headers,
-                    request_body, response_status, response_headers, response_body
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (timestamp, request_method, request_path, request_headers, request_body,
-                  response_status, response_headers, response_body))
+            self.apply_retention(conn)
+        except sqlite3.Error as e:
+            self.logger.error(f"Failed to apply interactions retention. Got error: {e}")
+
+    def apply_retention(self, conn: sqlite3.Connection):
+        """
+        Move the interactions older than maxAgeDays, or the oldest ones when the database
+        is larger than maxSizeMb, to a dated archive database, then reclaim the free pages.
+        """
+        last_id = None
+        if self.retention["maxAgeDays"] is not None:
+            cutoff = (datetime.utcnow() - timedelta(days=self.retention["maxAgeDays"])).isoformat()
+            last_id = conn.execute(
+                "SELECT MAX(id) FROM interactions WHERE timestamp < ?", (cutoff,)
+            ).fetchone()[0]
+        if self.retention["maxSizeMb"] is not None:
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            size = (page_count - free_pages) * page_size
+            max_size = self.retention["maxSizeMb"] * 1024 * 1024
+            if size > max_size:
+                # Archive enough of the oldest rows to get back to 80% of the maximum size
+                count = conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+                to_move = max(math.ceil(count * (1 - 0.8 * max_size / size)), 1)
+                size_last_id = conn.execute(
+                    "SELECT id FROM interactions ORDER BY id LIMIT 1 OFFSET ?", (min(to_move, count) - 1,)
+                ).fetchone()[0]
+                last_id = max(last_id or 0, size_last_id)
+        if last_id is None:
+            return
+        self.archive_folder.mkdir(parents=True, exist_ok=True)
+        archive_path = self.archive_folder.joinpath(f"interactions_{datetime.utcnow():%Y%m%d}.db")
+        conn.execute("ATTACH DATABASE ? AS archive", (str(archive_path),))
+        try:
+            # Columns are named, so that archives created by an older schema still line up
+            self._create_schema(conn.cursor(), "archive")
+            columns = ", ".join(["id", *COLUMNS, *ADDED_COLUMNS, *EXTRACTED_COLUMNS])
+            conn.execute(
+                f"INSERT INTO archive.interactions ({columns}) SELECT {columns} FROM main.interactions WHERE id <= ?",
+                (last_id,),
+            )
+            moved = conn.execute("DELETE FROM main.interactions WHERE id <= ?", (last_id,)).rowcount
             conn.commit()
+        finally:
+            conn.execute("DETACH DATABASE archive")
+        # The pragma frees one page per step, executescript runs it to completion
+        conn.executescript("PRAGMA incremental_vacuum;")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.logger.info(f"Archived {moved} interactions to {archive_path}")
+
+    def _reset_writer(self):
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._writer = None
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run_writer, name="interaction-writer", daemon=True
+                )
+                self._writer.start()
+
+    def _run_writer(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stopping = False
+        while not stopping:
+            self._maybe_apply_retention(conn)
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Group-commit whatever arrives within flush_interval, up to batch_size
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if any(record is _STOP for record in batch):
+                batch = [record for record in batch if record is not _STOP]
+                stopping = True
+            if batch:
+                try:
+                    self._write(conn, batch)
+                except sqlite3.Error as e:
+                    self.logger.error(f"Failed to write {len(batch)} interactions. Got error: {e}")
+        conn.close()
+
+    def close(self):
+        """
+        Flush every queued interaction and stop the background writer.
+        """
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(_STOP)
+            writer.join()
 
-    def get_interactions(self):
+    def _query(self, after_id=0, limit=None, since=None, until=None, path=None, status=None):
+        # Keyset pagination on the primary key, every filter is backed by an index
+        conditions, parameters = ["id > ?"], [after_id]
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            parameters.append(until)
+        if path is not None:
+            conditions.append("request_path = ?")
+            parameters.append(path)
+        if status is not None:
+            conditions.append("response_status = ?")
+            parameters.append(status)
+        query = f"SELECT * FROM interactions WHERE {' AND '.join(conditions)} ORDER BY id"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        return query, parameters
+
+    def _decode(self, columns, row):
+        interaction = dict(zip(columns, row))
+        body_encoding = interaction.pop("body_encoding", None)
+        if body_encoding is not None:
+            _, decompress = self._codecs(body_encoding)
+            for column in ("request_body", "response_body"):
+                if interaction[column] is not None:
+                    interaction[column] = decompress(interaction[column]).decode()
+        try:
+            interaction["request_headers"] = json.loads(interaction["request_headers"])
+            interaction["request_body"] = json.loads(interaction["request_body"])
+            interaction["response_headers"] = json.loads(interaction["response_headers"])
+            interaction["response_body"] = json.loads(interaction["response_body"])
+        except (json.JSONDecodeError, TypeError):
+            pass
+        return interaction
+
+    def get_interactions(self, after_id=0, limit=100, since=None, until=None, path=None, status=None):
+        query, parameters = self._query(after_id, limit, since, until, path, status)
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM interactions")
+            cursor.execute(query, parameters)
             rows = cursor.fetchall()
             columns = [column[0] for column in cursor.description]
-        interactions = []
-        for row in rows:
-            interaction = dict(zip(columns, row))
-            try:
-                interaction["request_headers"] = json.loads(interaction["request_headers"])
-                interaction["request_body"] = json.loads(interaction["request_body"])
-                interaction["response_headers"] = json.loads(interaction["response_headers"])
-                interaction["response_body"] = json.loads(interaction["response_body"])
-            except json.JSONDecodeError:
-                pass
-            interactions.append(interaction)
-        return interactions
+        return [self._decode(columns, row) for row in rows]
+
+    def iter_interactions(self, after_id=0, limit=None, since=None, until=None, path=None, status=None, chunk_size=500):
+        """
+        Yield the matching interactions one by one, reading chunk_size rows at a time.
+        """
+        query, parameters = self._query(after_id, limit, since, until, path, status)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(query, parameters)
+            columns = [column[0] for column in cursor.description]
+            while rows := cursor.fetchmany(chunk_size):
+                for row in rows:
+                    yield self._decode(columns, row)
+        finally:
+            conn.close()
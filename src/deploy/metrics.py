@@ -0,0 +1,359 @@
+import atexit
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+import json
+from logging import Logger
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from src.utils.config import ConfigParser
+from src.utils.files import FileUtils
+from src.utils.fork import ForkSafeLock, ForkUtils
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+METRIC_PREFIX = "diamonds_api"
+# Statistics of the serving components exported with the request metrics, as the key in
+# their stats, the metric name, its kind, its scale to base units and its help. Counters
+# are summed over every worker that ever ran, gauges over the live ones only and maxima
+# are the largest of all
+COMPONENT_METRICS = {
+    "cache": [
+        ("size", "cache_entries", "gauge", 1, "Responses held in the cache."),
+        ("hits", "cache_hits_total", "counter", 1, "Responses served from the cache."),
+        ("misses", "cache_misses_total", "counter", 1, "Responses computed because they were not cached."),
+        ("evictions", "cache_evictions_total", "counter", 1, "Least recently used responses evicted from the full cache."),
+        ("expirations", "cache_expirations_total", "counter", 1, "Cached responses dropped once older than the TTL."),
+    ],
+    "coalescer": [
+        ("queue_depth", "coalescer_queue_depth", "gauge", 1, "Predictions waiting for their batch."),
+        ("batches", "coalescer_batches_total", "counter", 1, "Batches of coalesced predictions."),
+        ("requests", "coalescer_requests_total", "counter", 1, "Predictions served in a batch."),
+        ("total_wait_ms", "coalescer_wait_seconds_total", "counter", 0.001, "Time predictions waited for their batch."),
+        ("timeouts", "coalescer_timeouts_total", "counter", 1, "Predictions that passed their deadline waiting."),
+        ("max_batch_size", "coalescer_max_batch_size", "max", 1, "Largest batch of coalesced predictions."),
+        ("max_wait_ms", "coalescer_max_wait_seconds", "max", 0.001, "Longest time a prediction waited for its batch."),
+    ],
+}
+
+
+class StageTimer:
+    """
+    Time spent by a request in each stage of its handling. Stages are timed with
+    `with timer.stage(name):` blocks, which must not be nested.
+    """
+
+    __slots__ = ("stages", "_name", "_start")
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, float] = {}
+
+    def stage(self, name: str) -> "StageTimer":
+        self._name = name
+        return self
+
+    def __enter__(self) -> "StageTimer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stages[self._name] = self.stages.get(self._name, 0.0) + time.perf_counter() - self._start
+
+
+class NullTimer:
+    """
+    Timer that records nothing, used when the metrics are disabled.
+    """
+
+    stages: Dict[str, float] = {}
+
+    def stage(self, name: str) -> "NullTimer":
+        return self
+
+    def __enter__(self) -> "NullTimer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        # The last count is the one of the +Inf bucket
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts: List[int], total: float, count: int) -> None:
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+
+class RequestMetrics:
+    """
+    Request counters per route, method and status, and latency histograms of the requests
+    and of their stages, rendered in the Prometheus text format. Requests slower than
+    slow_threshold seconds are logged with their stage breakdown and the last
+    slow_sample_size of them are kept.
+
+    With a shared_folder, as when served by several worker processes, every worker saves
+    its metrics there every flush_interval seconds, from a background thread, and the
+    rendered metrics are the sum of all the workers' ones. Files of exited workers are
+    kept, so that the counters never go backwards when a worker is restarted. Slow
+    requests are still kept by each worker.
+
+    Components registered with add_component, such as the cache and the coalescer, are
+    exported with them, from the stats they report when the metrics are saved.
+    """
+
+    def __init__(
+        self,
+        slow_threshold: Optional[float],
+        slow_sample_size: int,
+        logger: Logger,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        shared_folder: Optional[Path] = None,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.slow_threshold = slow_threshold
+        self.slow_sample_size = slow_sample_size
+        self.logger = logger
+        self.buckets = buckets
+        self.shared_folder = shared_folder
+        self.flush_interval = flush_interval
+        self._components: Dict[str, Callable[[], dict]] = {}
+        self._lock = ForkSafeLock()
+        self._flush_lock = ForkSafeLock()
+        self._reset()
+        # A forked worker starts counting from zero
+        ForkUtils.after_fork_in_child(self._reset)
+
+    @classmethod
+    def from_configuration(cls, configuration: Mapping, logger: Logger) -> Optional["RequestMetrics"]:
+        """
+        Metrics as configured in deploy.metrics, or None when they are disabled. In
+        production mode they are shared by the workers through a temporary folder.
+        """
+        metrics = ConfigParser.get_value(configuration, ["deploy", "metrics"])
+        if not metrics["enabled"]:
+            return None
+        slow_requests = metrics["slowRequests"]
+        shared_folder = None
+        if ConfigParser.get_value(configuration, ["deploy", "server", "mode"]) == "production":
+            shared_folder = Path(tempfile.mkdtemp(prefix="diamonds_metrics_"))
+            owner = os.getpid()
+            # Workers run the exit handlers too, only the process that created the folder removes it
+            atexit.register(lambda: os.getpid() == owner and shutil.rmtree(shared_folder, ignore_errors=True))
+        return cls(
+            slow_threshold=slow_requests["thresholdMs"] / 1000 if slow_requests["enabled"] else None,
+            slow_sample_size=slow_requests["sampleSize"],
+            logger=logger,
+            shared_folder=shared_folder,
+            flush_interval=metrics["flushInterval"],
+        )
+
+    def _reset(self) -> None:
+        self._requests: Dict[Tuple[str, str, str], int] = {}
+        self._durations: Dict[Tuple[str, str], Histogram] = {}
+        self._stages: Dict[Tuple[str, str], Histogram] = {}
+        self._slow: deque = deque(maxlen=self.slow_sample_size)
+        self._dirty = False
+        self._flusher = None
+        # Process ids are reused, the file of a restarted worker must not replace an exited one's
+        self._worker_id = f"{os.getpid()}_{uuid.uuid4().hex[:8]}"
+
+    def add_component(self, name: str, stats: Callable[[], dict]) -> None:
+        """
+        Export the statistics returned by stats under the metrics of the name component.
+        """
+        if name not in COMPONENT_METRICS:
+            raise ValueError(f"Unknown metrics component: {name}")
+        self._components[name] = stats
+
+    def _collect(self) -> Dict[str, dict]:
+        return {name: stats() for name, stats in self._components.items()}
+
+    def _histogram(self, histograms: dict, labels: tuple) -> Histogram:
+        histogram = histograms.get(labels)
+        if histogram is None:
+            histogram = histograms[labels] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, method: str, route: str, status: int, duration: float, stages: Dict[str, float]) -> None:
+        # Time not spent in any timed stage is accounted as "other"
+        stages = {**stages, "other": max(duration - sum(stages.values()), 0.0)}
+        with self._lock:
+            self._dirty = True
+            key = (method, route, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._histogram(self._durations, (method, route)).observe(duration)
+            for stage, elapsed in stages.items():
+                self._histogram(self._stages, (route, stage)).observe(elapsed)
+        if self.slow_threshold is not None and duration > self.slow_threshold:
+            self._sample(method, route, status, duration, stages)
+        if self.shared_folder is not None and self._flusher is None:
+            self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is not None:
+                return
+            # Started by the first request of each worker, a forked worker has no flusher yet
+            self._flusher = threading.Thread(target=self._run_flusher, name="metrics-flusher", daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def _snapshot(self) -> dict:
+        return {
+            "requests": [[*labels, count] for labels, count in self._requests.items()],
+            "durations": [[*labels, h.counts, h.sum, h.count] for labels, h in self._durations.items()],
+            "stages": [[*labels, h.counts, h.sum, h.count] for labels, h in self._stages.items()],
+        }
+
+    def flush(self) -> None:
+        """
+        Save the metrics of this worker to the shared folder.
+        """
+        if self.shared_folder is None:
+            return
+        # Flushes are serialized, so that an older snapshot never replaces a newer one
+        with self._flush_lock:
+            components = self._collect()
+            with self._lock:
+                self._dirty = False
+                snapshot = self._snapshot()
+            snapshot["components"] = components
+            path = self.shared_folder.joinpath(f"{self._worker_id}.json")
+            # The rendering worker never reads a partial file
+            with FileUtils.atomic_write(path) as temporary_path:
+                with open(temporary_path, "w") as json_file:
+                    json.dump(snapshot, json_file)
+
+    @staticmethod
+    def _is_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _merged(self) -> tuple:
+        requests, durations, stages, components = {}, {}, {}, {}
+        for path in self.shared_folder.glob("*.json"):
+            try:
+                with open(path) as json_file:
+                    snapshot = json.load(json_file)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Failed to read the metrics of {path}. Got error: {e}")
+                continue
+            for *labels, count in snapshot["requests"]:
+                requests[tuple(labels)] = requests.get(tuple(labels), 0) + count
+            for histograms, rows in ((durations, snapshot["durations"]), (stages, snapshot["stages"])):
+                for *labels, counts, total, count in rows:
+                    self._histogram(histograms, tuple(labels)).merge(counts, total, count)
+            alive = self._is_alive(int(path.stem.split("_")[0]))
+            for name, stats in snapshot.get("components", {}).items():
+                merged = components.setdefault(name, {})
+                for key, _, kind, _, _ in COMPONENT_METRICS[name]:
+                    if kind == "max":
+                        merged[key] = max(merged.get(key, 0), stats[key])
+                    elif kind == "counter" or alive:
+                        # The gauges of exited workers are stale
+                        merged[key] = merged.get(key, 0) + stats[key]
+        return requests, durations, stages, components
+
+    def _sample(self, method: str, route: str, status: int, duration: float, stages: Dict[str, float]) -> None:
+        sample = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "method": method,
+            "route": route,
+            "status": status,
+            "duration_ms": 1000 * duration,
+            "stages_ms": {stage: 1000 * elapsed for stage, elapsed in stages.items()},
+        }
+        with self._lock:
+            self._slow.append(sample)
+        breakdown = ", ".join(f"{stage} {elapsed:.2f} ms" for stage, elapsed in sample["stages_ms"].items())
+        self.logger.warning(f"Slow request {method} {route} {status} took {sample['duration_ms']:.2f} ms: {breakdown}")
+
+    def slow_requests(self) -> List[dict]:
+        with self._lock:
+            return list(self._slow)
+
+    @staticmethod
+    def _labels(**labels) -> str:
+        return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+    def _render_histogram(self, name: str, histograms: dict, label_names: Tuple[str, ...]) -> List[str]:
+        lines = []
+        for labels, histogram in sorted(histograms.items()):
+            labels = self._labels(**dict(zip(label_names, labels)))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+    def render(self) -> str:
+        if self.shared_folder is not None:
+            # The worker serving the scrape saves its latest metrics before they are summed
+            self.flush()
+            return self._render(*self._merged())
+        components = self._collect()
+        with self._lock:
+            return self._render(self._requests, self._durations, self._stages, components)
+
+    def _render(self, requests: dict, durations: dict, stages: dict, components: dict) -> str:
+        lines = [
+            f"# HELP {METRIC_PREFIX}_requests_total Requests handled, by method, route and status.",
+            f"# TYPE {METRIC_PREFIX}_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f"{METRIC_PREFIX}_requests_total{{{self._labels(method=method, route=route, status=status)}}} {count}")
+        lines += [
+            f"# HELP {METRIC_PREFIX}_request_duration_seconds Request latency, by method and route.",
+            f"# TYPE {METRIC_PREFIX}_request_duration_seconds histogram",
+        ]
+        lines += self._render_histogram(f"{METRIC_PREFIX}_request_duration_seconds", durations, ("method", "route"))
+        lines += [
+            f"# HELP {METRIC_PREFIX}_stage_duration_seconds Time spent in each stage of a request, by route and stage.",
+            f"# TYPE {METRIC_PREFIX}_stage_duration_seconds histogram",
+        ]
+        lines += self._render_histogram(f"{METRIC_PREFIX}_stage_duration_seconds", stages, ("route", "stage"))
+        for name, stats in sorted(components.items()):
+            for key, metric, kind, scale, description in COMPONENT_METRICS[name]:
+                if key not in stats:
+                    continue
+                lines += [
+                    f"# HELP {METRIC_PREFIX}_{metric} {description}",
+                    f"# TYPE {METRIC_PREFIX}_{metric} {'counter' if kind == 'counter' else 'gauge'}",
+                    f"{METRIC_PREFIX}_{metric} {stats[key] * scale}",
+                ]
+        return "\n".join(lines) + "\n"
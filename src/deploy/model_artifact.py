@@ -0,0 +1,86 @@
+from logging import Logger
+from pathlib import Path
+from typing import List
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.deploy.metrics import NULL_TIMER
+from src.model.data_preparation import DataPreparation
+from src.model.feature_encoder import ENCODER_FILENAME, FeatureEncoder
+from src.model.native_model import NativeModelUtils
+from src.utils.config import ConfigParser, Configuration
+from src.utils.server import ServerUtils
+from src.utils.transformation import TransformationUtils
+
+CONFIG_FILENAME = "config.json"
+
+
+class ModelArtifact:
+    """
+    Self-contained trained epoch: the model, preferably in its native export, the feature
+    encoder, and the configuration snapshot saved with them, which holds the target
+    transformation. Loading it never touches the training data.
+    """
+
+    def __init__(self, folder: Path, logger: Logger) -> None:
+        self.folder = folder
+        self.epoch = folder.name
+        self.logger = logger
+        # Snapshots of older epochs may lack keys added since, only the ones in use are read
+        self.configuration = Configuration(
+            ConfigParser.retrieve_config(folder.joinpath(CONFIG_FILENAME)), validate=False
+        )
+        # The native export loads faster than the pickle and runs no code while loading
+        self.model = NativeModelUtils.load(
+            folder, ConfigParser.get_value(self.configuration, ["model", "type"])
+        )
+        if self.model is None:
+            self.model = joblib.load(
+                folder.joinpath(
+                    ConfigParser.get_value(self.configuration, ["model", "save", "filename"])
+                )
+            )
+        # Pickled estimators fitted on a frame expect its feature names back
+        self.feature_names = getattr(self.model, "feature_names_in_", None)
+        encoder_path = folder.joinpath(ENCODER_FILENAME)
+        if encoder_path.exists():
+            self.encoder = FeatureEncoder.load(encoder_path)
+            self.data_preparation = None
+        else:
+            # Older epochs have no encoder, their payloads go through the data preparation pipeline
+            self.logger.warning(
+                f"No {ENCODER_FILENAME} found in {folder}, falling back to the data preparation pipeline"
+            )
+            self.encoder = None
+            self.data_preparation = DataPreparation(
+                config_file=folder.joinpath(CONFIG_FILENAME),
+                logger=logger,
+                configuration=self.configuration,
+            )
+
+    def encode(self, payloads: List[dict]):
+        if self.encoder is not None:
+            return self.encoder.transform(payloads)
+        data = ServerUtils.parse_batch_payload(payloads)
+        target = self.configuration.target
+        data[target] = 42
+        # Cleaning is skipped so that every diamond keeps its position in the batch
+        features = self.data_preparation.data_preparation(
+            dataset=data, exploration=False, cleaning=False
+        )
+        self.logger.debug(features)
+        return features.drop(columns=target)
+
+    def predict(self, payloads: List[dict], timer=NULL_TIMER) -> np.ndarray:
+        with timer.stage("encode"):
+            features = self.encode(payloads)
+        with timer.stage("predict"):
+            if self.feature_names is not None and isinstance(features, np.ndarray):
+                features = pd.DataFrame(features, columns=self.feature_names)
+            prediction = self.model.predict(features)
+        with timer.stage("inverse_transformation"):
+            return TransformationUtils.inverse_transformation(
+                self.configuration, prediction, self.logger
+            )
@@ -1,84 +1,173 @@
 from pathlib import Path
 from logging import Logger
+from typing import Any, Callable, List, Optional
 
-import joblib
 import numpy as np
 
 from src.const.path import TRAIN_FOLDER
-from src.model.model_trainer import ModelTrainer
+from src.deploy.cache import PredictionCache
+from src.deploy.coalescer import PredictionCoalescer
+from src.deploy.metrics import NULL_TIMER
+from src.deploy.model_artifact import ModelArtifact
+from src.deploy.registry import ModelRegistry
+from src.deploy.similarity import CaratIndex, NeighbourIndex
+from src.model.data_preparation import DataPreparation
 from src.utils.config import ConfigParser
-from src.utils.server import ServerUtils
+from src.utils.schema import SchemaUtils
 
 
 class ModelDeploy:
     def __init__(self, config_file: Path, logger: Logger) -> None:
         self.config_file = config_file
-        self.configuration = ConfigParser.retrieve_config(config_file)
+        self.configuration = ConfigParser.load(config_file)
         self.logger = logger
 
     def run(self) -> None:
         self.logger.info("Deploying model...")
-        self.data_processor = ModelTrainer(
-            config_file=self.config_file, logger=self.logger
-        )
         if ConfigParser.get_value(
             self.configuration, ["deploy", "model_name", "trainOnTheSpot"]
         ):
-            self.data_processor.run()
-            self.model = joblib.load(
-                self.data_processor.model_epoch_folder.joinpath("model.pkl")
-            )
+            # Training code and its dependencies are only needed when training on the spot
+            from src.model.model_trainer import ModelTrainer
+
+            model_trainer = ModelTrainer(config_file=self.config_file, logger=self.logger)
+            model_trainer.run()
+            model_folder = model_trainer.model_epoch_folder
         else:
-            self.model = joblib.load(
-                TRAIN_FOLDER.joinpath(
-                    ConfigParser.get_value(self.configuration, ["data", "name"])
+            model_folder = TRAIN_FOLDER.joinpath(
+                ConfigParser.get_value(self.configuration, ["data", "name"])
+            ).joinpath(
+                ConfigParser.get_value(
+                    self.configuration, ["deploy", "model_name", "epoch"]
                 )
-                .joinpath(
-                    ConfigParser.get_value(
-                        self.configuration, ["deploy", "model_name", "epoch"]
-                    )
-                )
-                .joinpath("model.pkl")
+            )
+        self.registry = ModelRegistry(
+            model_folder.parent,
+            max_resident=ConfigParser.get_value(
+                self.configuration, ["deploy", "registry", "maxResident"]
+            ),
+            poll_interval=ConfigParser.get_value(
+                self.configuration, ["deploy", "registry", "pollInterval"]
+            ),
+            logger=self.logger,
+        )
+        self.registry.activate(model_folder.name)
+        reference = SchemaUtils.widen(
+            DataPreparation(
+                config_file=self.config_file,
+                logger=self.logger,
+                configuration=self.configuration,
+            ).get_dataset()
+        )
+        self.similarity_index = CaratIndex(reference)
+        self.neighbour_index = NeighbourIndex(
+            reference,
+            weights=ConfigParser.get_value(
+                self.configuration, ["deploy", "similarity", "weights"]
+            ),
+            grades=ConfigParser.get_value(
+                self.configuration, ["data", "processing", "orderCategorical", "columns"]
+            ),
+        )
+        self.coalescer = None
+        if ConfigParser.get_value(
+            self.configuration, ["deploy", "coalescer", "enabled"]
+        ):
+            self.coalescer = PredictionCoalescer(
+                max_wait=ConfigParser.get_value(
+                    self.configuration, ["deploy", "coalescer", "maxWaitMs"]
+                ) / 1000,
+                max_batch_size=ConfigParser.get_value(
+                    self.configuration, ["deploy", "coalescer", "maxBatchSize"]
+                ),
+                logger=self.logger,
+            )
+        self.cache = None
+        if ConfigParser.get_value(self.configuration, ["deploy", "cache", "enabled"]):
+            self.cache = PredictionCache(
+                max_size=ConfigParser.get_value(
+                    self.configuration, ["deploy", "cache", "maxSize"]
+                ),
+                ttl=ConfigParser.get_value(
+                    self.configuration, ["deploy", "cache", "ttlSeconds"]
+                ),
             )
         self.logger.info("Model deployed successfully")
 
-    def predict_price(self, payload: dict) -> dict:
-        self.logger.info(f"Making prediction with data: {payload}")
-        data = ServerUtils.parse_payload(payload)
-        target = ConfigParser.get_value(
-            self.configuration, ["data", "processing", "trainTestSplit", "target"]
+    def _cached(
+        self, route: str, epoch: str, payload: dict, compute: Callable[[], Any]
+    ) -> Any:
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute(
+            PredictionCache.key(route, epoch, payload), compute
         )
-        data[target] = 42
-        data_processed = self.data_processor.data.data_preparation(
-            dataset=data, exploration=False
+
+    def _predict_one(
+        self, artifact: ModelArtifact, payload: dict, timer, deadline: Optional[float]
+    ) -> list:
+        if self.coalescer is not None:
+            # Stages of a coalesced batch are shared by its requests, only the total is timed
+            with timer.stage("coalesced_predict"):
+                return self.coalescer.predict(payload, artifact, deadline).tolist()
+        return artifact.predict([payload], timer).tolist()
+
+    def predict_price(
+        self, payload: dict, timer=NULL_TIMER, deadline: Optional[float] = None
+    ) -> dict:
+        self.logger.debug(f"Making prediction with data: {payload}")
+        # The model is picked once, so the request is served and cached by the same epoch
+        artifact = self.registry.select()
+        prediction = self._cached(
+            "/predictprice", artifact.epoch, payload,
+            lambda: self._predict_one(artifact, payload, timer, deadline),
         )
-        self.logger.info(data_processed)
-        data_processed.drop(columns=target, inplace=True)
-        prediction = self.model.predict(data_processed)
-        prediction = self.data_processor.inverse_transformation(prediction)
-        self.logger.info(f"Prediction: {prediction}")
-        payload.update({"prediction": prediction.tolist()})
+        self.logger.debug(f"Prediction: {prediction}")
+        payload.update({"prediction": prediction})
         return payload
 
-    def similar_diamonds(self, payload: dict) -> dict:
-        self.logger.info(f"Generating similar diamonds with data: {payload}")
-        data = payload
-        dataset = self.data_processor.data.get_dataset()
-        dataset = dataset[
-            (dataset["cut"].str.strip().str.lower() == data["cut"].strip().lower())
-            & (
-                dataset["color"].str.strip().str.lower()
-                == data["color"].strip().lower()
-            )
-            & (
-                dataset["clarity"].str.strip().str.lower()
-                == data["clarity"].strip().lower()
-            )
-        ]
-        dataset["similarity"] = np.abs(dataset["carat"] - data["carat"])
-        number_of_similar_diamonds = payload.get("n", 5)
-        return (
-            dataset.sort_values(by="similarity")
-            .head(number_of_similar_diamonds)
-            .to_dict()
+    def predict_price_batch(self, payloads: List[dict], timer=NULL_TIMER) -> dict:
+        self.logger.info(f"Making batch prediction for {len(payloads)} diamonds")
+        predictions = self.registry.select().predict(payloads, timer)
+        return {"predictions": np.ravel(predictions).tolist()}
+
+    def stats(self) -> dict:
+        return {
+            "coalescer": None if self.coalescer is None else self.coalescer.stats(),
+            "cache": None if self.cache is None else self.cache.stats(),
+        }
+
+    def models(self) -> dict:
+        return self.registry.status()
+
+    def activate_model(self, payload: dict) -> dict:
+        self.registry.activate(payload["epoch"])
+        return self.registry.status()
+
+    def route_candidate(self, payload: dict) -> dict:
+        self.registry.set_candidate(payload.get("epoch"), payload.get("percentage", 0))
+        return self.registry.status()
+
+    def similar_diamonds(self, payload: dict, timer=NULL_TIMER) -> dict:
+        self.logger.debug(f"Generating similar diamonds with data: {payload}")
+        return self._cached(
+            "/similardiamonds", self.registry.active.epoch, payload,
+            lambda: self._similar_diamonds(payload, timer),
         )
+
+    def _similar_diamonds(self, payload: dict, timer) -> dict:
+        with timer.stage("similarity"):
+            return self._search_similar(payload)
+
+    def _search_similar(self, payload: dict) -> dict:
+        if payload.get("metric", "carat") == "weighted":
+            return self.neighbour_index.similar(
+                payload, n=payload.get("n", 5), filters=payload["filters"]
+            ).to_dict()
+        return self.similarity_index.similar(
+            cut=payload["cut"],
+            color=payload["color"],
+            clarity=payload["clarity"],
+            carat=payload["carat"],
+            n=payload.get("n", 5),
+        ).to_dict()
@@ -0,0 +1,181 @@
+from collections import OrderedDict
+import json
+from logging import Logger
+from pathlib import Path
+import random
+import threading
+import time
+from typing import List, Optional
+
+from src.deploy.model_artifact import CONFIG_FILENAME, ModelArtifact
+from src.utils.files import FileUtils
+from src.utils.fork import ForkSafeLock, ForkUtils
+
+REGISTRY_FILENAME = "registry.json"
+
+
+class ModelRegistry:
+    """
+    Trained epochs of a model, with the active one serving the traffic and an optional
+    candidate serving a percentage of it. Up to max_resident artifacts are kept loaded,
+    so that swapping back and forth does not reload them. The choice is saved in a
+    state file, which every worker polls to follow swaps made through another one.
+    """
+
+    def __init__(self, folder: Path, max_resident: int, poll_interval: float, logger: Logger) -> None:
+        self.folder = folder
+        self.max_resident = max_resident
+        self.poll_interval = poll_interval
+        self.logger = logger
+        self.state_path = folder.joinpath(REGISTRY_FILENAME)
+        self._models: "OrderedDict[str, ModelArtifact]" = OrderedDict()
+        self._active: Optional[ModelArtifact] = None
+        self._candidate: Optional[ModelArtifact] = None
+        self._candidate_percent = 0.0
+        self._state_mtime = None
+        self._last_poll = time.monotonic()
+        self._loader: Optional[threading.Thread] = None
+        self._lock = ForkSafeLock(threading.RLock)
+        # A forked worker inherits the loader of its parent, but not its thread
+        ForkUtils.after_fork_in_child(self._reset_loader)
+
+    def _reset_loader(self) -> None:
+        self._loader = None
+
+    @property
+    def active(self) -> ModelArtifact:
+        return self._active
+
+    def discover(self) -> List[dict]:
+        """
+        List the trained epochs with their evaluation metrics, oldest first.
+        """
+        epochs = []
+        for folder in sorted(self.folder.iterdir()):
+            config_path = folder.joinpath(CONFIG_FILENAME)
+            if not config_path.is_file():
+                continue
+            try:
+                with open(config_path) as json_file:
+                    metrics = json.load(json_file).get("evaluation", {}).get("metrics", {})
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Failed to read {config_path}. Got error: {e}")
+                continue
+            epochs.append({
+                "epoch": folder.name,
+                "metrics": metrics,
+                "resident": folder.name in self._models,
+            })
+        return epochs
+
+    def _get(self, epoch: str) -> ModelArtifact:
+        with self._lock:
+            artifact = self._models.get(epoch)
+            if artifact is not None:
+                self._models.move_to_end(epoch)
+                return artifact
+        folder = self.folder.joinpath(epoch)
+        if folder.parent != self.folder or not folder.joinpath(CONFIG_FILENAME).is_file():
+            raise FileNotFoundError(f"Epoch {epoch} not found in {self.folder}")
+        # Loading takes long, requests keep being served from the resident models meanwhile
+        artifact = ModelArtifact(folder, logger=self.logger)
+        with self._lock:
+            # Another thread may have loaded the same epoch in the meantime
+            artifact = self._models.setdefault(epoch, artifact)
+            self._models.move_to_end(epoch)
+            # Models in use stay referenced by the registry even once evicted
+            while len(self._models) > self.max_resident:
+                self._models.popitem(last=False)
+        return artifact
+
+    def activate(self, epoch: str) -> None:
+        """
+        Make epoch the active model. Requests already running keep the model they started with.
+        """
+        self._apply(epoch, self._candidate and self._candidate.epoch, self._candidate_percent)
+        self.logger.info(f"Model {epoch} activated")
+
+    def set_candidate(self, epoch: Optional[str], percent: float) -> None:
+        """
+        Route percent of the traffic to epoch, or stop routing when epoch is None.
+        """
+        self._apply(self._active.epoch, epoch, percent)
+        self.logger.info(f"Model {epoch} routed {percent}% of the traffic")
+
+    def _apply(self, active: str, candidate: Optional[str], percent: float, state_mtime: Optional[int] = None) -> None:
+        """
+        Swap to active and candidate. With state_mtime, the state was read from the state
+        file at that modification time, and is not saved back.
+        """
+        # Models are loaded before the swap, which then only replaces references
+        active_artifact = self._get(active)
+        candidate_artifact = None
+        if candidate is not None and candidate != active and percent > 0:
+            candidate_artifact = self._get(candidate)
+        with self._lock:
+            if state_mtime is not None and state_mtime != self._state_mtime:
+                # A newer state was saved or read while the models were loading
+                return
+            self._active = active_artifact
+            self._candidate = candidate_artifact
+            self._candidate_percent = percent if candidate_artifact is not None else 0.0
+            if state_mtime is None:
+                self._save_state()
+
+    def _save_state(self) -> None:
+        state = {
+            "active": self._active.epoch,
+            "candidate": self._candidate and self._candidate.epoch,
+            "candidatePercent": self._candidate_percent,
+        }
+        # Polling workers never read a partial file
+        with FileUtils.atomic_write(self.state_path) as temporary_path:
+            with open(temporary_path, "w") as json_file:
+                json.dump(state, json_file, indent=4)
+        self._state_mtime = self.state_path.stat().st_mtime_ns
+
+    def _poll(self) -> None:
+        now = time.monotonic()
+        if now - self._last_poll < self.poll_interval:
+            return
+        self._last_poll = now
+        try:
+            mtime = self.state_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        with self._lock:
+            # A change seen while loading the previous one is picked up by a later poll
+            if mtime == self._state_mtime or (self._loader is not None and self._loader.is_alive()):
+                return
+            self._state_mtime = mtime
+            # The request thread only starts the loader, it never waits for a model to load
+            self._loader = threading.Thread(
+                target=self._load_state, args=(mtime,), name="registry-loader", daemon=True
+            )
+            self._loader.start()
+
+    def _load_state(self, mtime: int) -> None:
+        try:
+            with open(self.state_path) as json_file:
+                state = json.load(json_file)
+            self._apply(state["active"], state["candidate"], state["candidatePercent"], state_mtime=mtime)
+        except (OSError, KeyError, ValueError) as e:
+            self.logger.error(f"Failed to apply the registry state {self.state_path}. Got error: {e}")
+
+    def select(self) -> ModelArtifact:
+        """
+        Model to serve a request with: the candidate for its share of the traffic, the active one otherwise.
+        """
+        self._poll()
+        candidate, percent = self._candidate, self._candidate_percent
+        if candidate is not None and random.random() * 100 < percent:
+            return candidate
+        return self._active
+
+    def status(self) -> dict:
+        return {
+            "active": self._active.epoch,
+            "candidate": self._candidate and self._candidate.epoch,
+            "candidate_percent": self._candidate_percent,
+            "epochs": self.discover(),
+        }
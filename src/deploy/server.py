@@ -0,0 +1,45 @@
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+
+from src.utils.config import ConfigParser, Configuration
+
+
+class ProductionServer(BaseApplication):
+    """
+    Gunicorn server for an application that is already loaded. Workers are forked from
+    the process holding the model and the reference data, and share them copy-on-write.
+    """
+
+    def __init__(self, app: Flask, configuration: Configuration) -> None:
+        self.application = app
+        server = ConfigParser.get_value(configuration, ["deploy", "server"])
+        self.options = {
+            "bind": f"{server['host']}:{server['port']}",
+            "workers": server["workers"],
+            "threads": server["threads"],
+            "worker_class": "gthread" if server["threads"] > 1 else "sync",
+            # Only a worker whose heartbeat stops, with every thread stuck, is restarted. Requests
+            # are bounded by requestTimeout instead, see PredictionCoalescer.predict
+            "timeout": server["workerTimeout"],
+            "graceful_timeout": server["gracefulTimeout"],
+            "preload_app": True,
+            "post_fork": self._post_fork,
+            "worker_exit": self._worker_exit,
+        }
+        super().__init__()
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self) -> Flask:
+        return self.application
+
+    def _post_fork(self, server, worker) -> None:
+        server.log.info(f"Worker {worker.pid} forked with the preloaded model")
+
+    def _worker_exit(self, server, worker) -> None:
+        # Queued interactions and the latest metrics are flushed before the worker goes away
+        self.application.config['interaction_db'].close()
+        if self.application.config['metrics'] is not None:
+            self.application.config['metrics'].flush()
@@ -0,0 +1,155 @@
+import itertools
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+GRADE_COLUMNS = ["cut", "color", "clarity"]
+NUMERIC_COLUMNS = ["carat", "depth", "table", "x", "y", "z"]
+
+
+class CaratIndex:
+    """
+    In-memory index of the reference dataset, grouped by normalized (cut, color, clarity)
+    and sorted by carat, answering k-nearest-by-carat queries in O(log N + k).
+    """
+
+    def __init__(self, dataset: pd.DataFrame) -> None:
+        self.dataset = dataset
+        normalized = [
+            dataset[column].astype("string").str.strip().str.lower()
+            for column in GRADE_COLUMNS
+        ]
+        carats = dataset["carat"].to_numpy(dtype=np.float64)
+        self._groups: Dict[Tuple[str, str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        for key, positions in dataset.groupby(normalized, sort=False).indices.items():
+            positions = positions[~np.isnan(carats[positions])]
+            order = np.argsort(carats[positions], kind="stable")
+            self._groups[key] = (carats[positions][order], positions[order])
+
+    @staticmethod
+    def normalize(cut: str, color: str, clarity: str) -> Tuple[str, str, str]:
+        return cut.strip().lower(), color.strip().lower(), clarity.strip().lower()
+
+    def query(
+        self, cut: str, color: str, clarity: str, carat: float, n: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the dataset positions of the n diamonds with the same grades and the
+        closest carat, together with their carat distance, nearest first.
+        """
+        group = self._groups.get(self.normalize(cut, color, clarity))
+        if group is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+        carats, positions = group
+        # Expand outwards from the insertion point, always taking the closer neighbour
+        right = int(np.searchsorted(carats, carat))
+        left = right - 1
+        selected = []
+        while len(selected) < n and (left >= 0 or right < len(carats)):
+            if right >= len(carats) or (
+                left >= 0 and carat - carats[left] <= carats[right] - carat
+            ):
+                selected.append(left)
+                left -= 1
+            else:
+                selected.append(right)
+                right += 1
+        selected = np.array(selected, dtype=np.intp)
+        return positions[selected], np.abs(carats[selected] - carat)
+
+    def similar(self, cut: str, color: str, clarity: str, carat: float, n: int) -> pd.DataFrame:
+        positions, distances = self.query(cut, color, clarity, carat, n)
+        similar = self.dataset.iloc[positions].copy()
+        similar["similarity"] = distances
+        return similar
+
+
+class NeighbourIndex:
+    """
+    Weighted nearest-neighbour index of the reference dataset. Numeric attributes are
+    standardized and scaled by their weight, grades used as hard filters partition the
+    dataset and the remaining grades contribute their weighted ordinal distance. Every
+    partition is backed by a KD-tree. The trees of all the combinations of filters are
+    built up front, so that queries only read the index and never build it concurrently.
+    """
+
+    def __init__(
+        self,
+        dataset: pd.DataFrame,
+        weights: Dict[str, float],
+        grades: Dict[str, List[str]],
+    ) -> None:
+        self.dataset = dataset
+        numeric = dataset[NUMERIC_COLUMNS].to_numpy(dtype=np.float64)
+        std = np.nanstd(numeric, axis=0)
+        std[~(std > 0)] = 1.0
+        self._scale = np.array([weights.get(column, 0.0) for column in NUMERIC_COLUMNS]) / std
+        self._numeric = numeric * self._scale
+        self._ranks = {}
+        self._normalized = {}
+        for column in GRADE_COLUMNS:
+            categories = [category.strip().lower() for category in grades[column]]
+            ranks = np.arange(len(categories)) / max(len(categories) - 1, 1)
+            self._ranks[column] = dict(zip(categories, ranks * weights.get(column, 0.0)))
+            self._normalized[column] = dataset[column].astype("string").str.strip().str.lower()
+        self._ordinals = {
+            column: self._normalized[column]
+            .map(self._ranks[column])
+            .to_numpy(dtype=np.float64, na_value=np.nan)
+            for column in GRADE_COLUMNS
+        }
+        # 2^3 combinations, each one covering the dataset once
+        self._partitions: Dict[Tuple[str, ...], dict] = {
+            filters: self._build_partitions(filters)
+            for size in range(len(GRADE_COLUMNS) + 1)
+            for filters in itertools.combinations(GRADE_COLUMNS, size)
+        }
+
+    def _build_partitions(self, filters: Tuple[str, ...]) -> dict:
+        features = np.column_stack(
+            [self._numeric]
+            + [self._ordinals[column] for column in GRADE_COLUMNS if column not in filters]
+        )
+        valid = ~np.isnan(features).any(axis=1)
+        if filters:
+            keys = [self._normalized[column] for column in filters]
+            groups = pd.Series(valid, index=self.dataset.index).groupby(keys, sort=False).indices
+        else:
+            groups = {(): np.arange(len(features))}
+        partitions = {}
+        for key, positions in groups.items():
+            positions = positions[valid[positions]]
+            if len(positions):
+                key = key if isinstance(key, tuple) else (key,)
+                partitions[key] = (cKDTree(features[positions]), positions)
+        return partitions
+
+    def query(self, payload: dict, n: int, filters: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the dataset positions of the n diamonds closest to the payload, together
+        with their weighted distance, nearest first.
+        """
+        filters = tuple(column for column in GRADE_COLUMNS if column in filters)
+        point = [np.array([payload[column] for column in NUMERIC_COLUMNS]) * self._scale]
+        for column in GRADE_COLUMNS:
+            if column not in filters:
+                grade = payload[column].strip().lower()
+                if grade not in self._ranks[column]:
+                    raise ValueError(f"Unknown {column} '{payload[column]}'")
+                point.append([self._ranks[column][grade]])
+        partition = self._partitions[filters].get(
+            tuple(payload[column].strip().lower() for column in filters)
+        )
+        if partition is None:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+        tree, positions = partition
+        distances, neighbours = tree.query(np.concatenate(point), k=min(n, len(positions)))
+        return positions[np.atleast_1d(neighbours)], np.atleast_1d(distances)
+
+    def similar(self, payload: dict, n: int, filters: List[str]) -> pd.DataFrame:
+        positions, distances = self.query(payload, n, filters)
+        similar = self.dataset.iloc[positions].copy()
+        similar["similarity"] = distances
+        return similar
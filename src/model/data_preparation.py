@@ -1,41 +1,58 @@
+import tempfile
 import time
 from logging import Logger
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 
 from src.const.path import DATA_FOLDER, TRAIN_FOLDER
-from src.utils.config import ConfigParser
+from src.utils.config import ConfigParser, Configuration
+from src.utils.dataset_cache import DatasetCache
 from src.utils.exploration import ExplorationUtils
+from src.utils.files import FileUtils
 from src.utils.load_config import LoadUtils
+from src.utils.profiler import NULL_PROFILER
+from src.utils.resources import ResourceUtils
+from src.utils.schema import SchemaUtils
 
 
 class DataPreparation:
-    def __init__(self, config_file: Path, logger: Logger) -> None:
-        self.configuration = ConfigParser.retrieve_config(config_file)
+    def __init__(
+        self,
+        config_file: Path,
+        logger: Logger,
+        configuration: Optional[Configuration] = None,
+        profiler=NULL_PROFILER,
+    ) -> None:
+        self.configuration = (
+            ConfigParser.load(config_file) if configuration is None else configuration
+        )
         self.logger = logger
+        self.profiler = profiler
+        self._cache: Optional[Tuple[DatasetCache, Optional[str]]] = None
 
     def run(self) -> Tuple[pd.DataFrame, pd.DataFrame, pd.Series, pd.Series]:
+        from sklearn.model_selection import train_test_split
+
         self.logger.info("Initializing data preparation...")
         self._setup()
-        dataset = self.get_dataset()
-        dataset = self.data_preparation(dataset=dataset)
+        dataset = self._get_prepared_dataset()
         # Split data
-        target = ConfigParser.get_value(
-            self.configuration, ["data", "processing", "trainTestSplit", "target"]
-        )
-        x = dataset.drop(columns=target)
-        y = dataset[target]
+        target = self.configuration.target
         test_size = ConfigParser.get_value(
             self.configuration, ["data", "processing", "trainTestSplit", "testSize"]
         )
         random_state = ConfigParser.get_value(
             self.configuration, ["data", "processing", "trainTestSplit", "randomState"]
         )
-        x_train, x_test, y_train, y_test = train_test_split(
-            x, y, test_size=test_size, random_state=random_state
-        )
+        with self.profiler.phase("split"):
+            x = dataset.drop(columns=target)
+            y = dataset[target]
+            x_train, x_test, y_train, y_test = train_test_split(
+                x, y, test_size=test_size, random_state=random_state
+            )
+        self._log_memory("split", x_train, x_test, y_train, y_test)
         self.logger.info("Data preparation completed successfully")
         return x_train, x_test, y_train, y_test
 
@@ -49,7 +66,7 @@ class DataPreparation:
         self.logger.info(f"Model ID: {model_id}")
         self.model_epoch_folder.mkdir(parents=True, exist_ok=True)
 
-    def get_dataset(self) -> pd.DataFrame:
+    def _get_source(self) -> Tuple[bool, Path | str]:
         getLocal = ConfigParser.get_value(
             config=self.configuration, key=["data", "source", "getLocal"]
         )
@@ -62,40 +79,126 @@ class DataPreparation:
             source_path = ConfigParser.get_value(
                 config=self.configuration, key=["data", "source", "url"]
             )
+        return getLocal, source_path
+
+    def _get_cache(self) -> Tuple[DatasetCache, Optional[str]]:
+        # The source is fingerprinted once, every stage of this run is addressed by it
+        if self._cache is None:
+            cache = DatasetCache(configuration=self.configuration, logger=self.logger)
+            self._cache = (cache, cache.source_fingerprint(*self._get_source()))
+        return self._cache
+
+    def get_dataset(self) -> pd.DataFrame:
+        getLocal, source_path = self._get_source()
         self.logger.info(f"Selected config file is: '{source_path}'")
+        cache, fingerprint = self._get_cache()
+        data = cache.load("raw", fingerprint)
+        if data is not None:
+            self.profiler.record_shapes("raw", data)
+            return data
+        dtype = SchemaUtils.read_dtypes(self.configuration)
         if getLocal:
-            data = LoadUtils.load_path(path=source_path, logger=self.logger)
+            data = LoadUtils.load_path(path=source_path, logger=self.logger, dtype=dtype)
         else:
-            data = LoadUtils.load_url(url=str(source_path), logger=self.logger)
+            data = LoadUtils.load_url(url=str(source_path), logger=self.logger, dtype=dtype)
+        data, coerced = SchemaUtils.categorize(self.configuration, data)
+        self._log_coerced(coerced)
+        self._log_memory("raw", data)
+        cache.save("raw", fingerprint, data)
         return data
 
+    def _get_prepared_dataset(self) -> pd.DataFrame:
+        """
+        Clean, explore and process the dataset, reusing the cached stages when the source
+        and their configuration did not change.
+        """
+        self.logger.info("Preparing data for training...")
+        cache, fingerprint = self._get_cache()
+        exploration = self._exploration_enabled()
+        with self.profiler.phase("load"):
+            dataset = cache.load("processed", fingerprint)
+        if dataset is None or exploration:
+            with self.profiler.phase("load"):
+                cleaned = cache.load("cleaned", fingerprint)
+            if cleaned is None and ConfigParser.get_value(
+                self.configuration, ["data", "streaming", "enabled"]
+            ):
+                # The cleaned rows are streamed straight into their cache entry, the
+                # source is read as part of the cleaning
+                with self.profiler.phase("clean"):
+                    if fingerprint is not None:
+                        cleaned = self._stream_cleaning(cache.path("cleaned", fingerprint))
+                    else:
+                        # Without a cache entry to stream into, the rows go through a
+                        # temporary file that is removed once read back
+                        with tempfile.TemporaryDirectory(prefix="diamonds_cleaning_") as folder:
+                            cleaned = self._stream_cleaning(Path(folder).joinpath("cleaned.parquet"))
+            elif cleaned is None:
+                with self.profiler.phase("load"):
+                    raw = self.get_dataset()
+                with self.profiler.phase("clean"):
+                    cleaned = self._data_cleaning(dataset=raw)
+                    cache.save("cleaned", fingerprint, cleaned)
+            if exploration:
+                with self.profiler.phase("explore"):
+                    self._data_exploration(dataset=cleaned)
+            if dataset is None:
+                with self.profiler.phase("process"):
+                    dataset = self._data_processing(dataset=cleaned)
+                    self._log_memory("processed", dataset)
+                    cache.save("processed", fingerprint, dataset)
+        self.profiler.record_shapes("processed", dataset)
+        return dataset
+
+    def _log_memory(self, stage: str, *frames: pd.DataFrame) -> None:
+        self.profiler.record_shapes(stage, *frames)
+        self.logger.info(
+            f"Memory usage of the {stage} data: {ResourceUtils.frame_memory_mb(*frames):.2f} MB"
+        )
+
+    def _log_coerced(self, coerced: int) -> None:
+        if coerced:
+            self.logger.warning(
+                f"{coerced} rows have grades outside the schema categories, they are set to missing"
+            )
+
+    def _exploration_enabled(self) -> bool:
+        return any(
+            ConfigParser.get_value(self.configuration, ["data", "exploration", plot, "enabled"])
+            for plot in ["scatter_matrix", "hist", "categorical"]
+        )
+
     def data_preparation(
-        self, dataset: pd.DataFrame, exploration: bool = True
+        self, dataset: pd.DataFrame, exploration: bool = True, cleaning: bool = True
     ) -> pd.DataFrame:
         self.logger.info("Preparing data for training...")
-        dataset = self._data_cleaning(dataset=dataset)
+        if cleaning:
+            dataset = self._data_cleaning(dataset=dataset)
         if exploration:
             self._data_exploration(dataset=dataset)
         return self._data_processing(dataset=dataset)
 
     def _data_cleaning(self, dataset: pd.DataFrame) -> pd.DataFrame:
         self.logger.info("Cleaning data...")
+        mask = self._cleaning_mask(dataset)
         # Drop duplicates
         if ConfigParser.get_value(
             self.configuration, ["data", "cleaning", "dropDuplicates"]
         ):
-            dataset.drop_duplicates(inplace=True)
+            mask &= ~dataset.duplicated().to_numpy()
+        dataset = SchemaUtils.finalize(self.configuration, self._drop_columns(dataset[mask]))
+        self._log_memory("cleaned", dataset)
+        self.logger.info("Data cleaned successfully")
+        return dataset
+
+    def _cleaning_mask(self, dataset: pd.DataFrame) -> np.ndarray:
+        """
+        Combine the row filters of the cleaning section into a single mask of the rows to keep.
+        """
+        mask = np.ones(len(dataset), dtype=bool)
         # Drop missing values
         if ConfigParser.get_value(self.configuration, ["data", "cleaning", "dropNa"]):
-            dataset.dropna(inplace=True)
-        # Drop columns
-        if ConfigParser.get_value(
-            self.configuration, ["data", "cleaning", "dropColumns", "enabled"]
-        ):
-            columns = ConfigParser.get_value(
-                self.configuration, ["data", "cleaning", "dropColumns", "columns"]
-            )
-            dataset.drop(columns=columns, inplace=True, errors="ignore")
+            mask &= dataset.notna().all(axis=1).to_numpy()
         # Drop columns custom condition
         if ConfigParser.get_value(
             self.configuration, ["data", "cleaning", "dropCustom", "enabled"]
@@ -103,15 +206,92 @@ class DataPreparation:
             for column, bounds in ConfigParser.get_value(
                 self.configuration, ["data", "cleaning", "dropCustom", "columns"]
             ).items():
+                values = dataset[column]
+                # Missing values fail range conditions and pass inequality ones
                 if bounds["rangeOrEqual"]:
-                    min_value = bounds["min"]
-                    max_value = bounds["max"]
-                    dataset = dataset[dataset[column] >= min_value]
-                    dataset = dataset[dataset[column] < max_value]
+                    keep = ((values >= bounds["min"]) & (values < bounds["max"])).fillna(False)
                 else:
-                    value = bounds["value"]
-                    dataset = dataset[dataset[column] != value]
-        self.logger.info("Data cleaned successfully")
+                    keep = (values != bounds["value"]).fillna(True)
+                mask &= keep.to_numpy(dtype=bool)
+        return mask
+
+    def _drop_columns(self, dataset: pd.DataFrame) -> pd.DataFrame:
+        # Drop columns
+        if self.configuration.cleaning_dropped_columns:
+            dataset = dataset.drop(
+                columns=self.configuration.cleaning_dropped_columns, errors="ignore"
+            )
+        return dataset
+
+    def _stream_cleaning(self, path: Path) -> pd.DataFrame:
+        """
+        Read the source in chunks and clean each of them as it arrives, appending the kept
+        rows to a Parquet file. Only one chunk of the source is in memory at a time, and
+        duplicates across chunks are found through a set of row hashes.
+        """
+        import pyarrow
+        import pyarrow.parquet
+
+        self.logger.info("Cleaning data in chunks...")
+        getLocal, source_path = self._get_source()
+        chunk_size = ConfigParser.get_value(
+            self.configuration, ["data", "streaming", "chunkSize"]
+        )
+        drop_duplicates = ConfigParser.get_value(
+            self.configuration, ["data", "cleaning", "dropDuplicates"]
+        )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        seen = set()
+        writer = None
+        rows = 0
+        coerced = 0
+        # A partial file is never read as a complete one
+        with FileUtils.atomic_write(path) as temporary_path:
+            try:
+                for chunk in LoadUtils.load_chunks(
+                    source=source_path,
+                    chunk_size=chunk_size,
+                    logger=self.logger,
+                    dtype=SchemaUtils.read_dtypes(self.configuration),
+                ):
+                    chunk, chunk_coerced = SchemaUtils.categorize(self.configuration, chunk)
+                    coerced += chunk_coerced
+                    mask = self._cleaning_mask(chunk)
+                    if drop_duplicates:
+                        # Numbers are hashed as floats, so that a column parsed as integers in
+                        # one chunk and as floats in another one still matches
+                        numeric = chunk.select_dtypes("number").columns
+                        hashes = pd.util.hash_pandas_object(
+                            chunk.astype({column: "float64" for column in numeric}), index=False
+                        ).to_numpy()
+                        first = ~pd.Series(hashes).duplicated().to_numpy()
+                        unseen = np.fromiter(
+                            (value not in seen for value in hashes.tolist()),
+                            dtype=bool,
+                            count=len(hashes),
+                        )
+                        mask &= first & unseen
+                        seen.update(hashes.tolist())
+                    chunk = SchemaUtils.finalize(self.configuration, self._drop_columns(chunk[mask]))
+                    if writer is None:
+                        table = pyarrow.Table.from_pandas(chunk, preserve_index=True)
+                        writer = pyarrow.parquet.ParquetWriter(temporary_path, table.schema)
+                    else:
+                        table = pyarrow.Table.from_pandas(
+                            chunk, schema=writer.schema, preserve_index=True
+                        )
+                    writer.write_table(table)
+                    rows += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+            if writer is None:
+                # Even a source with a header only yields one empty chunk, there is no schema to write
+                raise ValueError(f"No data could be read from source: {source_path}")
+        self._log_coerced(coerced)
+        dataset = pd.read_parquet(path)
+        self._log_memory("cleaned", dataset)
+        self.logger.info(f"Data cleaned successfully, {rows} rows kept")
         return dataset
 
     def _data_exploration(self, dataset: pd.DataFrame) -> None:
@@ -124,101 +304,98 @@ class DataPreparation:
                 self.configuration, ["data", "exploration", "figsize", "height"]
             ),
         )
+        plots = []
         # Get statistics
         if ConfigParser.get_value(
             self.configuration, ["data", "exploration", "scatter_matrix", "enabled"]
         ):
-            ExplorationUtils.scatter_matrix_plot(
-                df=dataset,
-                figsize=figsize,
-                path=self.model_epoch_folder.joinpath("scatter_matrix.png"),
-            )
+            plots.append((
+                ExplorationUtils.scatter_matrix_plot,
+                dict(
+                    df=self._exploration_sample(dataset, "scatter_matrix"),
+                    figsize=figsize,
+                    path=self.model_epoch_folder.joinpath("scatter_matrix.png"),
+                ),
+            ))
         if ConfigParser.get_value(
             self.configuration, ["data", "exploration", "hist", "enabled"]
         ):
             bins = ConfigParser.get_value(
                 self.configuration, ["data", "exploration", "hist", "bins"]
             )
-            ExplorationUtils.hist_plot(
-                df=dataset,
-                bins=bins,
-                figsize=figsize,
-                path=self.model_epoch_folder.joinpath("hist.png"),
-            )
+            plots.append((
+                ExplorationUtils.hist_plot,
+                dict(
+                    df=self._exploration_sample(dataset, "hist"),
+                    bins=bins,
+                    figsize=figsize,
+                    path=self.model_epoch_folder.joinpath("hist.png"),
+                ),
+            ))
         if ConfigParser.get_value(
             self.configuration, ["data", "exploration", "categorical", "enabled"]
         ):
+            sample = self._exploration_sample(dataset, "categorical")
             for column in ConfigParser.get_value(
                 self.configuration, ["data", "exploration", "categorical", "columns"]
             ):
-                ExplorationUtils.violin_plot_by_price(
-                    df=dataset,
-                    column=column,
-                    path=self.model_epoch_folder.joinpath(f"violin_{column}.png"),
-                )
-                ExplorationUtils.scatter_plot_by_price_vs_carat(
-                    df=dataset,
-                    column=column,
-                    path=self.model_epoch_folder.joinpath(f"scatter_plot_{column}.png"),
-                )
+                plots.append((
+                    ExplorationUtils.violin_plot_by_price,
+                    dict(
+                        df=sample[[column, "price"]],
+                        column=column,
+                        path=self.model_epoch_folder.joinpath(f"violin_{column}.png"),
+                    ),
+                ))
+                plots.append((
+                    ExplorationUtils.scatter_plot_by_price_vs_carat,
+                    dict(
+                        df=sample[[column, "carat", "price"]],
+                        column=column,
+                        path=self.model_epoch_folder.joinpath(f"scatter_plot_{column}.png"),
+                    ),
+                ))
+        ExplorationUtils.render(
+            plots,
+            n_jobs=ConfigParser.get_value(
+                self.configuration, ["data", "exploration", "nJobs"]
+            ),
+        )
         self.logger.info("Data explored successfully")
 
+    def _exploration_sample(self, dataset: pd.DataFrame, plot: str) -> pd.DataFrame:
+        return ExplorationUtils.sample(
+            dataset,
+            max_rows=ConfigParser.get_value(
+                self.configuration, ["data", "exploration", plot, "maxRows"]
+            ),
+            stratify=ConfigParser.get_value(
+                self.configuration, ["data", "exploration", plot, "stratify"]
+            ),
+            random_state=ConfigParser.get_value(
+                self.configuration, ["data", "processing", "trainTestSplit", "randomState"]
+            ),
+        )
+
     def _data_processing(
         self, dataset: pd.DataFrame
     ) -> pd.DataFrame:
         self.logger.info("Processing data...")
         # Drop columns
-        if ConfigParser.get_value(
-            self.configuration,
-            ["data", "processing", "dropColumnsPostExploration", "enabled"],
-        ):
-            columns = ConfigParser.get_value(
-                self.configuration,
-                ["data", "processing", "dropColumnsPostExploration", "columns"],
+        if self.configuration.processing_dropped_columns:
+            dataset.drop(
+                columns=self.configuration.processing_dropped_columns,
+                inplace=True,
+                errors="ignore",
             )
-            dataset.drop(columns=columns, inplace=True, errors="ignore")
         # Get dummies
-        if ConfigParser.get_value(
-            self.configuration, ["data", "processing", "getDummies", "enabled"]
-        ):
-            columns = ConfigParser.get_value(
-                self.configuration, ["data", "processing", "getDummies", "columns"]
-            )
-            for column, categories in columns.items():
-                if not (
-                    ConfigParser.get_value(
-                        self.configuration,
-                        ["data", "processing", "orderCategorical", "enabled"],
-                    )
-                    and column
-                    in ConfigParser.get_value(
-                        self.configuration,
-                        ["data", "processing", "orderCategorical", "columns"],
-                    )
-                ):
-                    dataset[column] = pd.Categorical(dataset[column], categories=categories)
-                    dataset = pd.get_dummies(dataset, columns=[column], drop_first=True)
+        for column, categories in self.configuration.dummies.items():
+            dataset[column] = pd.Categorical(dataset[column], categories=categories)
+            dataset = pd.get_dummies(dataset, columns=[column], drop_first=True)
         # Order categorical attibutes
-        if ConfigParser.get_value(
-            self.configuration, ["data", "processing", "orderCategorical", "enabled"]
-        ):
-            for column, categories in ConfigParser.get_value(
-                self.configuration,
-                ["data", "processing", "orderCategorical", "columns"],
-            ).items():
-                if not (
-                    ConfigParser.get_value(
-                        self.configuration,
-                        ["data", "processing", "getDummies", "enabled"],
-                    )
-                    and column
-                    in ConfigParser.get_value(
-                        self.configuration,
-                        ["data", "processing", "getDummies", "columns"],
-                    )
-                ):
-                    dataset[column] = pd.Categorical(
-                        dataset[column], categories=categories, ordered=True
-                    )
+        for column, categories in self.configuration.ordered.items():
+            dataset[column] = pd.Categorical(
+                dataset[column], categories=categories, ordered=True
+            )
         self.logger.info("Data processed successfully")
         return dataset
@@ -0,0 +1,100 @@
+import json
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from src.utils.config import Configuration
+
+ENCODER_FILENAME = "encoder.json"
+
+
+class FeatureEncoder:
+    """
+    Frozen feature layout of a trained model. It turns raw payloads into the exact
+    feature matrix the model was fitted on, without going through pandas.
+    """
+
+    def __init__(
+        self,
+        columns: List[str],
+        dummies: Dict[str, List[str]],
+        ordered: Dict[str, List[str]],
+        dropped: List[str],
+    ) -> None:
+        self.columns = list(columns)
+        self.dummies = {column: list(categories) for column, categories in dummies.items()}
+        self.ordered = {column: list(categories) for column, categories in ordered.items()}
+        self.dropped = list(dropped)
+        self._plan = self._compile()
+
+    @classmethod
+    def from_configuration(cls, configuration: Configuration, columns: List[str]) -> "FeatureEncoder":
+        """
+        Build the encoder mirroring the steps of DataPreparation._data_processing.
+        """
+        return cls(
+            columns=columns,
+            dummies=configuration.dummies,
+            ordered=configuration.ordered,
+            dropped=configuration.cleaning_dropped_columns
+            + configuration.processing_dropped_columns,
+        )
+
+    def _compile(self) -> list:
+        # pd.get_dummies(drop_first=True) names columns "<column>_<category>" and skips the first category
+        dummy_columns = {
+            f"{column}_{category}": (column, category)
+            for column, categories in self.dummies.items()
+            for category in categories[1:]
+        }
+        ordered_codes = {
+            column: {category: code for code, category in enumerate(categories)}
+            for column, categories in self.ordered.items()
+        }
+        plan = []
+        for column in self.columns:
+            if column in ordered_codes:
+                plan.append(("ordered", column, ordered_codes[column]))
+            elif column in dummy_columns:
+                plan.append(("dummy", *dummy_columns[column]))
+            else:
+                plan.append(("numeric", column, None))
+        return plan
+
+    def transform(self, payloads: List[dict]) -> np.ndarray:
+        """
+        Encode a list of payloads into a (len(payloads), len(columns)) feature matrix.
+        Unknown categories are encoded as all-zero dummies or as missing ordered codes,
+        as pandas does.
+        """
+        values = {
+            source: [payload[source] for payload in payloads]
+            for _, source, _ in self._plan
+        }
+        features = np.empty((len(payloads), len(self._plan)), dtype=np.float64)
+        for i, (kind, source, value) in enumerate(self._plan):
+            if kind == "numeric":
+                features[:, i] = values[source]
+            elif kind == "dummy":
+                features[:, i] = [category == value for category in values[source]]
+            else:
+                features[:, i] = [value.get(category, np.nan) for category in values[source]]
+        return features
+
+    def to_dict(self) -> dict:
+        return {
+            "columns": self.columns,
+            "dummies": self.dummies,
+            "ordered": self.ordered,
+            "dropped": self.dropped,
+        }
+
+    def save(self, path: Path) -> None:
+        with open(path, "w") as json_file:
+            json.dump(self.to_dict(), json_file, indent=4)
+
+    @classmethod
+    def load(cls, path: Path) -> "FeatureEncoder":
+        with open(path) as json_file:
+            return cls(**json.load(json_file))
@@ -1,3 +1,4 @@
+from concurrent.futures import ProcessPoolExecutor
 import functools
 import json
 from logging import Logger
@@ -5,40 +6,63 @@ from pathlib import Path
 import time
 
 import joblib
-import optuna
 import pandas as pd
 
-from src.utils.optuna_objective import OptunaUtils
-from src.const.transformation import TRANSFORMATIONS
 from src.utils.exploration import ExplorationUtils
 from src.const.metric import METRICS
 from src.const.model import ModelFactory
 from src.model.data_preparation import DataPreparation
+from src.model.feature_encoder import ENCODER_FILENAME, FeatureEncoder
+from src.model.native_model import NativeModelUtils
 from src.utils.config import ConfigParser
+from src.utils.profiler import RunProfiler
+from src.utils.transformation import TransformationUtils
 
 
 class ModelTrainer:
     def __init__(self, config_file: Path, logger: Logger) -> None:
-        self.configuration = ConfigParser.retrieve_config(config_file)
+        self.configuration = ConfigParser.load(config_file)
         self.logger = logger
-        self.data = DataPreparation(config_file=config_file, logger=self.logger)
+        self.metrics = {}
+        self.profiler = RunProfiler.from_configuration(self.configuration, self.logger)
+        self.data = DataPreparation(
+            config_file=config_file,
+            logger=self.logger,
+            configuration=self.configuration,
+            profiler=self.profiler,
+        )
+
+    @property
+    def model_epoch_folder(self) -> Path:
+        return self.data.model_epoch_folder
+
+    def prepare_data(self) -> None:
         self.x_train, self.x_test, self.y_train, self.y_test = self.data.run()
-        self.model_epoch_folder = self.data.model_epoch_folder
 
     def run(self) -> None:
-        if ConfigParser.get_value(self.configuration, ["model", "enabled"]):
-            self.logger.info("Training model...")
-            self.y_train = self.transformation(self.y_train)
-            self._train()
-            self.pred = self.inverse_transformation(self.pred)
-            self._metrics_generation()
-            self._model_exploration()
-            self._save_model()
-            self.logger.info("Model training completed successfully")
-        else:
-            self.logger.info(
-                "Model training is disabled, stopping after data preparation"
-            )
+        try:
+            # Data preparation is part of the profiled run, and of the failures it records
+            self.prepare_data()
+            if ConfigParser.get_value(self.configuration, ["model", "enabled"]):
+                self.logger.info("Training model...")
+                self.y_train = self.transformation(self.y_train)
+                self._train()
+                self.pred = self.inverse_transformation(self.pred)
+                with self.profiler.phase("metrics"):
+                    self._metrics_generation()
+                with self.profiler.phase("explore_model"):
+                    self._model_exploration()
+                with self.profiler.phase("save"):
+                    self._save_model()
+                self.logger.info("Model training completed successfully")
+            else:
+                self.logger.info(
+                    "Model training is disabled, stopping after data preparation"
+                )
+        finally:
+            # Failed runs keep the profile of the phases they went through, once they have a folder
+            if hasattr(self.data, "model_epoch_folder"):
+                self.profiler.save(self.model_epoch_folder)
 
     def _train(self) -> None:
         model_name = ConfigParser.get_value(self.configuration, ["model", "type"])
@@ -48,14 +72,37 @@ class ModelTrainer:
         if ConfigParser.get_value(
             self.configuration, ["model", "optuna_tuning", "enabled"]
         ):
-            model_params = self._tuning(model_name, model_params)
-        self.model = ModelFactory.create_model(model_name, **model_params)
+            with self.profiler.phase("tune"):
+                model_params = self._tuning(model_name, model_params)
+        native_api = False
+        if model_name == "xgb_regression":
+            native_api = ConfigParser.get_value(
+                self.configuration, ["model", "xgboost", "nativeApi"]
+            )
+            model_params = {
+                **model_params,
+                "max_bin": ConfigParser.get_value(
+                    self.configuration, ["model", "xgboost", "maxBin"]
+                ),
+            }
+        self.model = ModelFactory.create_model(
+            model_name, native_api=native_api, **model_params
+        )
+        if native_api:
+            from src.utils.xgboost_utils import DMatrixCache
+
+            # The trial matrices were built on the tuning split, the final fit can't reuse them
+            DMatrixCache.clear()
         start_time = time.time()
-        self.model.fit(self.x_train, self.y_train)
+        with self.profiler.phase("fit"):
+            self.model.fit(self.x_train, self.y_train)
         end_time = time.time()
         elapsed_time = end_time - start_time
         self.logger.info(f"Time elapsed for model training: {elapsed_time} seconds")
-        self.pred = self.model.predict(self.x_test)
+        with self.profiler.phase("predict"):
+            self.pred = self.model.predict(self.x_test)
+        if native_api:
+            DMatrixCache.clear()
 
     def _metrics_generation(self) -> None:
         self.logger.info("Generating metrics...")
@@ -77,8 +124,7 @@ class ModelTrainer:
         self.logger.info("Metrics generation completed successfully")
 
     def _save_metrics(self, metrics: dict) -> None:
-        self.configuration.setdefault("evaluation", {})
-        self.configuration["evaluation"]["metrics"] = metrics
+        self.metrics = metrics
 
     def _save_model(self) -> None:
         if ConfigParser.get_value(self.configuration, ["model", "save", "enabled"]):
@@ -89,8 +135,26 @@ class ModelTrainer:
                 )
             )
             joblib.dump(self.model, model_path)
+            if ConfigParser.get_value(
+                self.configuration, ["model", "save", "native", "enabled"]
+            ):
+                native_path = NativeModelUtils.export(
+                    self.model,
+                    ConfigParser.get_value(self.configuration, ["model", "type"]),
+                    self.model_epoch_folder,
+                    booster_format=ConfigParser.get_value(
+                        self.configuration, ["model", "save", "native", "format"]
+                    ),
+                )
+                self.logger.info(f"Native model exported to {native_path}")
+            FeatureEncoder.from_configuration(
+                self.configuration, columns=list(self.x_train.columns)
+            ).save(self.model_epoch_folder.joinpath(ENCODER_FILENAME))
+            # The snapshot is the configuration of the run, together with its metrics
+            snapshot = self.configuration.to_dict()
+            snapshot.setdefault("evaluation", {})["metrics"] = self.metrics
             with open(self.model_epoch_folder.joinpath("config.json"), 'w') as json_file:
-                json.dump(self.configuration, json_file, indent=4)
+                json.dump(snapshot, json_file, indent=4)
             self.logger.info("Model saved successfully")
 
     def _model_exploration(self) -> pd.Series | None:
@@ -103,44 +167,18 @@ class ModelTrainer:
             )
 
     def transformation(self, data) -> pd.Series:
-        if ConfigParser.get_value(
-            self.configuration, ["model", "transformation", "enabled"]
-        ):
-            self.logger.info("Transforming data...")
-            for transformation in ConfigParser.get_value(
-                self.configuration, ["model", "transformation", "func"]
-            ):
-                if transformation not in TRANSFORMATIONS:
-                    self.logger.error(
-                        f"Transformation {transformation} not found in TRANSFORMATIONS constant"
-                    )
-                else:
-                    return TRANSFORMATIONS[transformation]["func"](data)
-        else:
-            return data
-        return pd.Series([])
+        return TransformationUtils.transformation(self.configuration, data, self.logger)
 
     def inverse_transformation(self, data) -> pd.Series:
-        if ConfigParser.get_value(
-            self.configuration, ["model", "transformation", "enabled"]
-        ):
-            self.logger.info("Inverse transforming data...")
-            for transformation in ConfigParser.get_value(
-                self.configuration, ["model", "transformation", "func"]
-            ):
-                if transformation not in TRANSFORMATIONS:
-                    self.logger.error(
-                        f"Transformation {transformation} not found in TRANSFORMATIONS constant"
-                    )
-                else:
-                    return TRANSFORMATIONS[transformation]["inverse_func"](
-                        data
-                    )
-        else:
-            return data
-        return pd.Series([])
+        return TransformationUtils.inverse_transformation(
+            self.configuration, data, self.logger
+        )
 
     def _tuning(self, model_name: str, model_params: dict) -> dict:
+        import optuna
+
+        from src.utils.optuna_objective import FINISHED_STATES, STUDY_FILENAMES, OptunaUtils
+
         self.logger.info("Tuning model...")
         hyperparams = ConfigParser.get_value(
             self.configuration, ["model", "optuna_tuning", "hyperparameters"]
@@ -157,32 +195,142 @@ class ModelTrainer:
             )
         ]
 
-        def objective_with_data(trial):
-            return OptunaUtils.objective(
-                trial=trial,
-                x_train_og=self.x_train,
-                y_train_og=self.y_train,
-                test_size=test_size,
-                random_state=random_state,
-                metric=metric,
-                model_name=model_name,
-                model_params=model_params,
-                hyperparams=hyperparams,
-                logger=self.logger,
+        pruning = ConfigParser.get_value(
+            self.configuration, ["model", "optuna_tuning", "pruning", "enabled"]
+        )
+        pruner = OptunaUtils.create_pruner(
+            pruning,
+            ConfigParser.get_value(
+                self.configuration, ["model", "optuna_tuning", "pruning", "warmupSteps"]
+            ),
+        )
+
+        # Trials share the same encoded split instead of rebuilding it every time
+        x_train, x_valid, y_train, y_valid = OptunaUtils.prepare_data(
+            self.x_train, self.y_train, self.configuration.target, test_size, random_state
+        )
+        objective_kwargs = dict(
+            x_train=x_train,
+            x_valid=x_valid,
+            y_train=y_train,
+            y_valid=y_valid,
+            metric=metric,
+            model_name=model_name,
+            model_params=model_params,
+            hyperparams=hyperparams,
+            early_stopping_rounds=ConfigParser.get_value(
+                self.configuration, ["model", "optuna_tuning", "earlyStoppingRounds"]
+            ),
+            pruning=pruning,
+            native_api=ConfigParser.get_value(
+                self.configuration, ["model", "xgboost", "nativeApi"]
+            ),
+            max_bin=ConfigParser.get_value(
+                self.configuration, ["model", "xgboost", "maxBin"]
+            ),
+            logger=self.logger,
+        )
+        n_trials = ConfigParser.get_value(
+            self.configuration, ["model", "optuna_tuning", "nTrials"]
+        )
+        n_jobs = ConfigParser.get_value(
+            self.configuration, ["model", "optuna_tuning", "nJobs"]
+        )
+        timeout = ConfigParser.get_value(
+            self.configuration, ["model", "optuna_tuning", "timeout"]
+        )
+        backend = ConfigParser.get_value(
+            self.configuration, ["model", "optuna_tuning", "storage", "backend"]
+        )
+        storage = None
+        if ConfigParser.get_value(
+            self.configuration, ["model", "optuna_tuning", "storage", "enabled"]
+        ):
+            # Resuming reuses the storage of an earlier, interrupted, epoch
+            resume_epoch = ConfigParser.get_value(
+                self.configuration, ["model", "optuna_tuning", "storage", "resumeEpoch"]
             )
+            study_folder = (
+                self.model_epoch_folder.parent.joinpath(str(resume_epoch))
+                if resume_epoch
+                else self.model_epoch_folder
+            )
+            storage = (backend, study_folder.joinpath(STUDY_FILENAMES[backend]))
+            self.logger.info(f"Optuna study stored in {storage[1]}")
+        elif n_jobs > 1:
+            raise ValueError("Parallel tuning requires the Optuna storage to be enabled")
 
         study = optuna.create_study(
             direction=ConfigParser.get_value(
                 self.configuration, ["model", "optuna_tuning", "direction"]
             ),
-            study_name=model_name
+            study_name=model_name,
+            storage=OptunaUtils.create_storage(*storage) if storage else None,
+            pruner=pruner,
+            load_if_exists=True,
         )
-        study.optimize(
-            objective_with_data,
-            n_trials=ConfigParser.get_value(
-                self.configuration, ["model", "optuna_tuning", "nTrials"]
-            ),
-        )
-        best_params = study.best_params
+        if ConfigParser.get_value(
+            self.configuration, ["model", "optuna_tuning", "warmStart", "enabled"]
+        ):
+            previous_study = optuna.load_study(
+                study_name=model_name,
+                storage=OptunaUtils.create_storage(
+                    backend,
+                    self.model_epoch_folder.parent.joinpath(
+                        str(ConfigParser.get_value(
+                            self.configuration, ["model", "optuna_tuning", "warmStart", "epoch"]
+                        ))
+                    ).joinpath(STUDY_FILENAMES[backend]),
+                ),
+            )
+            OptunaUtils.warm_start(
+                study,
+                previous_study,
+                n_trials=ConfigParser.get_value(
+                    self.configuration, ["model", "optuna_tuning", "warmStart", "nTrials"]
+                ),
+                logger=self.logger,
+            )
+
+        finished_trials = len(study.get_trials(deepcopy=False, states=FINISHED_STATES))
+        if finished_trials >= n_trials:
+            self.logger.info(f"Study already has {finished_trials} finished trials")
+        elif n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(
+                        OptunaUtils.optimize,
+                        study_name=model_name,
+                        storage=storage,
+                        n_trials=n_trials,
+                        timeout=timeout,
+                        pruner=pruner,
+                        **objective_kwargs,
+                    )
+                    for _ in range(n_jobs)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            study.optimize(
+                functools.partial(OptunaUtils.objective, **objective_kwargs),
+                n_trials=n_trials,
+                timeout=timeout,
+                callbacks=[optuna.study.MaxTrialsCallback(n_trials, states=FINISHED_STATES)],
+            )
+        self.profiler.record_trials([
+            {
+                "number": trial.number,
+                "state": trial.state.name,
+                "value": trial.value,
+                "seconds": None if trial.duration is None else trial.duration.total_seconds(),
+            }
+            for trial in study.get_trials(deepcopy=False)
+        ])
+        best_params = dict(study.best_params)
+        # The best trial was scored with boosting stopped early, the final model stops there too
+        best_iteration = study.best_trial.user_attrs.get("best_iteration")
+        if best_iteration is not None:
+            best_params["n_estimators"] = best_iteration + 1
         self.logger.info(f"Best hyperparameters found: {best_params}")
         return best_params
@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+LINEAR_FILENAME = "linear.json"
+BOOSTER_FILENAME = "booster.{format}"
+BOOSTER_FORMATS = ["ubj", "json"]
+
+
+class LinearPredictor:
+    """
+    Linear regression reduced to its coefficients, evaluated as a single dot product. A
+    model fitted on a target frame has 2-D coefficients, one column per target, and keeps
+    returning one column per target as its pickle does.
+    """
+
+    def __init__(self, coefficients: np.ndarray, intercept: Union[float, np.ndarray]) -> None:
+        self.coefficients = np.ascontiguousarray(coefficients, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+
+    @classmethod
+    def from_model(cls, model) -> "LinearPredictor":
+        # scikit-learn computes x @ coef_.T + intercept_
+        return cls(np.asarray(model.coef_).T, model.intercept_)
+
+    def save(self, path: Path) -> None:
+        with open(path, "w") as json_file:
+            json.dump(
+                {"coefficients": self.coefficients.tolist(), "intercept": self.intercept.tolist()},
+                json_file,
+                indent=4,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "LinearPredictor":
+        with open(path) as json_file:
+            data = json.load(json_file)
+        return cls(np.array(data["coefficients"]), data["intercept"])
+
+    def predict(self, x) -> np.ndarray:
+        return np.asarray(x, dtype=np.float64) @ self.coefficients + self.intercept
+
+
+class BoosterPredictor:
+    """
+    Native XGBoost booster, predicted in place on contiguous float32 features and limited
+    to the best iteration when the model was early stopped.
+    """
+
+    def __init__(self, booster) -> None:
+        self.booster = booster
+        self.iteration_range = (0, 0)
+        if "best_iteration" in booster.attributes():
+            self.iteration_range = (0, booster.best_iteration + 1)
+
+    @classmethod
+    def from_model(cls, model) -> "BoosterPredictor":
+        # Both xgboost.XGBRegressor and BoosterRegressor wrap a trained booster
+        if hasattr(model, "get_booster"):
+            return cls(model.get_booster())
+        return cls(model.booster)
+
+    def save(self, path: Path) -> None:
+        self.booster.save_model(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BoosterPredictor":
+        import xgboost
+
+        booster = xgboost.Booster()
+        booster.load_model(path)
+        return cls(booster)
+
+    def predict(self, x) -> np.ndarray:
+        return self.booster.inplace_predict(
+            np.ascontiguousarray(x, dtype=np.float32), iteration_range=self.iteration_range
+        )
+
+
+class NativeModelUtils:
+    @staticmethod
+    def export(model, model_type: str, folder: Path, booster_format: str) -> Path:
+        """
+        Save the inference form of a trained model next to its pickle.
+        """
+        if model_type == "xgb_regression":
+            path = folder.joinpath(BOOSTER_FILENAME.format(format=booster_format))
+            BoosterPredictor.from_model(model).save(path)
+        elif model_type == "linear_regression":
+            path = folder.joinpath(LINEAR_FILENAME)
+            LinearPredictor.from_model(model).save(path)
+        else:
+            raise ValueError(f"Unknown model type: {model_type}")
+        return path
+
+    @staticmethod
+    def load(folder: Path, model_type: str) -> Optional[Union[BoosterPredictor, LinearPredictor]]:
+        """
+        Load the inference form saved in folder, or None when the epoch has none.
+        """
+        if model_type == "xgb_regression":
+            for booster_format in BOOSTER_FORMATS:
+                path = folder.joinpath(BOOSTER_FILENAME.format(format=booster_format))
+                if path.exists():
+                    return BoosterPredictor.load(path)
+        elif model_type == "linear_regression":
+            path = folder.joinpath(LINEAR_FILENAME)
+            if path.exists():
+                return LinearPredictor.load(path)
+        return None
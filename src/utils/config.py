@@ -1,13 +1,291 @@
+from collections.abc import Mapping
+from functools import cached_property
 import json
 from pathlib import Path
-from typing import Any, List
+from typing import Any, Dict, List, Tuple
 
 from src.const.path import CONFIG_FOLDER
 
 DEFAULT_CONFIG = CONFIG_FOLDER.joinpath("default.json")
 
+# Keys read by the pipeline, checked when a configuration is loaded rather than when they are first used
+REQUIRED_KEYS = [
+    ["data", "name"],
+    ["data", "source", "getLocal"],
+    ["data", "source", "url"],
+    ["data", "source", "localPath"],
+    ["data", "schema", "enabled"],
+    ["data", "schema", "dtypes"],
+    ["data", "schema", "categories"],
+    ["data", "cache", "enabled"],
+    ["data", "streaming", "enabled"],
+    ["data", "streaming", "chunkSize"],
+    ["data", "cleaning", "dropColumns", "enabled"],
+    ["data", "cleaning", "dropColumns", "columns"],
+    ["data", "cleaning", "dropDuplicates"],
+    ["data", "cleaning", "dropNa"],
+    ["data", "cleaning", "dropCustom", "enabled"],
+    ["data", "cleaning", "dropCustom", "columns"],
+    ["data", "exploration", "nJobs"],
+    ["data", "exploration", "figsize", "width"],
+    ["data", "exploration", "figsize", "height"],
+    ["data", "exploration", "scatter_matrix", "enabled"],
+    ["data", "exploration", "scatter_matrix", "maxRows"],
+    ["data", "exploration", "scatter_matrix", "stratify"],
+    ["data", "exploration", "hist", "enabled"],
+    ["data", "exploration", "hist", "maxRows"],
+    ["data", "exploration", "hist", "stratify"],
+    ["data", "exploration", "hist", "bins"],
+    ["data", "exploration", "categorical", "enabled"],
+    ["data", "exploration", "categorical", "maxRows"],
+    ["data", "exploration", "categorical", "stratify"],
+    ["data", "exploration", "categorical", "columns"],
+    ["data", "processing", "dropColumnsPostExploration", "enabled"],
+    ["data", "processing", "dropColumnsPostExploration", "columns"],
+    ["data", "processing", "getDummies", "enabled"],
+    ["data", "processing", "getDummies", "columns"],
+    ["data", "processing", "orderCategorical", "enabled"],
+    ["data", "processing", "orderCategorical", "columns"],
+    ["data", "processing", "trainTestSplit", "target"],
+    ["data", "processing", "trainTestSplit", "testSize"],
+    ["data", "processing", "trainTestSplit", "randomState"],
+    ["model", "enabled"],
+    ["model", "type"],
+    ["model", "parameters"],
+    ["model", "evaluation", "enabled"],
+    ["model", "evaluation", "metrics"],
+    ["model", "save", "enabled"],
+    ["model", "save", "filename"],
+    ["model", "save", "native", "enabled"],
+    ["model", "save", "native", "format"],
+    ["model", "profiling", "enabled"],
+    ["model", "profiling", "traceMemory"],
+    ["model", "profiling", "cProfile"],
+    ["model", "exploration", "gof", "enabled"],
+    ["model", "transformation", "enabled"],
+    ["model", "transformation", "func"],
+    ["model", "xgboost", "nativeApi"],
+    ["model", "xgboost", "maxBin"],
+    ["model", "optuna_tuning", "enabled"],
+    ["model", "optuna_tuning", "metric"],
+    ["model", "optuna_tuning", "nTrials"],
+    ["model", "optuna_tuning", "nJobs"],
+    ["model", "optuna_tuning", "timeout"],
+    ["model", "optuna_tuning", "direction"],
+    ["model", "optuna_tuning", "earlyStoppingRounds"],
+    ["model", "optuna_tuning", "pruning", "enabled"],
+    ["model", "optuna_tuning", "pruning", "warmupSteps"],
+    ["model", "optuna_tuning", "storage", "enabled"],
+    ["model", "optuna_tuning", "storage", "backend"],
+    ["model", "optuna_tuning", "storage", "resumeEpoch"],
+    ["model", "optuna_tuning", "warmStart", "enabled"],
+    ["model", "optuna_tuning", "warmStart", "epoch"],
+    ["model", "optuna_tuning", "warmStart", "nTrials"],
+    ["model", "optuna_tuning", "hyperparameters"],
+    ["deploy", "enabled"],
+    ["deploy", "server", "mode"],
+    ["deploy", "server", "host"],
+    ["deploy", "server", "port"],
+    ["deploy", "server", "debug"],
+    ["deploy", "server", "workers"],
+    ["deploy", "server", "threads"],
+    ["deploy", "server", "workerTimeout"],
+    ["deploy", "server", "requestTimeout"],
+    ["deploy", "server", "gracefulTimeout"],
+    ["deploy", "model_name", "trainOnTheSpot"],
+    ["deploy", "model_name", "epoch"],
+    ["deploy", "similarity", "weights"],
+    ["deploy", "batch", "maxSize"],
+    ["deploy", "cache", "enabled"],
+    ["deploy", "cache", "maxSize"],
+    ["deploy", "cache", "ttlSeconds"],
+    ["deploy", "coalescer", "enabled"],
+    ["deploy", "coalescer", "maxWaitMs"],
+    ["deploy", "coalescer", "maxBatchSize"],
+    ["deploy", "registry", "maxResident"],
+    ["deploy", "registry", "pollInterval"],
+    ["deploy", "registry", "adminTokenEnv"],
+    ["deploy", "metrics", "enabled"],
+    ["deploy", "metrics", "flushInterval"],
+    ["deploy", "metrics", "slowRequests", "enabled"],
+    ["deploy", "metrics", "slowRequests", "thresholdMs"],
+    ["deploy", "metrics", "slowRequests", "sampleSize"],
+    ["deploy", "interactions", "writer", "asynchronous"],
+    ["deploy", "interactions", "writer", "queueSize"],
+    ["deploy", "interactions", "writer", "batchSize"],
+    ["deploy", "interactions", "writer", "flushInterval"],
+    ["deploy", "interactions", "writer", "policy"],
+    ["deploy", "interactions", "storage", "compact"],
+    ["deploy", "interactions", "storage", "compression"],
+    ["deploy", "interactions", "storage", "headerAllowlist"],
+    ["deploy", "interactions", "storage", "retention"],
+]
+# Keys restricted to a set of values
+ALLOWED_VALUES = {
+    ("model", "type"): ["linear_regression", "xgb_regression"],
+    ("model", "optuna_tuning", "direction"): ["minimize", "maximize"],
+    ("model", "save", "native", "format"): ["ubj", "json"],
+    ("model", "optuna_tuning", "storage", "backend"): ["journal", "sqlite"],
+    ("deploy", "server", "mode"): ["development", "production"],
+    ("deploy", "interactions", "writer", "policy"): ["drop", "block"],
+}
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict, still accepted wherever a dict is expected.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Configuration is immutable")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+class FrozenList(list):
+    """
+    Read-only list, still accepted wherever a list is expected.
+    """
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Configuration is immutable")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = clear = sort = reverse = _immutable
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(_freeze(item) for item in value)
+    return value
+
+
+class Configuration(Mapping):
+    """
+    Parsed, validated and immutable configuration. It is indexed as the JSON it was
+    parsed from, so that ConfigParser.get_value works on it, and it exposes the values
+    derived from several keys, computed once.
+    """
+
+    def __init__(self, configuration: dict, validate: bool = True) -> None:
+        object.__setattr__(self, "_configuration", _freeze(configuration))
+        if validate:
+            self.validate()
+
+    def __getitem__(self, key: str) -> Any:
+        return self._configuration[key]
+
+    def __iter__(self):
+        return iter(self._configuration)
+
+    def __len__(self) -> int:
+        return len(self._configuration)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise TypeError("Configuration is immutable")
+
+    def to_dict(self) -> dict:
+        """
+        Mutable deep copy of the configuration, as parsed from JSON.
+        """
+        return json.loads(json.dumps(self._configuration))
+
+    def validate(self) -> None:
+        missing = []
+        for key in REQUIRED_KEYS:
+            try:
+                ConfigParser.get_value(self, key)
+            except (KeyError, TypeError):
+                missing.append(key)
+        if missing:
+            raise ValueError(f"Keys {missing} not found in configuration")
+        for key, allowed in ALLOWED_VALUES.items():
+            value = ConfigParser.get_value(self, list(key))
+            if value not in allowed:
+                raise ValueError(f"Key {list(key)} is {value!r}, expected one of {allowed}")
+        categories = ConfigParser.get_value(self, ["data", "schema", "categories"])
+        for column, dtype in ConfigParser.get_value(self, ["data", "schema", "dtypes"]).items():
+            if dtype == "category" and column not in categories:
+                raise ValueError(f"Categorical column {column} has no categories in the schema")
+        # Derived values are computed now, so that inconsistent sections fail at load time
+        for name in ["target", "dummies", "ordered", "cleaning_dropped_columns", "processing_dropped_columns"]:
+            getattr(self, name)
+
+    @cached_property
+    def target(self) -> List[str]:
+        return list(ConfigParser.get_value(self, ["data", "processing", "trainTestSplit", "target"]))
+
+    @cached_property
+    def dummies(self) -> Dict[str, List[str]]:
+        """
+        Columns one-hot encoded during processing, with their categories. Columns that
+        are also ordered categorical are left to orderCategorical.
+        """
+        if not ConfigParser.get_value(self, ["data", "processing", "getDummies", "enabled"]):
+            return {}
+        ordered = self._enabled_columns("orderCategorical")
+        return {
+            column: categories
+            for column, categories in ConfigParser.get_value(
+                self, ["data", "processing", "getDummies", "columns"]
+            ).items()
+            if column not in ordered
+        }
+
+    @cached_property
+    def ordered(self) -> Dict[str, List[str]]:
+        """
+        Columns cast to ordered categoricals during processing, with their categories.
+        Columns that are also one-hot encoded are left to getDummies.
+        """
+        if not ConfigParser.get_value(self, ["data", "processing", "orderCategorical", "enabled"]):
+            return {}
+        dummies = self._enabled_columns("getDummies")
+        return {
+            column: categories
+            for column, categories in ConfigParser.get_value(
+                self, ["data", "processing", "orderCategorical", "columns"]
+            ).items()
+            if column not in dummies
+        }
+
+    @cached_property
+    def cleaning_dropped_columns(self) -> List[str]:
+        if not ConfigParser.get_value(self, ["data", "cleaning", "dropColumns", "enabled"]):
+            return []
+        return list(ConfigParser.get_value(self, ["data", "cleaning", "dropColumns", "columns"]))
+
+    @cached_property
+    def processing_dropped_columns(self) -> List[str]:
+        if not ConfigParser.get_value(
+            self, ["data", "processing", "dropColumnsPostExploration", "enabled"]
+        ):
+            return []
+        return list(
+            ConfigParser.get_value(
+                self, ["data", "processing", "dropColumnsPostExploration", "columns"]
+            )
+        )
+
+    def _enabled_columns(self, step: str) -> List[str]:
+        if not ConfigParser.get_value(self, ["data", "processing", step, "enabled"]):
+            return []
+        return list(ConfigParser.get_value(self, ["data", "processing", step, "columns"]))
+
 
 class ConfigParser:
+    # Loaded configurations, by path and modification time of their file
+    _loaded: Dict[Tuple[Path, int], Configuration] = {}
+
     @staticmethod
     def retrieve_config(file_path: Path) -> dict:
         """
@@ -15,18 +293,32 @@ class ConfigParser:
         """
         if not file_path.exists():
             file_path = DEFAULT_CONFIG
-        else:
-            try:
-                with open(file_path) as f:
-                    configuration = json.load(f)
-                    return configuration
-            except json.JSONDecodeError as e:
-                raise json.JSONDecodeError("Error decoding JSON") from e
-            except PermissionError as e:
-                raise PermissionError("Permission denied") from e
+        try:
+            with open(file_path) as f:
+                configuration = json.load(f)
+                return configuration
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"Error decoding JSON in {file_path}: {e.msg}", e.doc, e.pos) from e
+        except PermissionError as e:
+            raise PermissionError("Permission denied") from e
+
+    @staticmethod
+    def load(file_path: Path) -> Configuration:
+        """
+        Retrieve and validate the configuration of a JSON file. Every component loading
+        the same, unchanged, file shares the same Configuration.
+        """
+        if not file_path.exists():
+            file_path = DEFAULT_CONFIG
+        key = (file_path.resolve(), file_path.stat().st_mtime_ns)
+        configuration = ConfigParser._loaded.get(key)
+        if configuration is None:
+            configuration = Configuration(ConfigParser.retrieve_config(file_path))
+            ConfigParser._loaded[key] = configuration
+        return configuration
 
     @staticmethod
-    def get_value(config: dict, key: List[str]) -> Any:
+    def get_value(config: Mapping, key: List[str]) -> Any:
         """
         Retrieve a nested value from the configuration dictionary. If it not available, return an error.
         """
@@ -0,0 +1,102 @@
+import hashlib
+import json
+from logging import Logger
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from src.const.path import CACHE_FOLDER
+from src.utils.config import ConfigParser
+from src.utils.files import FileUtils
+
+# Bump when the layout of the cached frames changes, to invalidate older entries
+CACHE_VERSION = 2
+# Configuration subtrees every stage depends on, on top of the source content
+STAGES = {
+    "raw": ["schema"],
+    "cleaned": ["schema", "cleaning"],
+    "processed": ["schema", "cleaning", "processing"],
+}
+
+
+class DatasetCache:
+    """
+    Local Parquet cache of the raw, cleaned and processed dataset. Entries are addressed
+    by the content of the source and by the configuration the stage depends on, so they
+    never need to be invalidated by hand.
+    """
+
+    def __init__(self, configuration: dict, logger: Logger, folder: Path = CACHE_FOLDER) -> None:
+        self.configuration = configuration
+        self.logger = logger
+        self.folder = folder
+        self.enabled = ConfigParser.get_value(configuration, ["data", "cache", "enabled"])
+
+    @staticmethod
+    def file_fingerprint(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as source:
+            for chunk in iter(lambda: source.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def url_fingerprint(self, url: str) -> Optional[str]:
+        """
+        Identify a remote file by its validators, without downloading it. Returns None
+        when the server exposes neither an ETag nor a Last-Modified header.
+        """
+        import requests
+
+        try:
+            response = requests.head(url, allow_redirects=True, timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"Could not validate cached data for URL: {url}. Got error: {e}")
+            return None
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if validator is None:
+            return None
+        return hashlib.sha256(f"{url}\n{validator}".encode()).hexdigest()
+
+    def source_fingerprint(self, get_local: bool, source) -> Optional[str]:
+        if not self.enabled:
+            return None
+        if get_local:
+            return self.file_fingerprint(source)
+        return self.url_fingerprint(str(source))
+
+    def path(self, stage: str, fingerprint: str) -> Path:
+        subtrees = {
+            subtree: ConfigParser.get_value(self.configuration, ["data", subtree])
+            for subtree in STAGES[stage]
+        }
+        key = json.dumps(
+            {"version": CACHE_VERSION, "source": fingerprint, "stage": stage, "config": subtrees},
+            sort_keys=True,
+        )
+        return self.folder.joinpath(f"{stage}_{hashlib.sha256(key.encode()).hexdigest()}.parquet")
+
+    def load(self, stage: str, fingerprint: Optional[str]) -> Optional[pd.DataFrame]:
+        if fingerprint is None:
+            return None
+        path = self.path(stage, fingerprint)
+        if not path.exists():
+            return None
+        try:
+            dataset = pd.read_parquet(path)
+        except Exception as e:
+            self.logger.warning(f"Failed to read cached {stage} data from path: {path}. Got error: {e}")
+            return None
+        self.logger.info(f"Loaded cached {stage} data from {path}")
+        return dataset
+
+    def save(self, stage: str, fingerprint: Optional[str], dataset: pd.DataFrame) -> None:
+        if fingerprint is None:
+            return
+        path = self.path(stage, fingerprint)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        # Concurrent readers never see a partial file
+        with FileUtils.atomic_write(path) as temporary_path:
+            dataset.to_parquet(temporary_path)
+        self.logger.info(f"Cached {stage} data in {path}")
@@ -1,41 +1,80 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Tuple
-import matplotlib
+from typing import Callable, List, Optional, Tuple
 import pandas as pd
-import plotly.express as px
-from pandas.plotting import scatter_matrix
-import matplotlib.pyplot as plt
-matplotlib.use('Agg')
 
 
 class ExplorationUtils:
+    # Plotting backends are imported on first use, so that importing this module stays cheap
+    # and that, when plots are rendered in a pool, only the workers load them
+
+    @staticmethod
+    def sample(df: pd.DataFrame, max_rows: Optional[int], stratify: Optional[str], random_state: int) -> pd.DataFrame:
+        """
+        Sample at most max_rows rows, keeping the proportions of the categories of the
+        stratify column when it is set.
+        """
+        if max_rows is None or len(df) <= max_rows:
+            return df
+        if stratify is None:
+            return df.sample(n=max_rows, random_state=random_state)
+        return df.groupby(stratify, observed=True, group_keys=False).sample(
+            frac=max_rows / len(df), random_state=random_state
+        )
+
+    @staticmethod
+    def render(plots: List[Tuple[Callable, dict]], n_jobs: int) -> None:
+        """
+        Render the plots, concurrently in a pool of n_jobs processes when n_jobs is greater than 1.
+        """
+        if n_jobs <= 1 or len(plots) <= 1:
+            for plot, kwargs in plots:
+                plot(**kwargs)
+            return
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(plots))) as executor:
+            futures = [executor.submit(plot, **kwargs) for plot, kwargs in plots]
+            for future in futures:
+                future.result()
+
+    @staticmethod
+    def _pyplot():
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        return plt
 
     @staticmethod
     def scatter_matrix_plot(df: pd.DataFrame, figsize: Tuple[int, int], path: Path):
+        from pandas.plotting import scatter_matrix
+        plt = ExplorationUtils._pyplot()
         scatter_matrix(df.select_dtypes(include=["number"]), figsize=figsize)
         plt.savefig(path)
         plt.close()
 
     @staticmethod
     def hist_plot(df: pd.DataFrame, bins: int, figsize: Tuple[int, int], path: Path):
+        plt = ExplorationUtils._pyplot()
         df.hist(bins=bins, figsize=figsize)
         plt.savefig(path)
         plt.close()
 
     @staticmethod
     def violin_plot_by_price(df: pd.DataFrame, column: str, path: Path):
+        import plotly.express as px
         fig = px.violin(df, x=column, y='price', color=column, title=f'Price by {column}')
         fig.write_image(str(path))
         del fig
 
     @staticmethod
     def scatter_plot_by_price_vs_carat(df: pd.DataFrame, column: str, path: Path):
+        import plotly.express as px
         fig = px.scatter(df, x='carat', y='price', color=column, title=f'Price vs carat with {column}')
         fig.write_image(str(path))
         del fig
 
     @staticmethod
     def plot_gof(y_test, pred, path: Path):
+        plt = ExplorationUtils._pyplot()
         plt.plot(y_test, pred, '.')
         plt.plot(y_test, y_test, linewidth=3, c='black')
         plt.xlabel('Actual')
@@ -0,0 +1,24 @@
+import contextlib
+import os
+from pathlib import Path
+import threading
+from typing import Iterator
+
+
+class FileUtils:
+    @staticmethod
+    @contextlib.contextmanager
+    def atomic_write(path: Path) -> Iterator[Path]:
+        """
+        Yield a temporary path next to path, and move it over path once the block succeeds.
+        Readers see either the previous file or the complete new one, never a partial one.
+        The temporary file is removed when the block fails.
+        """
+        # Unique per thread, so that concurrent writers of the same file never share it
+        temporary_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            yield temporary_path
+            os.replace(temporary_path, path)
+        except BaseException:
+            temporary_path.unlink(missing_ok=True)
+            raise
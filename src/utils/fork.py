@@ -0,0 +1,48 @@
+import os
+import threading
+from typing import Callable
+import weakref
+
+
+class ForkUtils:
+    @staticmethod
+    def after_fork_in_child(method: Callable[[], None]) -> None:
+        """
+        Call the bound method in every forked child, as long as its object is alive. The
+        object is only weakly referenced, fork handlers can't be unregistered.
+        """
+        reference = weakref.WeakMethod(method)
+
+        def callback() -> None:
+            method = reference()
+            if method is not None:
+                method()
+
+        os.register_at_fork(after_in_child=callback)
+
+
+class ForkSafeLock:
+    """
+    Lock replaced by a new one in a forked child. A thread of the parent holding it at
+    fork time does not exist in the child, which would otherwise never get it released.
+    """
+
+    def __init__(self, factory: Callable = threading.Lock) -> None:
+        self._factory = factory
+        self._lock = factory()
+        ForkUtils.after_fork_in_child(self._renew)
+
+    def _renew(self) -> None:
+        self._lock = self._factory()
+
+    def acquire(self, *args, **kwargs) -> bool:
+        return self._lock.acquire(*args, **kwargs)
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> bool:
+        return self._lock.__enter__()
+
+    def __exit__(self, *args) -> None:
+        self._lock.__exit__(*args)
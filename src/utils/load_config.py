@@ -1,19 +1,23 @@
 import io
 from pathlib import Path
-import optuna
+from typing import TYPE_CHECKING, Iterator, Optional
 import pandas as pd
 from logging import Logger
-import requests
+
+if TYPE_CHECKING:
+    import optuna
 
 
 class LoadUtils:
     @staticmethod
-    def load_url(url: str, logger: Logger) -> pd.DataFrame:
+    def load_url(url: str, logger: Logger, dtype: Optional[dict] = None) -> pd.DataFrame:
+        import requests
+
         try:
             logger.info(f"Fetching data from URL: {url}")
             response = requests.get(url)
             response.raise_for_status()
-            data = pd.read_csv(io.BytesIO(response.content))
+            data = pd.read_csv(io.BytesIO(response.content), dtype=dtype)
             logger.info("Data fetched and read into DataFrame successfully")
         except requests.exceptions.RequestException as e:
             logger.error(f"Request failed for URL: {url}. Got error: {e}")
@@ -32,16 +36,28 @@ class LoadUtils:
         return data
 
     @staticmethod
-    def load_path(path: Path, logger: Logger) -> pd.DataFrame:
+    def load_path(path: Path, logger: Logger, dtype: Optional[dict] = None) -> pd.DataFrame:
         try:
-            data = pd.read_csv(path)
+            data = pd.read_csv(path, dtype=dtype)
         except Exception as e:
             logger.error(f"Failed to read data from path: {path}. Got error: {e}")
             raise
         return data
 
     @staticmethod
-    def load_hyperparams(trial: optuna.trial.Trial, model_name: str, model_constant_params: dict, hyperparams: dict, logger: Logger) -> dict:
+    def load_chunks(source: Path | str, chunk_size: int, logger: Logger, dtype: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+        """
+        Read a CSV file or url lazily, chunk_size rows at a time.
+        """
+        try:
+            with pd.read_csv(source, chunksize=chunk_size, dtype=dtype) as reader:
+                yield from reader
+        except Exception as e:
+            logger.error(f"Failed to read data in chunks from: {source}. Got error: {e}")
+            raise
+
+    @staticmethod
+    def load_hyperparams(trial: "optuna.trial.Trial", model_name: str, model_constant_params: dict, hyperparams: dict, logger: Logger) -> dict:
         # Define hyperparameters to tune using trial.suggest_* methods directly
         param = {}
         for param_name, param_info in hyperparams.items():
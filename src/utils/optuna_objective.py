@@ -1,4 +1,7 @@
+import functools
 from logging import Logger
+from pathlib import Path
+from typing import Optional, Tuple
 import optuna
 from sklearn.model_selection import train_test_split
 
@@ -8,18 +11,116 @@ from src.utils.load_config import LoadUtils
 from sklearn.preprocessing import LabelEncoder
 
 
+STUDY_FILENAMES = {
+    "journal": "optuna_study.log",
+    "sqlite": "optuna_study.db",
+}
+FINISHED_STATES = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+
+
 class OptunaUtils:
+    @staticmethod
+    def create_storage(backend: str, path: Path) -> optuna.storages.BaseStorage:
+        """
+        Create a persistent local storage, that can be shared by processes on the same machine.
+        """
+        if backend == "journal":
+            return optuna.storages.JournalStorage(
+                optuna.storages.journal.JournalFileBackend(str(path))
+            )
+        elif backend == "sqlite":
+            return optuna.storages.RDBStorage(f"sqlite:///{path}")
+        else:
+            raise ValueError(f"Unknown Optuna storage backend: {backend}")
+
+    @staticmethod
+    def create_pruner(enabled: bool, warmup_steps: int) -> optuna.pruners.BasePruner:
+        """
+        Prune trials whose intermediate score is worse than the median of the previous
+        trials at the same step, once warmup_steps steps have been reported.
+        """
+        if enabled:
+            return optuna.pruners.MedianPruner(n_warmup_steps=warmup_steps)
+        return optuna.pruners.NopPruner()
+
+    @staticmethod
+    def warm_start(study: optuna.study.Study, previous_study: optuna.study.Study, n_trials: int, logger: Logger) -> None:
+        """
+        Enqueue the parameters of the best n_trials completed trials of a previous study.
+        """
+        trials = previous_study.get_trials(
+            deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)
+        )
+        trials = sorted(
+            trials,
+            key=lambda trial: trial.value,
+            reverse=previous_study.direction == optuna.study.StudyDirection.MAXIMIZE,
+        )[:n_trials]
+        for trial in trials:
+            study.enqueue_trial(trial.params, skip_if_exists=True)
+        logger.info(f"Warm starting the study with {len(trials)} trials")
+
+    @staticmethod
+    def optimize(
+        study_name: str,
+        storage: Tuple[str, Path],
+        n_trials: int,
+        timeout: Optional[float],
+        pruner: optuna.pruners.BasePruner,
+        **objective_kwargs,
+    ) -> None:
+        """
+        Run trials of a stored study until it has n_trials finished trials, or until timeout
+        seconds have passed. Can be run concurrently by several processes.
+        """
+        study = optuna.load_study(
+            study_name=study_name,
+            storage=OptunaUtils.create_storage(*storage),
+            pruner=pruner,
+        )
+        study.optimize(
+            functools.partial(OptunaUtils.objective, **objective_kwargs),
+            n_trials=n_trials,
+            timeout=timeout,
+            callbacks=[optuna.study.MaxTrialsCallback(n_trials, states=FINISHED_STATES)],
+        )
+
+    @staticmethod
+    def prepare_data(x_train_og, y_train_og, target, test_size, random_state) -> tuple:
+        """
+        Encode and split the training data once per study. Trials only read the result.
+        The target is kept as prepared, already transformed, so that the trials are scored
+        on the same values the final model is fitted on.
+        """
+        x_train = x_train_og.copy()
+        y_train = y_train_og[target].copy()
+
+        # Encode categorical columns if needed
+        categorical_cols = ['cut', 'color', 'clarity']
+        for col in categorical_cols:
+            if col in x_train.columns and x_train[col].dtype.name == 'category':
+                x_train[col] = LabelEncoder().fit_transform(x_train[col])
+
+        # Split data
+        return train_test_split(
+            x_train, y_train, test_size=test_size, random_state=random_state
+        )
+
     @staticmethod
     def objective(
         trial: optuna.trial.Trial,
-        x_train_og,
-        y_train_og,
-        test_size,
-        random_state,
+        x_train,
+        x_valid,
+        y_train,
+        y_valid,
         metric,
         model_name,
         model_params,
         hyperparams,
+        early_stopping_rounds: Optional[int],
+        pruning: bool,
+        native_api: bool,
+        max_bin: int,
         logger: Logger,
     ) -> float:
         params = LoadUtils.load_hyperparams(
@@ -30,39 +131,26 @@ class OptunaUtils:
             logger=logger,
         )
 
-        # Deep copy original data to avoid modification between trials
-        x_train = x_train_og.copy()
-        y_train = y_train_og.copy()
-
-        # Encode categorical columns if needed
-        categorical_cols = ['cut', 'color', 'clarity']
-        label_encoders = {}
-        for col in categorical_cols:
-            if x_train[col].dtype.name == 'category':
-                label_encoders[col] = LabelEncoder()
-                x_train[col] = label_encoders[col].fit_transform(x_train[col])
-
-        # Ensure y_train["price"] is of integer type
-        y_train["price"] = y_train["price"].astype("int")
+        fit_params = {}
+        if model_name == "xgb_regression":
+            from src.utils.xgboost_utils import PruningCallback
 
-        # Split data
-        x_train_split, x_test, y_train_split, y_test = train_test_split(
-            x_train, y_train, test_size=test_size, random_state=random_state
-        )
-
-        # Create the model with the parameters and enable categorical handling if necessary
-        model = ModelFactory.create_model(model_name, **params)
-        if model_name.startswith('xgboost'):
-            params['enable_categorical'] = True
+            # Boosting stops once the validation fold stops improving, and the pruner
+            # compares its intermediate scores with the ones of the other trials
+            params["early_stopping_rounds"] = early_stopping_rounds
+            params["max_bin"] = max_bin
+            if pruning:
+                params["callbacks"] = [PruningCallback(trial)]
+            fit_params = {"eval_set": [(x_valid, y_valid)], "verbose": False}
 
-        # Fit the model
-        model.fit(x_train_split, y_train_split)
-        pred = model.predict(x_test)
-        evaluation = metric(y_test, pred)
+        model = ModelFactory.create_model(model_name, native_api=native_api, **params)
+        model.fit(x_train, y_train, **fit_params)
+        if model_name == "xgb_regression":
+            # The trial is scored at its early-stopped round, which the final fit reuses
+            booster = model.booster if native_api else model.get_booster()
+            if "best_iteration" in booster.attributes():
+                trial.set_user_attr("best_iteration", booster.best_iteration)
+        pred = model.predict(x_valid)
+        evaluation = metric(y_valid, pred)
         logger.info(f"Evaluation for hyperparameters: {evaluation}")
-
-        # Reverse label encoding for categorical columns
-        for col, encoder in label_encoders.items():
-            x_train[col] = encoder.inverse_transform(x_train[col])
-
         return evaluation
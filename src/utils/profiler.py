@@ -0,0 +1,130 @@
+import cProfile
+from contextlib import contextmanager, nullcontext
+import json
+from logging import Logger
+from pathlib import Path
+import time
+import tracemalloc
+from typing import List, Mapping, Optional
+
+import pandas as pd
+
+from src.utils.config import ConfigParser
+from src.utils.resources import ResourceUtils
+
+PROFILE_FILENAME = "profile.json"
+CPROFILE_FILENAME = "profile.prof"
+
+
+class RunProfiler:
+    """
+    Wall-clock time, CPU time and peak memory of each phase of a training run, with the
+    shape of the dataset at each stage and the duration of each tuning trial. Phases run
+    more than once are summed. With cprofile enabled every phase is profiled and the
+    profile of the slowest one is kept.
+    """
+
+    def __init__(self, trace_memory: bool, cprofile: bool, logger: Logger) -> None:
+        self.trace_memory = trace_memory
+        self.cprofile = cprofile
+        self.logger = logger
+        self.phases = {}
+        self.shapes = {}
+        self.trials = []
+        self._depth = 0
+        self._slowest = None
+        self._start_time = time.perf_counter()
+
+    @classmethod
+    def from_configuration(cls, configuration: Mapping, logger: Logger):
+        """
+        Profiler as configured in model.profiling, or one recording nothing when disabled.
+        """
+        profiling = ConfigParser.get_value(configuration, ["model", "profiling"])
+        if not profiling["enabled"]:
+            return NULL_PROFILER
+        return cls(
+            trace_memory=profiling["traceMemory"], cprofile=profiling["cProfile"], logger=logger
+        )
+
+    @contextmanager
+    def phase(self, name: str):
+        # Only outermost phases reset the traced peak and are profiled, nested ones are only timed
+        outermost = self._depth == 0
+        self._depth += 1
+        if self.trace_memory and outermost:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        profile = cProfile.Profile() if self.cprofile and outermost else None
+        start_time, start_cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self._depth -= 1
+            wall = time.perf_counter() - start_time
+            self._record(name, wall, time.process_time() - start_cpu, outermost)
+            if profile is not None and (self._slowest is None or wall > self._slowest[1]):
+                self._slowest = (name, wall, profile)
+
+    def _record(self, name: str, wall: float, cpu: float, outermost: bool) -> None:
+        phase = self.phases.setdefault(name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+        phase["calls"] += 1
+        phase["wall_s"] += wall
+        phase["cpu_s"] += cpu
+        if self.trace_memory and outermost:
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            phase["tracemalloc_peak_mb"] = max(phase.get("tracemalloc_peak_mb", 0.0), peak)
+        # The resident set peak is the one of the process up to the end of the phase
+        phase["rss_peak_mb"] = ResourceUtils.peak_rss_mb()
+
+    def record_shapes(self, stage: str, *frames: pd.DataFrame | pd.Series) -> None:
+        self.shapes[stage] = [list(frame.shape) for frame in frames] if len(frames) > 1 else list(frames[0].shape)
+
+    def record_trials(self, trials: List[dict]) -> None:
+        self.trials = trials
+
+    def save(self, folder: Path) -> Optional[Path]:
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        profile = {
+            "wall_s": time.perf_counter() - self._start_time,
+            "phases": self.phases,
+            "shapes": self.shapes,
+            "trials": self.trials,
+            "cprofile": None,
+        }
+        if self._slowest is not None:
+            name, _, slowest = self._slowest
+            slowest.dump_stats(folder.joinpath(CPROFILE_FILENAME))
+            profile["cprofile"] = {"phase": name, "filename": CPROFILE_FILENAME}
+        path = folder.joinpath(PROFILE_FILENAME)
+        with open(path, "w") as json_file:
+            json.dump(profile, json_file, indent=4)
+        self.logger.info(f"Run profile saved to {path}")
+        return path
+
+
+class NullProfiler:
+    """
+    Profiler that records nothing, used when the profiling is disabled.
+    """
+
+    def phase(self, name: str):
+        return nullcontext()
+
+    def record_shapes(self, stage: str, *frames: pd.DataFrame | pd.Series) -> None:
+        pass
+
+    def record_trials(self, trials: List[dict]) -> None:
+        pass
+
+    def save(self, folder: Path) -> Optional[Path]:
+        return None
+
+
+NULL_PROFILER = NullProfiler()
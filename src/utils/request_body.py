@@ -1,4 +1,8 @@
-from pydantic import BaseModel, constr, confloat
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, ValidationInfo, conint, conlist, constr, confloat, field_validator, model_validator
+from pydantic_core import PydanticCustomError
+
 
 class PredictPricePayload(BaseModel):
     carat: confloat(gt=0)
@@ -11,8 +15,60 @@ class PredictPricePayload(BaseModel):
     y: confloat(gt=0)
     z: confloat(gt=0)
 
+class PredictPriceBatchPayload(BaseModel):
+    diamonds: conlist(PredictPricePayload, min_length=1)
+
+    @field_validator("diamonds", mode="before")
+    @classmethod
+    def check_batch_size(cls, diamonds, info: ValidationInfo):
+        # The configured limit is passed as validation context, and checked before any diamond is validated
+        max_size = (info.context or {}).get("max_batch_size")
+        if max_size is not None and isinstance(diamonds, list) and len(diamonds) > max_size:
+            raise PydanticCustomError(
+                "too_long",
+                "Batch of {size} diamonds exceeds the limit of {max_size}",
+                {"size": len(diamonds), "max_size": max_size},
+            )
+        return diamonds
+
 class SimilarDiamondsPayload(BaseModel):
     carat: confloat(gt=0)
     cut: constr(min_length=1)
     color: constr(min_length=1)
-    clarity: constr(min_length=1)
\ No newline at end of file
+    clarity: constr(min_length=1)
+    n: conint(gt=0) = 5
+    depth: Optional[confloat(gt=0)] = None
+    table: Optional[confloat(gt=0)] = None
+    x: Optional[confloat(gt=0)] = None
+    y: Optional[confloat(gt=0)] = None
+    z: Optional[confloat(gt=0)] = None
+    metric: Literal["carat", "weighted"] = "carat"
+    filters: List[Literal["cut", "color", "clarity"]] = ["cut", "color", "clarity"]
+
+    @model_validator(mode="after")
+    def check_weighted_attributes(self):
+        if self.metric == "weighted":
+            missing = [name for name in ("depth", "table", "x", "y", "z") if getattr(self, name) is None]
+            if missing:
+                raise PydanticCustomError(
+                    "missing_attributes",
+                    "Weighted similarity requires {missing}",
+                    {"missing": missing},
+                )
+        return self
+
+class ActivateModelPayload(BaseModel):
+    epoch: constr(min_length=1)
+
+class CandidateModelPayload(BaseModel):
+    epoch: Optional[constr(min_length=1)] = None
+    percentage: confloat(ge=0, le=100) = 0
+
+class InteractionsQuery(BaseModel):
+    after_id: conint(ge=0) = 0
+    limit: Optional[conint(gt=0)] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    path: Optional[str] = None
+    status: Optional[int] = None
+    format: Literal["json", "ndjson"] = "json"
\ No newline at end of file
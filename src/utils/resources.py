@@ -0,0 +1,22 @@
+import resource
+import sys
+
+import pandas as pd
+
+
+class ResourceUtils:
+    @staticmethod
+    def peak_rss_mb() -> float:
+        """
+        Peak resident set size of the current process, in MB.
+        """
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+    @staticmethod
+    def frame_memory_mb(*frames: pd.DataFrame | pd.Series) -> float:
+        """
+        Memory used by pandas objects, including the content of Python strings, in MB.
+        """
+        return sum(frame.memory_usage(deep=True).sum() for frame in frames) / (1024 * 1024)
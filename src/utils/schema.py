@@ -0,0 +1,88 @@
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils.config import ConfigParser
+
+
+class SchemaUtils:
+    @staticmethod
+    def _is_integer(dtype: str) -> bool:
+        return dtype != "category" and pd.api.types.is_integer_dtype(pd.api.types.pandas_dtype(dtype))
+
+    @staticmethod
+    def read_dtypes(configuration: dict) -> Optional[dict]:
+        """
+        Dtypes to parse the source with, or None when the schema is disabled. Categorical
+        columns are parsed as strings and get their known categories in categorize, integer
+        columns are parsed as nullable so that missing values survive until cleaning.
+        """
+        if not ConfigParser.get_value(configuration, ["data", "schema", "enabled"]):
+            return None
+        dtypes = {}
+        for column, dtype in ConfigParser.get_value(
+            configuration, ["data", "schema", "dtypes"]
+        ).items():
+            if dtype == "category":
+                dtypes[column] = "string"
+            elif SchemaUtils._is_integer(dtype):
+                dtypes[column] = dtype.replace("uint", "UInt").replace("int", "Int")
+            else:
+                dtypes[column] = dtype
+        return dtypes
+
+    @staticmethod
+    def categorize(configuration: dict, dataset: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        """
+        Cast the categorical columns to their known categories, matching the values whatever
+        their surrounding spaces and case. Returns the dataset and the number of rows with a
+        value outside the categories, which becomes missing.
+        """
+        if not ConfigParser.get_value(configuration, ["data", "schema", "enabled"]):
+            return dataset, 0
+        categories = ConfigParser.get_value(configuration, ["data", "schema", "categories"])
+        coerced = np.zeros(len(dataset), dtype=bool)
+        dataset = dataset.copy(deep=False)
+        for column, dtype in ConfigParser.get_value(
+            configuration, ["data", "schema", "dtypes"]
+        ).items():
+            if dtype != "category" or column not in dataset.columns:
+                continue
+            spellings = {category.strip().casefold(): category for category in categories[column]}
+            values = dataset[column]
+            normalized = values.astype("string").str.strip().str.casefold().map(spellings)
+            dataset[column] = pd.Categorical(normalized, categories=categories[column])
+            coerced |= (values.notna() & dataset[column].isna()).to_numpy()
+        return dataset, int(coerced.sum())
+
+    @staticmethod
+    def finalize(configuration: dict, dataset: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cast the nullable integer columns without missing values to their numpy dtype.
+        """
+        if not ConfigParser.get_value(configuration, ["data", "schema", "enabled"]):
+            return dataset
+        dtypes = {
+            column: dtype
+            for column, dtype in ConfigParser.get_value(
+                configuration, ["data", "schema", "dtypes"]
+            ).items()
+            if column in dataset.columns
+            and SchemaUtils._is_integer(dtype)
+            and not dataset[column].hasnans
+        }
+        return dataset.astype(dtypes) if dtypes else dataset
+
+    @staticmethod
+    def widen(dataset: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cast float32 columns to float64 through their shortest decimal representation,
+        so that a value read as 1.1 is served as 1.1 rather than 1.100000023841858.
+        """
+        columns = dataset.select_dtypes("float32").columns
+        if not len(columns):
+            return dataset
+        return dataset.astype({column: str for column in columns}).astype(
+            {column: "float64" for column in columns}
+        )
@@ -1,4 +1,5 @@
-import numpy as np
+from typing import List
+
 import pandas as pd
 
 
@@ -6,7 +7,11 @@ class ServerUtils:
 
     @staticmethod
     def parse_payload(payload: dict) -> pd.DataFrame:
-        df = pd.DataFrame([payload])
+        return ServerUtils.parse_batch_payload([payload])
+
+    @staticmethod
+    def parse_batch_payload(payloads: List[dict]) -> pd.DataFrame:
+        df = pd.DataFrame(payloads)
         # Convert object types to categorical
         for col in df.select_dtypes(include='object').columns:
             df[col] = df[col].astype('category')
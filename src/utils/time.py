@@ -1,15 +1,24 @@
+import functools
 from logging import Logger
 import time
+from typing import Optional
 
 
-def time_it(logger: Logger):
+def time_it(logger: Logger, timings: Optional[dict] = None):
+    """
+    Log the time taken by each call of the decorated function and, when timings is
+    given, also record it there in seconds under the qualified name of the function.
+    """
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             result = func(*args, **kwargs)
-            end_time = time.time()
+            end_time = time.perf_counter()
             elapsed_time = end_time - start_time
             logger.info(f"Time elapsed {func.__name__}: {elapsed_time} seconds")
+            if timings is not None:
+                timings[func.__qualname__] = elapsed_time
             return result
         return wrapper
     return decorator
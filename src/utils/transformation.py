@@ -0,0 +1,39 @@
+from logging import Logger
+
+import pandas as pd
+
+from src.const.transformation import TRANSFORMATIONS
+from src.utils.config import ConfigParser
+
+
+class TransformationUtils:
+    @staticmethod
+    def transformation(configuration: dict, data, logger: Logger) -> pd.Series:
+        return TransformationUtils._apply(configuration, data, "func", logger)
+
+    @staticmethod
+    def inverse_transformation(configuration: dict, data, logger: Logger) -> pd.Series:
+        return TransformationUtils._apply(configuration, data, "inverse_func", logger)
+
+    @staticmethod
+    def _apply(configuration: dict, data, direction: str, logger: Logger) -> pd.Series:
+        if ConfigParser.get_value(
+            configuration, ["model", "transformation", "enabled"]
+        ):
+            # The inverse transformation runs on every prediction request, it is only logged at debug level
+            if direction == "func":
+                logger.info("Transforming data...")
+            else:
+                logger.debug("Inverse transforming data...")
+            for transformation in ConfigParser.get_value(
+                configuration, ["model", "transformation", "func"]
+            ):
+                if transformation not in TRANSFORMATIONS:
+                    logger.error(
+                        f"Transformation {transformation} not found in TRANSFORMATIONS constant"
+                    )
+                else:
+                    return TRANSFORMATIONS[transformation][direction](data)
+        else:
+            return data
+        return pd.Series([])
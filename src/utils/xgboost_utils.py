@@ -0,0 +1,153 @@
+import functools
+import hashlib
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost
+
+# Parameters of the sklearn wrapper that have a different name in the native API
+NATIVE_PARAMETERS = {
+    "random_state": "seed",
+    "n_jobs": "nthread",
+}
+
+
+class PruningCallback(xgboost.callback.TrainingCallback):
+    """
+    Report the validation score of every boosting round to an Optuna trial, and stop
+    training when the trial should be pruned.
+    """
+
+    def __init__(self, trial) -> None:
+        import optuna
+
+        self.trial = trial
+        # XGBoost evaluation metrics are losses, flip them for maximizing studies
+        self.sign = -1 if trial.study.direction == optuna.study.StudyDirection.MAXIMIZE else 1
+
+    def after_iteration(self, model, epoch: int, evals_log: dict) -> bool:
+        import optuna
+
+        # The last evaluation set is the validation fold, its first metric is reported
+        scores = next(iter(list(evals_log.values())[-1].values()))
+        self.trial.report(self.sign * float(scores[-1]), step=epoch)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"Trial pruned at boosting round {epoch}")
+        return False
+
+
+class DMatrixCache:
+    """
+    Process-wide cache of quantized training matrices, keyed by the content of the data
+    and by the number of bins. The trials of a study fit on the same split, they reuse
+    its histogram cuts instead of quantizing the frames again. The final fit is on the
+    whole training set, it quantizes it once and shares nothing with the trials.
+    """
+
+    _matrices: Dict[Tuple[str, ...], xgboost.QuantileDMatrix] = {}
+    # Frames are hashed once, then recognized by identity while they are alive. They are
+    # only read once split, a frame modified in place would keep its first fingerprint
+    _fingerprints: Dict[int, Tuple[weakref.ref, str]] = {}
+
+    @classmethod
+    def _frame_fingerprint(cls, frame: pd.DataFrame) -> str:
+        cached = cls._fingerprints.get(id(frame))
+        if cached is not None and cached[0]() is frame:
+            return cached[1]
+        digest = hashlib.sha1()
+        digest.update(str(list(zip(frame.columns, frame.dtypes.astype(str)))).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        fingerprint = digest.hexdigest()
+        cls._fingerprints[id(frame)] = (
+            weakref.ref(frame, functools.partial(cls._forget, id(frame))),
+            fingerprint,
+        )
+        return fingerprint
+
+    @classmethod
+    def _forget(cls, key: int, reference: weakref.ref) -> None:
+        # The id may already belong to a newer frame
+        if cls._fingerprints.get(key, (None,))[0] is reference:
+            del cls._fingerprints[key]
+
+    @classmethod
+    def fingerprint(cls, x: pd.DataFrame, y: pd.DataFrame) -> str:
+        return cls._frame_fingerprint(x) + cls._frame_fingerprint(y)
+
+    @classmethod
+    def get(
+        cls,
+        x: pd.DataFrame,
+        y: pd.DataFrame,
+        max_bin: int,
+        reference: Optional[Tuple[pd.DataFrame, pd.DataFrame]] = None,
+    ) -> xgboost.QuantileDMatrix:
+        """
+        Return the quantized matrix of (x, y). Evaluation matrices pass the training
+        data as reference, so that they share its cuts.
+        """
+        key = (cls.fingerprint(x, y), str(max_bin))
+        ref = None
+        if reference is not None:
+            ref = cls.get(*reference, max_bin=max_bin)
+            key += (cls.fingerprint(*reference),)
+        matrix = cls._matrices.get(key)
+        if matrix is None:
+            matrix = xgboost.QuantileDMatrix(
+                x, y, max_bin=max_bin, ref=ref, enable_categorical=True
+            )
+            cls._matrices[key] = matrix
+        return matrix
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._matrices.clear()
+        cls._fingerprints.clear()
+
+
+class BoosterRegressor:
+    """
+    Regressor trained through the native booster API on cached quantized matrices. It
+    accepts the parameters of xgboost.XGBRegressor and exposes the same fit and predict.
+    """
+
+    def __init__(
+        self,
+        n_estimators: int = 100,
+        max_bin: int = 256,
+        early_stopping_rounds: Optional[int] = None,
+        callbacks: Optional[List[xgboost.callback.TrainingCallback]] = None,
+        **params,
+    ) -> None:
+        self.n_estimators = n_estimators
+        self.max_bin = max_bin
+        self.early_stopping_rounds = early_stopping_rounds
+        self.callbacks = callbacks
+        self.params = {NATIVE_PARAMETERS.get(key, key): value for key, value in params.items()}
+        self.booster = None
+
+    def fit(self, x: pd.DataFrame, y: pd.DataFrame, eval_set: Optional[list] = None, verbose: bool = False) -> "BoosterRegressor":
+        evals = [
+            (DMatrixCache.get(x_eval, y_eval, self.max_bin, reference=(x, y)), f"validation_{i}")
+            for i, (x_eval, y_eval) in enumerate(eval_set or [])
+        ]
+        self.booster = xgboost.train(
+            {**self.params, "max_bin": self.max_bin},
+            DMatrixCache.get(x, y, self.max_bin),
+            num_boost_round=self.n_estimators,
+            evals=evals,
+            early_stopping_rounds=self.early_stopping_rounds if evals else None,
+            callbacks=self.callbacks,
+            verbose_eval=verbose,
+        )
+        # Callbacks may hold the Optuna trial, they are not part of the fitted model
+        self.callbacks = None
+        return self
+
+    def predict(self, x) -> np.ndarray:
+        iteration_range = (0, 0)
+        if self.early_stopping_rounds is not None and "best_iteration" in self.booster.attributes():
+            iteration_range = (0, self.booster.best_iteration + 1)
+        return self.booster.inplace_predict(x, iteration_range=iteration_range)
@@ -0,0 +1,62 @@
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+class FakeArtifact:
+    """
+    Stand-in for a ModelArtifact, named after its epoch folder, predicting a constant price.
+    """
+
+    # Set to make loading slow, as the one of a real model
+    load_delay = 0.0
+
+    def __init__(self, folder: Path, logger=None, price: float = 0.0) -> None:
+        time.sleep(self.load_delay)
+        self.epoch = Path(folder).name
+        self.price = price
+
+    def predict(self, payloads, timer=None) -> np.ndarray:
+        return np.full((len(payloads), 1), self.price)
+
+
+@pytest.fixture
+def fake_artifact(monkeypatch):
+    monkeypatch.setattr(FakeArtifact, "load_delay", 0.0)
+    return FakeArtifact
+
+
+class FakeRegistry:
+    def __init__(self, artifact) -> None:
+        self.artifact = artifact
+
+    def select(self):
+        return self.artifact
+
+
+@pytest.fixture
+def client(tmp_path, fake_artifact):
+    """
+    Test client of the application, serving a fake model without deploying a real one.
+    """
+    from src.deploy.app import app
+    from src.deploy.database import InteractionDatabase
+    from src.deploy.model_deploy import ModelDeploy
+
+    deployer = ModelDeploy.__new__(ModelDeploy)
+    deployer.logger = logging.getLogger(__name__)
+    deployer.cache = None
+    deployer.coalescer = None
+    deployer.registry = FakeRegistry(fake_artifact(Path("1000")))
+    app.config.update(
+        model_deployer=deployer,
+        interaction_db=InteractionDatabase(db_path=tmp_path.joinpath("interactions.db")),
+        metrics=None,
+        max_batch_size=3,
+        request_timeout=None,
+        admin_token=None,
+    )
+    return app.test_client()
@@ -0,0 +1,38 @@
+import numpy as np
+
+DIAMOND = {"carat": 0.3, "cut": "Ideal", "color": "E", "clarity": "SI1", "depth": 61.5, "table": 55, "x": 4.3, "y": 4.3, "z": 2.6}
+
+
+def test_batch_is_predicted_in_one_pass_in_request_order(client, monkeypatch):
+    artifact = client.application.config["model_deployer"].registry.artifact
+    batches = []
+
+    def predict(payloads, timer=None):
+        batches.append(len(payloads))
+        return np.array([[1000 * payload["carat"]] for payload in payloads])
+
+    monkeypatch.setattr(artifact, "predict", predict)
+    diamonds = [dict(DIAMOND, carat=carat) for carat in (0.5, 0.25, 1.0)]
+    response = client.post("/predictprice/batch", json={"diamonds": diamonds})
+    assert response.status_code == 200
+    assert response.json == {"predictions": [500.0, 250.0, 1000.0]}
+    assert batches == [3]
+
+
+def test_oversized_batch_is_rejected_without_echoing_it(client):
+    response = client.post("/predictprice/batch", json={"diamonds": [DIAMOND] * 4})
+    assert response.status_code == 400
+    [error] = response.json["error"]
+    assert error["type"] == "too_long"
+    assert error["ctx"] == {"size": 4, "max_size": 3}
+    assert "input" not in error
+
+
+def test_invalid_diamond_is_reported_with_its_position(client):
+    response = client.post("/predictprice/batch", json={"diamonds": [DIAMOND, dict(DIAMOND, carat=-1)]})
+    assert response.status_code == 400
+    assert response.json["error"][0]["loc"] == ["diamonds", 1, "carat"]
+
+
+def test_empty_batch_is_rejected(client):
+    assert client.post("/predictprice/batch", json={"diamonds": []}).status_code == 400
@@ -0,0 +1,73 @@
+import logging
+from pathlib import Path
+
+import pytest
+
+from src.deploy import cache as cache_module
+from src.deploy.cache import PredictionCache
+from src.deploy.model_deploy import ModelDeploy
+from tests.conftest import FakeRegistry
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PredictionCache(max_size=10, ttl=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert cache.get_or_compute("key", compute) == 1
+    clock.now += 59
+    assert cache.get_or_compute("key", compute) == 1
+    clock.now += 2
+    assert cache.get_or_compute("key", compute) == 2
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = PredictionCache(max_size=2, ttl=60)
+    cache.get_or_compute("a", lambda: "a")
+    cache.get_or_compute("b", lambda: "b")
+    cache.get_or_compute("a", lambda: "recomputed")
+    cache.get_or_compute("c", lambda: "c")
+    assert cache.get_or_compute("a", lambda: "recomputed") == "a"
+    assert cache.get_or_compute("b", lambda: "recomputed") == "recomputed"
+    assert cache.stats()["evictions"] == 2
+
+
+def test_payload_key_is_canonical():
+    assert PredictionCache.key("/predictprice", "1", {"carat": 1, "cut": "Ideal"}) == PredictionCache.key(
+        "/predictprice", "1", {"cut": "Ideal", "carat": 1}
+    )
+
+
+def test_a_new_epoch_never_serves_the_cached_responses_of_the_previous_one(fake_artifact):
+    deployer = ModelDeploy.__new__(ModelDeploy)
+    deployer.logger = logging.getLogger(__name__)
+    deployer.cache = PredictionCache(max_size=10, ttl=60)
+    deployer.coalescer = None
+    deployer.registry = FakeRegistry(fake_artifact(Path("1"), price=100.0))
+    payload = {"carat": 1.0}
+    assert deployer.predict_price(dict(payload))["prediction"] == [[100.0]]
+    deployer.registry.artifact = fake_artifact(Path("2"), price=200.0)
+    assert deployer.predict_price(dict(payload))["prediction"] == [[200.0]]
+    deployer.registry.artifact = fake_artifact(Path("1"), price=300.0)
+    # The first epoch's response is still cached under its own key
+    assert deployer.predict_price(dict(payload))["prediction"] == [[100.0]]
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+import numpy as np
+import pytest
+
+from src.deploy.coalescer import PredictionCoalescer
+
+
+class EchoModel:
+    """
+    Predicts the carat of each diamond plus an offset, remembering the size of each batch.
+    """
+
+    def __init__(self, offset: float) -> None:
+        self.offset = offset
+        self.batch_sizes = []
+
+    def predict(self, payloads):
+        self.batch_sizes.append(len(payloads))
+        return np.array([[payload["carat"] + self.offset] for payload in payloads])
+
+
+class FailingModel:
+    def predict(self, payloads):
+        raise ValueError("Prediction failed")
+
+
+@pytest.fixture
+def coalescer():
+    return PredictionCoalescer(max_wait=0.05, max_batch_size=16, logger=logging.getLogger(__name__))
+
+
+def test_each_caller_gets_its_own_prediction(coalescer):
+    model = EchoModel(offset=0)
+    carats = [round(0.01 * i, 2) for i in range(1, 65)]
+    with ThreadPoolExecutor(max_workers=len(carats)) as executor:
+        results = list(executor.map(lambda carat: coalescer.predict({"carat": carat}, model), carats))
+    for carat, result in zip(carats, results):
+        assert result.shape == (1, 1)
+        assert result[0, 0] == carat
+    # Requests were actually gathered, within the batch size limit
+    assert len(model.batch_sizes) < len(carats)
+    assert max(model.batch_sizes) <= 16
+    assert coalescer.stats()["requests"] == len(carats)
+
+
+def test_requests_of_different_models_are_predicted_apart(coalescer):
+    models = [EchoModel(offset=0), EchoModel(offset=1000)]
+    requests = [(round(0.01 * i, 2), models[i % 2]) for i in range(1, 33)]
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        results = list(executor.map(lambda request: coalescer.predict({"carat": request[0]}, request[1]), requests))
+    for (carat, model), result in zip(requests, results):
+        assert result[0, 0] == carat + model.offset
+
+
+def test_a_failing_model_fails_only_its_callers(coalescer):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        failing = executor.submit(coalescer.predict, {"carat": 1.0}, FailingModel())
+        working = executor.submit(coalescer.predict, {"carat": 1.0}, EchoModel(offset=0))
+        with pytest.raises(ValueError, match="Prediction failed"):
+            failing.result()
+        assert working.result()[0, 0] == 1.0
+
+
+class SlowModel(EchoModel):
+    def __init__(self, delay: float) -> None:
+        super().__init__(offset=0)
+        self.delay = delay
+
+    def predict(self, payloads):
+        time.sleep(self.delay)
+        return super().predict(payloads)
+
+
+def test_requests_past_their_deadline_are_dropped_from_the_batch():
+    coalescer = PredictionCoalescer(max_wait=0.0, max_batch_size=1, logger=logging.getLogger(__name__))
+    model = SlowModel(delay=0.2)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # The first request holds the batcher, the second one waits in the queue
+        first = executor.submit(coalescer.predict, {"carat": 1.0}, model)
+        time.sleep(0.05)
+        with pytest.raises(TimeoutError, match="deadline exceeded"):
+            coalescer.predict({"carat": 2.0}, model, deadline=time.monotonic() + 0.05)
+        assert first.result()[0, 0] == 1.0
+    assert coalescer.predict({"carat": 3.0}, model, deadline=time.monotonic() + 5)[0, 0] == 3.0
+    # The expired request was never predicted
+    assert model.batch_sizes == [1, 1]
+    assert coalescer.stats()["timeouts"] == 1
+
+
+def test_prediction_route_answers_504_past_the_deadline(client):
+    deployer = client.application.config["model_deployer"]
+    deployer.coalescer = PredictionCoalescer(max_wait=0.0, max_batch_size=1, logger=logging.getLogger(__name__))
+    deployer.registry.artifact = SlowModel(delay=0.3)
+    deployer.registry.artifact.epoch = "1000"
+    client.application.config["request_timeout"] = 0.05
+    diamond = {"carat": 0.3, "cut": "Ideal", "color": "E", "clarity": "SI1", "depth": 61.5, "table": 55, "x": 4.3, "y": 4.3, "z": 2.6}
+    response = client.post("/predictprice", json=diamond)
+    assert response.status_code == 504
+    assert response.json == {"error": "Prediction deadline exceeded"}
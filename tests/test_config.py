@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+from src.utils.config import ConfigParser, Configuration
+
+CONFIG_FOLDER = Path(__file__).parent.parent.joinpath("config")
+
+
+@pytest.fixture
+def configuration():
+    return ConfigParser.retrieve_config(CONFIG_FOLDER.joinpath("xgb.json"))
+
+
+@pytest.mark.parametrize("config_file", ["default.json", "xgb.json"])
+def test_shipped_configurations_are_valid(config_file):
+    ConfigParser.load(CONFIG_FOLDER.joinpath(config_file))
+
+
+def test_missing_keys_are_all_reported(configuration):
+    del configuration["deploy"]["batch"]
+    del configuration["data"]["cache"]["enabled"]
+    with pytest.raises(ValueError) as error:
+        Configuration(configuration)
+    assert "['data', 'cache', 'enabled']" in str(error.value)
+    assert "['deploy', 'batch', 'maxSize']" in str(error.value)
+
+
+def test_values_outside_the_allowed_ones_are_rejected(configuration):
+    configuration["deploy"]["interactions"]["writer"]["policy"] = "wait"
+    with pytest.raises(ValueError, match=r"'wait', expected one of \['drop', 'block'\]"):
+        Configuration(configuration)
+
+
+def test_categorical_columns_need_their_categories(configuration):
+    del configuration["data"]["schema"]["categories"]["cut"]
+    with pytest.raises(ValueError, match="Categorical column cut has no categories"):
+        Configuration(configuration)
+
+
+def test_validation_can_be_skipped_for_older_snapshots(configuration):
+    del configuration["deploy"]["batch"]
+    assert "batch" not in Configuration(configuration, validate=False)["deploy"]
+
+
+def test_loaded_configurations_are_read_only_and_shared(tmp_path, configuration):
+    path = tmp_path.joinpath("config.json")
+    path.write_text(CONFIG_FOLDER.joinpath("xgb.json").read_text())
+    loaded = ConfigParser.load(path)
+    assert ConfigParser.load(path) is loaded
+    with pytest.raises(TypeError):
+        loaded["data"]["name"] = "other"
+    assert loaded.to_dict() == configuration
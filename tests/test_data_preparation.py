@@ -0,0 +1,79 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pandas.testing
+import pytest
+
+from src.model.data_preparation import DataPreparation
+from src.utils.config import ConfigParser, Configuration
+from src.utils.load_config import LoadUtils
+
+ROOT = Path(__file__).parent.parent
+
+
+def preparation(config_file: str, source: Path, cache: bool = False) -> DataPreparation:
+    configuration = ConfigParser.retrieve_config(ROOT.joinpath("config", config_file))
+    configuration["data"]["source"] = {**configuration["data"]["source"], "getLocal": True, "localPath": str(source)}
+    configuration["data"]["streaming"] = {"enabled": True, "chunkSize": 50}
+    configuration["data"]["cache"]["enabled"] = cache
+    for plot in ["scatter_matrix", "hist", "categorical"]:
+        configuration["data"]["exploration"][plot]["enabled"] = False
+    return DataPreparation(
+        config_file=None, logger=logging.getLogger(__name__), configuration=Configuration(configuration)
+    )
+
+
+@pytest.fixture
+def source(tmp_path):
+    dataset = pd.read_csv(ROOT.joinpath("data", "diamonds.csv"), nrows=300)
+    dataset.loc[5, "x"] = 0
+    dataset.loc[60, "price"] = -1
+    dataset.loc[120, "carat"] = np.nan
+    # Duplicates within a chunk and across chunks
+    dataset = pd.concat([dataset, dataset.iloc[[0, 1, 2, 70, 71]], dataset.iloc[[3, 3]]], ignore_index=True)
+    path = tmp_path.joinpath("diamonds.csv")
+    dataset.to_csv(path, index=False)
+    return path
+
+
+@pytest.mark.parametrize("config_file", ["default.json", "xgb.json"])
+def test_streaming_cleaning_matches_in_memory_cleaning(config_file, source, tmp_path):
+    data = preparation(config_file, source)
+    in_memory = data._data_cleaning(data.get_dataset())
+    streamed = data._stream_cleaning(tmp_path.joinpath("cleaned.parquet"))
+    assert len(streamed) == 300 - 3
+    pandas.testing.assert_frame_equal(streamed, in_memory)
+
+
+def test_streaming_without_cache_leaves_no_file_behind(source, tmp_path):
+    data = preparation("xgb.json", source)
+    data.model_epoch_folder = tmp_path.joinpath("epoch")
+    data.model_epoch_folder.mkdir()
+    dataset = data._get_prepared_dataset()
+    assert len(dataset) == 300 - 3
+    assert list(data.model_epoch_folder.iterdir()) == []
+
+
+def test_streaming_an_empty_source_is_a_clear_error(tmp_path, monkeypatch):
+    data = preparation("xgb.json", tmp_path.joinpath("diamonds.csv"))
+    monkeypatch.setattr(LoadUtils, "load_chunks", lambda **kwargs: iter([]))
+    with pytest.raises(ValueError, match="No data could be read"):
+        data._stream_cleaning(tmp_path.joinpath("cleaned.parquet"))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_grades_are_normalized_and_unknown_ones_counted(tmp_path, caplog):
+    dataset = pd.read_csv(ROOT.joinpath("data", "diamonds.csv"), nrows=6)
+    dataset["cut"] = [" ideal", "PREMIUM ", "Very good", "Ideal", "Idael", None]
+    path = tmp_path.joinpath("diamonds.csv")
+    dataset.to_csv(path, index=False)
+    data = preparation("xgb.json", path)
+
+    with caplog.at_level(logging.WARNING):
+        raw = data.get_dataset()
+
+    assert list(raw["cut"].astype(object)) == ["Ideal", "Premium", "Very Good", "Ideal", np.nan, np.nan]
+    assert list(raw["cut"].cat.categories) == ["Fair", "Good", "Very Good", "Ideal", "Premium"]
+    assert "1 rows have grades outside the schema categories" in caplog.text
@@ -0,0 +1,129 @@
+import json
+import logging
+import sqlite3
+from datetime import datetime
+
+import pytest
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request, Response
+
+from src.deploy.database import InteractionDatabase
+
+
+def interaction(carat: float) -> tuple:
+    payload = {"carat": carat, "cut": "Ideal", "color": "E", "clarity": "SI1"}
+    request = Request(EnvironBuilder(method="POST", path="/predictprice", json=payload).get_environ())
+    response = Response(json.dumps({**payload, "prediction": [[1000 * carat]]}), mimetype="application/json")
+    return request, response
+
+
+def stored_carats(db_path) -> list:
+    with sqlite3.connect(db_path) as conn:
+        return [row[0] for row in conn.execute("SELECT carat FROM interactions ORDER BY id")]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path.joinpath("interactions.db")
+
+
+def test_close_flushes_every_queued_interaction(db_path):
+    database = InteractionDatabase(
+        db_path=db_path, asynchronous=True, batch_size=7, flush_interval=10, logger=logging.getLogger(__name__)
+    )
+    carats = [0.1 * i for i in range(1, 51)]
+    for carat in carats:
+        database.log_interaction(*interaction(carat))
+    # The flush interval is too long for anything to be written before the shutdown
+    database.close()
+    assert stored_carats(db_path) == pytest.approx(carats)
+    assert database.get_interactions(limit=1)[0]["response_body"]["prediction"] == [[100.0]]
+
+
+def test_full_queue_drops_interactions(db_path):
+    database = InteractionDatabase(
+        db_path=db_path, asynchronous=True, queue_size=2, policy="drop", logger=logging.getLogger(__name__)
+    )
+    # Without its writer thread, nothing takes interactions off the queue
+    database._ensure_writer = lambda: None
+    for carat in [1.0, 2.0, 3.0, 4.0, 5.0]:
+        database.log_interaction(*interaction(carat))
+    assert database.dropped == 3
+    del database._ensure_writer
+    database._ensure_writer()
+    database.close()
+    assert stored_carats(db_path) == [1.0, 2.0]
+
+
+def test_synchronous_writes_are_immediate(db_path):
+    database = InteractionDatabase(db_path=db_path, asynchronous=False)
+    database.log_interaction(*interaction(1.5))
+    assert stored_carats(db_path) == [1.5]
+
+
+def test_keyset_pages_cover_every_matching_interaction_once(db_path):
+    database = InteractionDatabase(db_path=db_path)
+    for carat in [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5]:
+        database.log_interaction(*interaction(carat))
+    database.log_interaction(
+        Request(EnvironBuilder(method="GET", path="/interactions").get_environ()), Response("{}")
+    )
+    pages, after_id = [], 0
+    while page := database.get_interactions(after_id=after_id, limit=3, path="/predictprice"):
+        pages.append([row["request_body"]["carat"] for row in page])
+        after_id = page[-1]["id"]
+    assert pages == [[0.5, 1.0, 1.5], [2.0, 2.5, 3.0], [3.5]]
+    streamed = database.iter_interactions(path="/predictprice", status=200, chunk_size=2)
+    assert [row["request_body"]["carat"] for row in streamed] == [0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5]
+
+
+def test_interactions_route_returns_the_next_cursor(client):
+    for carat in [0.5, 1.0, 1.5]:
+        client.application.config["interaction_db"].log_interaction(*interaction(carat))
+    first = client.get("/interactions?limit=2&path=/predictprice").json
+    assert [row["request_body"]["carat"] for row in first["interactions"]] == [0.5, 1.0]
+    second = client.get(f"/interactions?limit=2&path=/predictprice&after_id={first['next_after_id']}").json
+    assert [row["request_body"]["carat"] for row in second["interactions"]] == [1.5]
+    assert second["next_after_id"] is None
+    lines = client.get("/interactions?format=ndjson&path=/predictprice").get_data(as_text=True).splitlines()
+    assert [json.loads(line)["carat"] for line in lines] == [0.5, 1.0, 1.5]
+
+
+def test_compressed_bodies_are_decoded_on_read(db_path):
+    database = InteractionDatabase(db_path=db_path, compression="zlib", compact=True, header_allowlist=["Content-Type"])
+    database.log_interaction(*interaction(1.5))
+    with sqlite3.connect(db_path) as conn:
+        body, encoding = conn.execute("SELECT request_body, body_encoding FROM interactions").fetchone()
+    assert isinstance(body, bytes) and encoding == "zlib"
+    [row] = database.get_interactions()
+    assert row["request_body"]["carat"] == 1.5
+    assert row["request_headers"] == {"Content-Type": "application/json"}
+
+
+def test_retention_archives_old_interactions_by_column_name(db_path, tmp_path):
+    archive_folder = tmp_path.joinpath("archive")
+    retention = {"enabled": True, "maxAgeDays": 30, "maxSizeMb": None, "checkInterval": 0}
+    database = InteractionDatabase(db_path=db_path, retention=retention, archive_folder=archive_folder)
+    database.retention = None
+    for carat in [1.0, 2.0, 3.0]:
+        database.log_interaction(*interaction(carat))
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE interactions SET timestamp = '2000-01-01T00:00:00' WHERE carat < 3")
+    # An archive left by an older schema, with its columns in another order
+    archive_folder.mkdir()
+    archive_path = archive_folder.joinpath(f"interactions_{datetime.utcnow():%Y%m%d}.db")
+    with sqlite3.connect(archive_path) as conn:
+        conn.execute(
+            "CREATE TABLE interactions (response_body, id INTEGER PRIMARY KEY, timestamp, request_method, request_path,"
+            " request_headers, request_body, response_status, response_headers)"
+        )
+
+    database.retention = retention
+    with sqlite3.connect(db_path) as conn:
+        database.apply_retention(conn)
+
+    assert stored_carats(db_path) == [3.0]
+    with sqlite3.connect(archive_path) as conn:
+        rows = conn.execute("SELECT id, request_path, carat, response_body FROM interactions ORDER BY id").fetchall()
+    assert [row[:3] for row in rows] == [(1, "/predictprice", 1.0), (2, "/predictprice", 2.0)]
+    assert json.loads(rows[0][3])["prediction"] == [[1000.0]]
@@ -0,0 +1,98 @@
+import logging
+from pathlib import Path
+
+import pandas as pd
+import pandas.testing
+import pytest
+
+from src.utils.config import ConfigParser, Configuration
+from src.utils.dataset_cache import DatasetCache
+
+CONFIG_FILE = Path(__file__).parent.parent.joinpath("config", "xgb.json")
+
+
+def cache(folder: Path, enabled: bool = True, **changes) -> DatasetCache:
+    configuration = ConfigParser.retrieve_config(CONFIG_FILE)
+    configuration["data"]["cache"]["enabled"] = enabled
+    for subtree, (key, value) in changes.items():
+        configuration["data"][subtree][key] = value
+    return DatasetCache(Configuration(configuration), logging.getLogger(__name__), folder=folder)
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path.joinpath("diamonds.csv")
+    path.write_text("carat,cut,price\n1.1,Ideal,4733\n")
+    return path
+
+
+def test_entries_are_keyed_by_source_content(tmp_path, source):
+    dataset_cache = cache(tmp_path)
+    fingerprint = dataset_cache.source_fingerprint(True, source)
+    assert dataset_cache.source_fingerprint(True, source) == fingerprint
+    source.write_text("carat,cut,price\n1.2,Ideal,4733\n")
+    changed = dataset_cache.source_fingerprint(True, source)
+    assert changed != fingerprint
+    assert dataset_cache.path("raw", changed) != dataset_cache.path("raw", fingerprint)
+
+
+def test_stages_are_invalidated_by_the_configuration_they_depend_on(tmp_path, source):
+    dataset_cache = cache(tmp_path)
+    cleaning = cache(tmp_path, cleaning=("dropDuplicates", False))
+    processing = cache(tmp_path, processing=("dropColumnsPostExploration", {"enabled": True, "columns": ["depth"]}))
+    fingerprint = dataset_cache.source_fingerprint(True, source)
+
+    def changed(other: DatasetCache) -> dict:
+        return {
+            stage: other.path(stage, fingerprint) != dataset_cache.path(stage, fingerprint)
+            for stage in ["raw", "cleaned", "processed"]
+        }
+
+    assert changed(cleaning) == {"raw": False, "cleaned": True, "processed": True}
+    assert changed(processing) == {"raw": False, "cleaned": False, "processed": True}
+
+
+def test_saved_frames_are_loaded_back(tmp_path, source):
+    dataset_cache = cache(tmp_path)
+    fingerprint = dataset_cache.source_fingerprint(True, source)
+    dataset = pd.DataFrame({"carat": [1.1, 0.3], "cut": pd.Categorical(["Ideal", "Fair"])}, index=[4, 9])
+    assert dataset_cache.load("cleaned", fingerprint) is None
+    dataset_cache.save("cleaned", fingerprint, dataset)
+    pandas.testing.assert_frame_equal(dataset_cache.load("cleaned", fingerprint), dataset)
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_unreadable_entries_are_misses(tmp_path, source):
+    dataset_cache = cache(tmp_path)
+    fingerprint = dataset_cache.source_fingerprint(True, source)
+    dataset_cache.path("raw", fingerprint).write_bytes(b"not parquet")
+    assert dataset_cache.load("raw", fingerprint) is None
+
+
+def test_disabled_cache_neither_reads_nor_writes(tmp_path, source):
+    dataset_cache = cache(tmp_path.joinpath("cache"), enabled=False)
+    fingerprint = dataset_cache.source_fingerprint(True, source)
+    assert fingerprint is None
+    dataset_cache.save("raw", fingerprint, pd.DataFrame({"carat": [1.0]}))
+    assert dataset_cache.load("raw", fingerprint) is None
+    assert not tmp_path.joinpath("cache").exists()
+
+
+def test_remote_sources_are_keyed_by_their_validators(tmp_path, monkeypatch):
+    import requests
+
+    class Head:
+        def __init__(self, headers):
+            self.headers = headers
+
+        def raise_for_status(self):
+            pass
+
+    headers = {"ETag": '"v1"'}
+    monkeypatch.setattr(requests, "head", lambda *args, **kwargs: Head(headers))
+    dataset_cache = cache(tmp_path)
+    first = dataset_cache.source_fingerprint(False, "https://example.com/diamonds.csv")
+    headers["ETag"] = '"v2"'
+    assert dataset_cache.source_fingerprint(False, "https://example.com/diamonds.csv") not in (first, None)
+    headers.clear()
+    assert dataset_cache.source_fingerprint(False, "https://example.com/diamonds.csv") is None
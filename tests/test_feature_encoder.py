@@ -0,0 +1,62 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.model.data_preparation import DataPreparation
+from src.model.feature_encoder import FeatureEncoder
+from src.utils.config import ConfigParser
+from src.utils.server import ServerUtils
+
+CONFIG_FOLDER = Path(__file__).parent.parent.joinpath("config")
+DATA_FILE = Path(__file__).parent.parent.joinpath("data", "diamonds.csv")
+
+
+def _pipeline_features(preparation: DataPreparation, payloads: list) -> pd.DataFrame:
+    # Same steps as ModelArtifact.encode for the epochs without an encoder
+    data = ServerUtils.parse_batch_payload(payloads)
+    target = preparation.configuration.target
+    data[target] = 42
+    features = preparation.data_preparation(dataset=data, exploration=False, cleaning=False)
+    return features.drop(columns=target)
+
+
+@pytest.mark.parametrize("config_file", ["default.json", "xgb.json"])
+def test_encoder_matches_the_data_preparation_pipeline(config_file):
+    configuration = ConfigParser.load(CONFIG_FOLDER.joinpath(config_file))
+    preparation = DataPreparation(
+        config_file=CONFIG_FOLDER.joinpath(config_file),
+        logger=logging.getLogger(__name__),
+        configuration=configuration,
+    )
+    payloads = (
+        pd.read_csv(DATA_FILE, nrows=50).drop(columns="price").to_dict(orient="records")
+    )
+    # Unknown grades become all-zero dummies or missing ordered codes on both paths
+    payloads.append(dict(payloads[0], cut="Unknown", color="Z", clarity="XX"))
+
+    expected = _pipeline_features(preparation, payloads)
+    encoder = FeatureEncoder.from_configuration(configuration, list(expected.columns))
+    expected = expected.apply(
+        lambda column: column.cat.codes.replace(-1, np.nan)
+        if isinstance(column.dtype, pd.CategoricalDtype)
+        else column
+    ).to_numpy(dtype=np.float64)
+
+    np.testing.assert_array_equal(encoder.transform(payloads), expected)
+
+
+def test_encoder_survives_a_save_and_load_round_trip(tmp_path):
+    encoder = FeatureEncoder(
+        columns=["carat", "cut", "color_E"],
+        dummies={"color": ["D", "E"]},
+        ordered={"cut": ["Fair", "Good"]},
+        dropped=["depth"],
+    )
+    encoder.save(tmp_path.joinpath("encoder.json"))
+    loaded = FeatureEncoder.load(tmp_path.joinpath("encoder.json"))
+    payloads = [{"carat": 0.5, "cut": "Good", "color": "E"}, {"carat": 1.0, "cut": "Fair", "color": "D"}]
+    assert loaded.to_dict() == encoder.to_dict()
+    np.testing.assert_array_equal(loaded.transform(payloads), [[0.5, 1, 1], [1.0, 0, 0]])
@@ -0,0 +1,66 @@
+import json
+import logging
+import subprocess
+
+from src.deploy.cache import PredictionCache
+from src.deploy.metrics import RequestMetrics
+
+
+def metrics(shared_folder=None) -> RequestMetrics:
+    return RequestMetrics(
+        slow_threshold=None, slow_sample_size=10, logger=logging.getLogger(__name__), shared_folder=shared_folder
+    )
+
+
+def samples(rendered: str) -> dict:
+    return {
+        line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+        for line in rendered.splitlines()
+        if line and not line.startswith("#")
+    }
+
+
+def test_component_statistics_are_rendered_as_prometheus_metrics():
+    cache = PredictionCache(max_size=1, ttl=60)
+    cache.get_or_compute("a", lambda: 1)
+    cache.get_or_compute("a", lambda: 1)
+    cache.get_or_compute("b", lambda: 2)
+    request_metrics = metrics()
+    request_metrics.add_component("cache", cache.stats)
+    request_metrics.add_component(
+        "coalescer",
+        lambda: {"queue_depth": 2, "batches": 4, "requests": 10, "total_wait_ms": 1500.0,
+                 "timeouts": 1, "max_batch_size": 5, "max_wait_ms": 250.0},
+    )
+    rendered = request_metrics.render()
+    assert "# TYPE diamonds_api_cache_hits_total counter" in rendered
+    assert "# TYPE diamonds_api_coalescer_queue_depth gauge" in rendered
+    values = samples(rendered)
+    assert values["diamonds_api_cache_entries"] == 1
+    assert values["diamonds_api_cache_hits_total"] == 1
+    assert values["diamonds_api_cache_misses_total"] == 2
+    assert values["diamonds_api_cache_evictions_total"] == 1
+    assert values["diamonds_api_coalescer_wait_seconds_total"] == 1.5
+    assert values["diamonds_api_coalescer_max_wait_seconds"] == 0.25
+
+
+def test_workers_are_merged_with_the_gauges_of_live_ones_only(tmp_path):
+    exited = subprocess.Popen(["true"])
+    exited.wait()
+    stats = {"queue_depth": 3, "batches": 2, "requests": 6, "total_wait_ms": 10.0,
+             "timeouts": 0, "max_batch_size": 4, "max_wait_ms": 9.0}
+    tmp_path.joinpath(f"{exited.pid}_deadbeef.json").write_text(json.dumps({
+        "requests": [["POST", "/predictprice", "200", 6]], "durations": [], "stages": [],
+        "components": {"coalescer": stats},
+    }))
+    request_metrics = metrics(shared_folder=tmp_path)
+    request_metrics.add_component("coalescer", lambda: {**stats, "max_batch_size": 2, "max_wait_ms": 12.0})
+    request_metrics.observe("POST", "/predictprice", 200, 0.01, {})
+
+    values = samples(request_metrics.render())
+
+    assert values['diamonds_api_requests_total{method="POST",route="/predictprice",status="200"}'] == 7
+    assert values["diamonds_api_coalescer_batches_total"] == 4
+    assert values["diamonds_api_coalescer_queue_depth"] == 3
+    assert values["diamonds_api_coalescer_max_batch_size"] == 4
+    assert values["diamonds_api_coalescer_max_wait_seconds"] == 0.012
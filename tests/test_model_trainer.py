@@ -0,0 +1,38 @@
+import json
+import logging
+
+import pytest
+
+from src.model import data_preparation
+from src.model.model_trainer import ModelTrainer
+from src.utils.config import ConfigParser
+from tests.test_data_preparation import ROOT
+
+
+@pytest.fixture
+def config_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_preparation, "TRAIN_FOLDER", tmp_path.joinpath("train"))
+    configuration = ConfigParser.retrieve_config(ROOT.joinpath("config", "xgb.json"))
+    configuration["data"]["cache"]["enabled"] = False
+    for plot in ["scatter_matrix", "hist", "categorical"]:
+        configuration["data"]["exploration"][plot]["enabled"] = False
+    configuration["model"]["profiling"]["enabled"] = True
+    path = tmp_path.joinpath("config.json")
+    path.write_text(json.dumps(configuration))
+    return path
+
+
+def test_data_preparation_is_part_of_the_profiled_run(config_file, monkeypatch):
+    trainer = ModelTrainer(config_file=config_file, logger=logging.getLogger(__name__))
+    assert not hasattr(trainer, "x_train")
+
+    def fail():
+        raise RuntimeError("Training failed")
+
+    monkeypatch.setattr(trainer, "_train", fail)
+    with pytest.raises(RuntimeError, match="Training failed"):
+        trainer.run()
+
+    profile = json.loads(trainer.model_epoch_folder.joinpath("profile.json").read_text())
+    assert {"load", "clean", "process", "split"} <= set(profile["phases"])
+    assert "fit" not in profile["phases"]
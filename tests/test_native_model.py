@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from src.model.native_model import NativeModelUtils
+
+
+@pytest.fixture
+def training_data():
+    rng = np.random.default_rng(42)
+    x = pd.DataFrame(rng.uniform(0, 5, size=(200, 4)), columns=["carat", "x", "y", "z"])
+    y = pd.DataFrame({"price": x @ [3000.0, 10.0, -20.0, 5.0] + rng.normal(0, 10, 200)})
+    return x, y
+
+
+def native_prediction(model, model_type, folder, x):
+    NativeModelUtils.export(model, model_type, folder, booster_format="ubj")
+    return NativeModelUtils.load(folder, model_type).predict(x.to_numpy())
+
+
+@pytest.mark.parametrize("target", ["frame", "series"])
+def test_linear_export_predicts_as_the_pickle(training_data, tmp_path, target):
+    x, y = training_data
+    model = LinearRegression().fit(x, y if target == "frame" else y["price"])
+    expected = model.predict(x)
+    prediction = native_prediction(model, "linear_regression", tmp_path, x)
+    assert prediction.shape == expected.shape
+    np.testing.assert_allclose(prediction, expected, rtol=1e-12)
+
+
+def test_booster_export_predicts_as_the_pickle(training_data, tmp_path):
+    xgboost = pytest.importorskip("xgboost")
+    x, y = training_data
+    model = xgboost.XGBRegressor(n_estimators=20, max_depth=3).fit(x, y)
+    expected = model.predict(x)
+    prediction = native_prediction(model, "xgb_regression", tmp_path, x)
+    assert prediction.shape == expected.shape
+    np.testing.assert_array_equal(prediction, expected)
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pandas.testing
+
+from src.utils.config import ConfigParser
+from src.utils.optuna_objective import OptunaUtils
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_tuning_target_is_the_prepared_training_target():
+    configuration = ConfigParser.load(ROOT.joinpath("config", "xgb.json"))
+    target = configuration.target
+    dataset = pd.read_csv(ROOT.joinpath("data", "diamonds.csv"), nrows=200)
+    # The prepared target is the log-transformed price, all within a few units of each other
+    y_train = np.log(dataset[target])
+    x_train = dataset.drop(columns=target).astype(
+        {"cut": "category", "color": "category", "clarity": "category"}
+    )
+
+    x_fit, x_valid, y_fit, y_valid = OptunaUtils.prepare_data(x_train, y_train, target, 0.2, 42)
+
+    assert list(y_fit.columns) == target
+    pandas.testing.assert_frame_equal(pd.concat([y_fit, y_valid]).sort_index(), y_train)
+    assert list(x_fit.index) == list(y_fit.index) and list(x_valid.index) == list(y_valid.index)
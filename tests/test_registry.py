@@ -0,0 +1,78 @@
+import json
+import logging
+import random
+import threading
+import time
+
+import pytest
+
+from src.deploy import registry as registry_module
+from src.deploy.registry import ModelRegistry
+
+EPOCHS = ["1000", "2000", "3000"]
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch, fake_artifact):
+    monkeypatch.setattr(registry_module, "ModelArtifact", fake_artifact)
+    for epoch in EPOCHS:
+        tmp_path.joinpath(epoch).mkdir()
+        tmp_path.joinpath(epoch, "config.json").write_text(json.dumps({"evaluation": {"metrics": {}}}))
+    return tmp_path
+
+
+def create_registry(folder, poll_interval=3600):
+    registry = ModelRegistry(folder, max_resident=2, poll_interval=poll_interval, logger=logging.getLogger(__name__))
+    registry.activate(EPOCHS[0])
+    return registry
+
+
+def test_candidate_serves_its_share_of_the_traffic(folder):
+    registry = create_registry(folder)
+    registry.set_candidate(EPOCHS[1], 30)
+    random.seed(0)
+    selected = [registry.select().epoch for _ in range(10000)]
+    assert selected.count(EPOCHS[1]) / len(selected) == pytest.approx(0.3, abs=0.02)
+    assert set(selected) == {EPOCHS[0], EPOCHS[1]}
+    registry.set_candidate(None, 0)
+    assert {registry.select().epoch for _ in range(100)} == {EPOCHS[0]}
+
+
+def test_invalid_epoch_leaves_the_models_unchanged(folder):
+    registry = create_registry(folder)
+    registry.set_candidate(EPOCHS[1], 10)
+    state = registry.state_path.read_text()
+    for epoch in ["missing", "../1000", ""]:
+        with pytest.raises(FileNotFoundError):
+            registry.activate(epoch)
+        with pytest.raises(FileNotFoundError):
+            registry.set_candidate(epoch, 50)
+    status = registry.status()
+    assert (status["active"], status["candidate"], status["candidate_percent"]) == (EPOCHS[0], EPOCHS[1], 10)
+    assert registry.state_path.read_text() == state
+
+
+def test_only_max_resident_models_stay_loaded(folder):
+    registry = create_registry(folder)
+    for epoch in EPOCHS:
+        registry.activate(epoch)
+    resident = {epoch["epoch"] for epoch in registry.status()["epochs"] if epoch["resident"]}
+    assert resident == {EPOCHS[1], EPOCHS[2]}
+
+
+def test_swaps_of_another_worker_are_loaded_off_the_request_path(folder, monkeypatch, fake_artifact):
+    worker = create_registry(folder, poll_interval=0)
+    other_worker = create_registry(folder, poll_interval=0)
+    # The swap is saved in the state file with a different modification time
+    time.sleep(0.01)
+    monkeypatch.setattr(fake_artifact, "load_delay", 0.5)
+    other_worker._models.clear()
+    threading.Thread(target=other_worker.activate, args=(EPOCHS[2],)).start()
+    while not worker.state_path.exists() or json.loads(worker.state_path.read_text())["active"] != EPOCHS[2]:
+        time.sleep(0.01)
+
+    start_time = time.perf_counter()
+    assert worker.select().epoch == EPOCHS[0]
+    assert time.perf_counter() - start_time < 0.25
+    worker._loader.join()
+    assert worker.select().epoch == EPOCHS[2]
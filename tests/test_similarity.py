@@ -0,0 +1,91 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from src.deploy.similarity import GRADE_COLUMNS, NUMERIC_COLUMNS, CaratIndex, NeighbourIndex
+
+GRADES = {
+    "cut": ["Fair", "Good", "Ideal"],
+    "color": ["D", "E", "F"],
+    "clarity": ["IF", "SI1", "I1"],
+}
+
+
+def _dataset(rows: int = 300, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    dataset = pd.DataFrame({
+        column: rng.choice(categories, size=rows) for column, categories in GRADES.items()
+    })
+    for column in ["carat", "depth", "table", "x", "y", "z"]:
+        dataset[column] = rng.uniform(0.2, 5.0, size=rows).round(2)
+    dataset["price"] = rng.integers(300, 20000, size=rows)
+    return dataset
+
+
+def test_carat_index_matches_a_full_scan():
+    dataset = _dataset()
+    index = CaratIndex(dataset)
+    same_grades = dataset[
+        (dataset["cut"] == "Ideal") & (dataset["color"] == "E") & (dataset["clarity"] == "SI1")
+    ]
+    expected = (same_grades["carat"] - 1.3).abs().sort_values(kind="stable")
+
+    positions, distances = index.query(" ideal", "e", "SI1 ", carat=1.3, n=5)
+
+    np.testing.assert_allclose(distances, expected.to_numpy()[:5])
+    assert set(dataset.index[positions]) <= set(same_grades.index)
+    np.testing.assert_allclose((dataset["carat"].iloc[positions] - 1.3).abs(), distances)
+
+
+def test_carat_index_returns_every_match_when_fewer_than_requested():
+    dataset = _dataset(rows=30)
+    index = CaratIndex(dataset)
+    count = int(((dataset["cut"] == "Fair") & (dataset["color"] == "D") & (dataset["clarity"] == "IF")).sum())
+    positions, _ = index.query("Fair", "D", "IF", carat=1.0, n=count + 10)
+    assert len(positions) == count
+
+
+def test_carat_index_answers_unknown_grades_with_no_match():
+    positions, distances = CaratIndex(_dataset()).query("Unknown", "E", "SI1", carat=1.0, n=5)
+    assert len(positions) == len(distances) == 0
+
+
+def _weighted_scan(dataset, payload, weights, filters):
+    numeric = dataset[NUMERIC_COLUMNS].to_numpy(dtype=np.float64)
+    std = np.nanstd(numeric, axis=0)
+    scale = np.array([weights[column] for column in NUMERIC_COLUMNS]) / std
+    squared = (((numeric - np.array([payload[c] for c in NUMERIC_COLUMNS])) * scale) ** 2).sum(axis=1)
+    mask = np.ones(len(dataset), dtype=bool)
+    for column in GRADE_COLUMNS:
+        ranks = {category: rank / (len(GRADES[column]) - 1) for rank, category in enumerate(GRADES[column])}
+        if column in filters:
+            mask &= (dataset[column] == payload[column]).to_numpy()
+        else:
+            ordinals = dataset[column].map(ranks).to_numpy(dtype=np.float64)
+            squared += ((ordinals - ranks[payload[column]]) * weights[column]) ** 2
+    return np.sort(np.sqrt(squared[mask]))
+
+
+def test_neighbour_index_matches_a_full_scan_for_every_filter_combination():
+    dataset = _dataset()
+    weights = {column: 1.0 for column in NUMERIC_COLUMNS + GRADE_COLUMNS}
+    weights["carat"] = 3.0
+    index = NeighbourIndex(dataset, weights, GRADES)
+    payload = dict(dataset.iloc[7].drop("price"))
+    for size in range(len(GRADE_COLUMNS) + 1):
+        for filters in itertools.combinations(GRADE_COLUMNS, size):
+            _, distances = index.query(payload, n=5, filters=list(filters))
+            expected = _weighted_scan(dataset, payload, weights, filters)[:5]
+            np.testing.assert_allclose(distances, expected, atol=1e-9)
+
+
+def test_neighbour_index_builds_every_partition_before_serving(monkeypatch):
+    index = NeighbourIndex(_dataset(), {column: 1.0 for column in NUMERIC_COLUMNS}, GRADES)
+    assert len(index._partitions) == 2 ** len(GRADE_COLUMNS)
+
+    def build(filters):
+        raise AssertionError(f"Partitions of {filters} built on the request path")
+
+    monkeypatch.setattr(index, "_build_partitions", build)
+    index.query(dict(_dataset().iloc[0]), n=3, filters=["cut"])
@@ -0,0 +1,61 @@
+import gc
+import os
+import threading
+import weakref
+
+import pytest
+
+from src.utils.files import FileUtils
+from src.utils.fork import ForkSafeLock, ForkUtils
+
+
+def test_atomic_write_replaces_the_file_only_on_success(tmp_path):
+    path = tmp_path.joinpath("state.json")
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with FileUtils.atomic_write(path) as temporary_path:
+            temporary_path.write_text("partial")
+            raise RuntimeError("Write failed")
+    assert path.read_text() == "old"
+    with FileUtils.atomic_write(path) as temporary_path:
+        temporary_path.write_text("new")
+        assert path.read_text() == "old"
+    assert path.read_text() == "new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Requires fork")
+def test_a_lock_held_by_another_thread_is_free_in_a_forked_child():
+    lock = ForkSafeLock()
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with lock:
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if lock.acquire(timeout=1) else 1)
+        _, status = os.waitpid(pid, 0)
+    finally:
+        release.set()
+        thread.join()
+    assert os.waitstatus_to_exitcode(status) == 0
+
+
+def test_fork_handlers_do_not_keep_their_object_alive():
+    class Resettable:
+        def reset(self):
+            pass
+
+    resettable = Resettable()
+    ForkUtils.after_fork_in_child(resettable.reset)
+    reference = weakref.ref(resettable)
+    del resettable
+    gc.collect()
+    assert reference() is None
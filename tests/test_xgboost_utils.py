@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils import xgboost_utils
+from src.utils.xgboost_utils import DMatrixCache
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(0)
+    x = pd.DataFrame({"carat": rng.uniform(0.2, 3, 100), "depth": rng.uniform(55, 70, 100)})
+    y = pd.DataFrame({"price": rng.uniform(5, 10, 100)})
+    yield x, y
+    DMatrixCache.clear()
+
+
+def test_every_frame_is_hashed_once(frames, monkeypatch):
+    x, y = frames
+    hashed = []
+    hash_pandas_object = pd.util.hash_pandas_object
+
+    def counting(frame, **kwargs):
+        hashed.append(id(frame))
+        return hash_pandas_object(frame, **kwargs)
+
+    monkeypatch.setattr(xgboost_utils.pd.util, "hash_pandas_object", counting)
+    x_valid, y_valid = x.iloc[:20], y.iloc[:20]
+    for _ in range(3):
+        train = DMatrixCache.get(x, y, max_bin=16)
+        valid = DMatrixCache.get(x_valid, y_valid, max_bin=16, reference=(x, y))
+    assert sorted(hashed) == sorted(map(id, [x, y, x_valid, y_valid]))
+    assert DMatrixCache.get(x, y, max_bin=16) is train
+    assert DMatrixCache.get(x_valid, y_valid, max_bin=16, reference=(x, y)) is valid
+
+
+def test_equal_content_shares_the_matrix_and_bins_do_not(frames):
+    x, y = frames
+    matrix = DMatrixCache.get(x, y, max_bin=16)
+    assert DMatrixCache.get(x.copy(), y.copy(), max_bin=16) is matrix
+    assert DMatrixCache.get(x, y, max_bin=32) is not matrix